@@ -17,16 +17,35 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import shapely.prepared
+
+import limits
 
 class Zone:
     """
     A Zone objects describes an aerial zone.
     The meta attribute contains meta data (name, class, ceiling/floor).
+    The fingerprint attribute identifies the OpenAir records the
+    zone was built from (None if unknown).
     The Zone class has geointerface.
     """
-    def __init__(self, meta, geometry):
+    def __init__(self, meta, geometry, fingerprint=None):
         self.meta = meta
         self.geometry = geometry
+        self.fingerprint = fingerprint
+        self.limits = limits.VerticalLimits(meta)
+        self._prepared = None
+
+    @property
+    def prepared(self):
+        """
+        Prepared geometry (shapely.prepared), created on first use.
+        To be used for predicates (intersects, contains...) tested
+        many times against the same zone.
+        """
+        if self._prepared is None:
+            self._prepared = shapely.prepared.prep(self.geometry)
+        return self._prepared
 
     @property
     def __geo_interface__(self):
@@ -17,15 +17,82 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
+import sys
+import math
+import time
+import hashlib
+import select
+import socket
 import urllib2
+import httplib
+import urlparse
+import threading
+import multiprocessing.pool
 import error
+import elevstore
 import subprocess
-import ossim
+import collections
+
+import numpy
+
+try:
+    import ossim
+except ImportError:
+    # only needed by OssimResolverWrapper (see setup.py)
+    ossim = None
 
 class AltiResolver:
+    def getGroundLevelsAt(self, lons, lats):
+        """
+        Returns the array of the ground levels at the points given
+        by the 'lons' and 'lats' sequences, NaN where unknown.
+        To be implemented by resolvers.
+        """
+        raise NotImplementedError()
+
     def getGroundLevelAt(self, lat, lon):
+        return self.getGroundLevelsAt([lon], [lat])[0]
+
+    def flush(self):
+        """
+        Writes what the resolver may keep for later. Nothing to do
+        by default.
+        """
+        pass
+
+    def prefetch(self, lons, lats):
+        """
+        Tells that the ground levels of the given points will soon
+        be needed (see PrefetchingResolver). Nothing to do by
+        default.
+        """
         pass
 
+    def source(self):
+        """
+        Returns a string identifying the data the levels come from
+        (the key of the levels in an elevstore.ElevationStore), or
+        None if they must not be stored.
+        """
+        return None
+
+def filesIdentity(paths):
+    """
+    Returns a digest of the names, sizes and modification times of
+    the files 'paths', changing when the data they hold is replaced.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        st = os.stat(path)
+        digest.update("%s %d %d\n" % (os.path.basename(path), st.st_size,
+                                       int(st.st_mtime)))
+    return digest.hexdigest()[:16]
+
+def ossimSource(ossim_config):
+    # the elevation data of ossim is only known through its config
+    return "ossim %s %s" % (os.path.abspath(ossim_config), filesIdentity([ossim_config]))
+
 OSSIM_HEIGHT_EXEC="/usr/bin/ossim-height"
 
 import random
@@ -39,19 +106,25 @@ class RandomResolver(AltiResolver):
         self.var = var
         self._last = amin
 
-    def getGroundLevelAt(self, lon, lat):
-        self._last += random.randint(-self.var, self.var)
-        if self._last > self.amin:
-            self._last = self.amin
-        elif self._last > self.amax:
-            self._last = self.amax
-        return self._last
+    def getGroundLevelsAt(self, lons, lats):
+        levels = numpy.empty(len(lons))
+        for i in xrange(len(lons)):
+            self._last += random.randint(-self.var, self.var)
+            if self._last < self.amin:
+                self._last = self.amin
+            elif self._last > self.amax:
+                self._last = self.amax
+            levels[i] = self._last
+        return levels
 
 class OssimResolverProcess(AltiResolver):
     def __init__(self, ossim_config):
         self.config = ossim_config
 
-    def getGroundLevelAt(self, lon, lat):
+    def source(self):
+        return ossimSource(self.config)
+
+    def getHeight(self, lon, lat):
         args = [OSSIM_HEIGHT_EXEC,
                 "-P", self.config,
                 str(lat), str(lon)]
@@ -60,28 +133,239 @@ class OssimResolverProcess(AltiResolver):
         for l in p.stdout.xreadlines():
             if l.startswith("Height above MSL:"):
                 return float(l.strip().split(':')[1].strip())
+        return numpy.nan
+
+    def getGroundLevelsAt(self, lons, lats):
+        # one process per point
+        return numpy.array([self.getHeight(lon, lat) for lon, lat in zip(lons, lats)],
+                           dtype=float)
 
 class OssimResolverWrapper(AltiResolver):
     def __init__(self, ossim_config):
+        if ossim is None:
+            raise error.ASCException("The ossim extension is not installed")
         self.config = ossim_config
         ossim.init(self.config)
 
-    def getGroundLevelAt(self, lat, lon):
-        r = ossim.height(lat,lon)
-        if r:
-            return r[0]
-        else:
-            return None
+    def source(self):
+        return ossimSource(self.config)
+
+    def getGroundLevelsAt(self, lons, lats):
+        lats = [float(lat) for lat in lats]
+        lons = [float(lon) for lon in lons]
+        if hasattr(ossim, 'heights'):
+            return numpy.array(ossim.heights(lats, lons), dtype=float)
+
+        # extension built before heights() was added
+        levels = numpy.empty(len(lons))
+        for i in xrange(len(lons)):
+            r = ossim.height(lats[i], lons[i])
+            levels[i] = r[0] if r else numpy.nan
+        return levels
+
+OSSIM_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ossimworker.py")
+OSSIM_WORKERS = 1
+# max number of points per request to a worker
+OSSIM_WORKER_BATCH = 2000
+# seconds to wait for a worker answer (or its start)
+OSSIM_WORKER_TIMEOUT = 60
+
+class OssimWorkerResolver(AltiResolver):
+    """
+    Asks the ground levels to 'workers' long lived ossim processes
+    (see ossimworker.py), started once and fed batches of points over
+    pipes, instead of a process per point as OssimResolverProcess.
+    The batches of a call are spread over the workers. A worker is
+    checked (ping) when started and after a failure; a worker that
+    died or did not answer within 'timeout' seconds is restarted and
+    its batch sent again, up to 'retries' times. 'command' replaces
+    the worker command line if given.
+    """
+    def __init__(self, ossim_config, workers=OSSIM_WORKERS, command=None,
+                 batch=OSSIM_WORKER_BATCH, timeout=OSSIM_WORKER_TIMEOUT, retries=2):
+        self.config = ossim_config
+        self.command = command or [sys.executable, OSSIM_WORKER, ossim_config]
+        self.workers = workers
+        self.batch = batch
+        self.timeout = timeout
+        self.retries = retries
+
+        self._procs = []
+        self._buffers = []
+        self._pid = None
+        self.started = 0
+        self.restarted = 0
+        self.requests = 0
+
+    def __str__(self):
+        return "%d worker(s) started, %d restarted, %d request(s)" % (
+            self.started, self.restarted, self.requests)
+
+    def source(self):
+        return ossimSource(self.config)
+
+    def _kill(self, i):
+        # the worker is restarted on next use
+        proc = self._procs[i]
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def _stop(self, i):
+        self._kill(i)
+        self._procs[i] = None
+
+    def _start(self, i):
+        self._stop(i)
+        try:
+            proc = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE, close_fds=True)
+        except OSError, e:
+            raise error.ASCException("Could not start ossim worker %s: %s" %
+                                     (" ".join(self.command), e))
+        self._procs[i] = proc
+        self._buffers[i] = ""
+        self.started += 1
+        # waits for the elevation database to be opened
+        if not self.ping(i):
+            self._stop(i)
+            raise error.ASCException("ossim worker %s did not start" % " ".join(self.command))
+
+    def _send(self, i, line):
+        self._procs[i].stdin.write(line + "\n")
+        self._procs[i].stdin.flush()
+
+    def _readLine(self, i):
+        proc = self._procs[i]
+        fd = proc.stdout.fileno()
+        deadline = time.time() + self.timeout
+        while "\n" not in self._buffers[i]:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise error.ASCException("ossim worker timed out")
+            data = os.read(fd, 1 << 16)
+            if not data:
+                raise error.ASCException("ossim worker exited (%s)" % proc.poll())
+            self._buffers[i] += data
+        line, self._buffers[i] = self._buffers[i].split("\n", 1)
+        return line
+
+    def ping(self, i):
+        """
+        Health check of the worker 'i': returns True if it answers.
+        """
+        try:
+            self._send(i, "ping")
+            return self._readLine(i) == "pong"
+        except (IOError, OSError, error.ASCException):
+            return False
+
+    def _worker(self, i):
+        # workers are not shared with forked processes (batch workers)
+        if self._pid != os.getpid():
+            self._procs = [None] * self.workers
+            self._buffers = [""] * self.workers
+            self._pid = os.getpid()
+        proc = self._procs[i]
+        if proc is None or proc.poll() is not None:
+            if proc is not None:
+                self.restarted += 1
+            self._start(i)
+        return i
+
+    def check(self):
+        """
+        Health check of all the workers: starts the missing ones and
+        restarts the ones that died or do not answer.
+        """
+        for i in xrange(self.workers):
+            self._worker(i)
+            if not self.ping(i):
+                self.restarted += 1
+                self._start(i)
+
+    def _ask(self, jobs, lons, lats, levels):
+        # sends a batch to each worker, then reads the answers.
+        # Returns the batches that failed.
+        sent = []
+        failed = []
+        for i, (start, stop) in enumerate(jobs):
+            coords = []
+            for lat, lon in zip(lats[start:stop], lons[start:stop]):
+                coords += [repr(float(lat)), repr(float(lon))]
+            try:
+                self._send(self._worker(i), "heights " + " ".join(coords))
+                self.requests += 1
+                sent.append((i, start, stop))
+            except (IOError, OSError):
+                self._kill(i)
+                failed.append((start, stop))
+
+        for i, start, stop in sent:
+            try:
+                answer = self._readLine(i).split()
+            except error.ASCException:
+                self._kill(i)
+                failed.append((start, stop))
+                continue
+            if not answer or answer[0] != "ok" or len(answer) != stop - start + 1:
+                raise error.ASCException("ossim worker error: %s" % " ".join(answer))
+            levels[start:stop] = [float(v) for v in answer[1:]]
+        return failed
+
+    def getGroundLevelsAt(self, lons, lats):
+        levels = numpy.empty(len(lons))
+        jobs = [(start, min(start + self.batch, len(lons)))
+                for start in xrange(0, len(lons), self.batch)]
+        attempt = 0
+        while jobs:
+            failed = []
+            for n in xrange(0, len(jobs), self.workers):
+                failed += self._ask(jobs[n:n + self.workers], lons, lats, levels)
+            if failed:
+                if attempt >= self.retries:
+                    raise error.ASCException("ossim workers failed %d time(s)" %
+                                             (attempt + 1))
+                self.check()
+            jobs = failed
+            attempt += 1
+        return levels
+
+    def close(self):
+        """
+        Stops the workers.
+        """
+        if self._pid != os.getpid():
+            return
+        for i, proc in enumerate(self._procs):
+            if proc is not None and proc.poll() is None:
+                try:
+                    self._send(i, "quit")
+                    proc.stdin.close()
+                    proc.wait()
+                except (IOError, OSError):
+                    self._stop(i)
+            self._procs[i] = None
 
 VALID_GN_SRC=("gtopo30", "astergdem")
 
+# max number of points in a single GeoNames request
+GEONAMES_BATCH = 20
+
+# value returned by GeoNames for the sea
+GEONAMES_NODATA = -9999
+
+GEONAMES_URL = "http://ws.geonames.org/"
+
 class GeoNamesResolver(AltiResolver):
-    def __init__(self, datasource="astergdem", debug=False, unit="meter"):
+    def __init__(self, datasource="astergdem", debug=False, unit="meter",
+                 url=GEONAMES_URL):
         """
         Valid values for datasource are:
          * gtopo30
          * astergdem : uses gdem data (should be 1° precise, ~30m)
         unit can be foot or meter (default)
+        url is the base URL of the web services.
         """
         if datasource not in VALID_GN_SRC:
             raise error.ASCException()
@@ -89,22 +373,773 @@ class GeoNamesResolver(AltiResolver):
         self.unit = unit
         self.debug = debug
         self.datasource = datasource
+        self.url = url
+
+    def source(self):
+        return "geonames %s %s %s" % (self.url, self.datasource, self.unit)
+
+    def requestPath(self, datasource, lons, lats):
+        """
+        Returns the path of the request (relative to 'url') for the
+        ground levels of the given points.
+        """
+        return "%s?lats=%s&lngs=%s" % (datasource,
+                                       ",".join(["%f" % lat for lat in lats]),
+                                       ",".join(["%f" % lon for lon in lons]))
 
-    def sendRequestForGroundLevel(self, datasource, lon, lat):
-        url = "http://ws.geonames.org/%s?lat=%f&lng=%f" % (datasource,
-                                                           lat, lon)
+    def parseGroundLevels(self, content, count):
+        """
+        Returns the array of the 'count' levels of the GeoNames
+        answer 'content'.
+        """
         # this is very basic as a check that it is ok.
-        # if the http get fails, we should not get a valid float : error raised
-        val_meters = float(urllib2.urlopen(url).read().strip())
+        # if the http get fails, we should not get valid floats : error raised
+        vals_meters = [float(v) for v in content.split()]
+        if len(vals_meters) != count:
+            raise error.ASCException("GeoNames gave %d values for %d points" %
+                                     (len(vals_meters), count))
+
+        vals = numpy.array(vals_meters, dtype=float)
+        # sea level
+        vals[vals == GEONAMES_NODATA] = 0.
         if self.unit == "foot":
-            val = float(val_meters / 0.30480)
+            vals /= 0.30480
+        return vals
+
+    def sendRequestForGroundLevels(self, datasource, lons, lats):
+        """
+        Asks GeoNames for the ground levels of up to GEONAMES_BATCH
+        points at once.
+        """
+        url = self.url + self.requestPath(datasource, lons, lats)
+        return self.parseGroundLevels(urllib2.urlopen(url).read(), len(lons))
+
+    def getGroundLevelsAt(self, lons, lats):
+        levels = numpy.empty(len(lons))
+        for start in xrange(0, len(lons), GEONAMES_BATCH):
+            stop = start + GEONAMES_BATCH
+            levels[start:stop] = self.sendRequestForGroundLevels(self.datasource,
+                                                                 lons[start:stop],
+                                                                 lats[start:stop])
+            if self.debug:
+                for ds in VALID_GN_SRC:
+                    print "[%s]=" % ds, self.sendRequestForGroundLevels(ds, lons[start:stop],
+                                                                        lats[start:stop])
+        return levels
+
+GEONAMES_CONNECTIONS = 4
+GEONAMES_RETRIES = 3
+# delay (seconds) before the first retry, doubled for each other one
+GEONAMES_BACKOFF = 0.5
+
+class _Lookup:
+    """
+    Ground level of a point being asked to GeoNames, that other
+    callers can wait for.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.level = None
+        self.error = None
+
+class ConcurrentGeoNamesResolver(GeoNamesResolver):
+    """
+    GeoNamesResolver sending up to 'connections' requests at a time,
+    each thread keeping its HTTP connection alive between requests.
+    Failed requests (network errors, HTTP 5xx) are retried up to
+    'retries' times, after 'backoff' seconds then twice as long each
+    time. Points already being asked (by the same call or by another
+    thread) are not asked again: their callers share the answer.
+    """
+    def __init__(self, datasource="astergdem", debug=False, unit="meter",
+                 url=GEONAMES_URL, connections=GEONAMES_CONNECTIONS,
+                 retries=GEONAMES_RETRIES, backoff=GEONAMES_BACKOFF, timeout=30):
+        GeoNamesResolver.__init__(self, datasource, debug, unit, url)
+        self.connections = connections
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._pool = None
+        self._pid = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+        self.requests = 0
+        self.retried = 0
+        self.coalesced = 0
+
+    def __str__(self):
+        return "%d request(s), %d retried, %d point(s) coalesced" % (
+            self.requests, self.retried, self.coalesced)
+
+    def _count(self, counter):
+        # counters are updated by the pool threads
+        self._lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self._lock.release()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            url = urlparse.urlparse(self.url)
+            conn = httplib.HTTPConnection(url.hostname, url.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _closeConnection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def sendRequestForGroundLevels(self, datasource, lons, lats):
+        path = urlparse.urlparse(self.url).path + self.requestPath(datasource, lons, lats)
+        attempt = 0
+        while True:
+            self._count('requests')
+            try:
+                conn = self._connection()
+                conn.request("GET", path, headers={'Connection': 'keep-alive'})
+                response = conn.getresponse()
+                content = response.read()
+                if response.status >= 500:
+                    raise httplib.HTTPException("HTTP error %d" % response.status)
+                if response.status != 200:
+                    raise error.ASCException("GeoNames answered HTTP %d" % response.status)
+                return self.parseGroundLevels(content, len(lons))
+            except (httplib.HTTPException, socket.error), e:
+                self._closeConnection()
+                if attempt >= self.retries:
+                    raise error.ASCException("GeoNames request failed: %s" % e)
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                self._count('retried')
+
+    def _resolveBatch(self, datasource, keys, lookups):
+        # runs in the pool threads
+        try:
+            levels = self.sendRequestForGroundLevels(datasource, [k[1] for k in keys],
+                                                     [k[2] for k in keys])
+        except Exception, e:
+            for lookup in lookups:
+                lookup.error = e
         else:
-            val = float(val_meters)
-        return val
-        
-    def getGroundLevelAt(self, lon, lat):
-        ret = self.sendRequestForGroundLevel(self.datasource, lon, lat)
+            for lookup, level in zip(lookups, levels):
+                lookup.level = level
+
+        self._lock.acquire()
+        try:
+            for key, lookup in zip(keys, lookups):
+                self._inflight.pop(key, None)
+                lookup.done.set()
+        finally:
+            self._lock.release()
+
+    def resolve(self, datasource, lons, lats):
+        """
+        Returns the array of the ground levels of the points from
+        'datasource', asking the ones not already being asked in
+        concurrent requests of GEONAMES_BATCH points.
+        """
+        # points are identified by their coordinates as sent
+        keys = [(datasource, float("%f" % lon), float("%f" % lat))
+                for lon, lat in zip(lons, lats)]
+        mine = []
+        waited = {}
+        self._lock.acquire()
+        try:
+            # threads are not inherited by forked processes (batch workers)
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = multiprocessing.pool.ThreadPool(self.connections)
+                self._pid = os.getpid()
+                self._local = threading.local()
+                self._inflight = {}
+
+            for key in keys:
+                if key in waited:
+                    continue
+                lookup = self._inflight.get(key)
+                if lookup is None:
+                    lookup = _Lookup()
+                    self._inflight[key] = lookup
+                    mine.append(key)
+                waited[key] = lookup
+            self.coalesced += len(keys) - len(mine)
+        finally:
+            self._lock.release()
+
+        for start in xrange(0, len(mine), GEONAMES_BATCH):
+            batch = mine[start:start + GEONAMES_BATCH]
+            self._pool.apply_async(self._resolveBatch,
+                                   (datasource, batch, [waited[k] for k in batch]))
+
+        levels = numpy.empty(len(keys))
+        for i, key in enumerate(keys):
+            lookup = waited[key]
+            # a timeout keeps the wait interruptible
+            while not lookup.done.wait(1):
+                pass
+            if lookup.error is not None:
+                raise error.ASCException("No ground level for %s: %s" % (key, lookup.error))
+            levels[i] = lookup.level
+        return levels
+
+    def getGroundLevelsAt(self, lons, lats):
+        levels = self.resolve(self.datasource, lons, lats)
         if self.debug:
             for ds in VALID_GN_SRC:
-                print "[%s]=" %ds, self.sendRequestForGroundLevel(ds, lon, lat)
-        return ret
+                print "[%s]=" % ds, self.resolve(ds, lons, lats)
+        return levels
+
+    def close(self):
+        """
+        Stops the threads sending the requests.
+        """
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+# value of the voids in SRTM data
+HGT_VOID = -32768
+
+def hgtTileName(lat0, lon0):
+    """
+    Returns the name of the SRTM tile whose south west corner is
+    at (lat0, lon0), eg. N45E006.hgt.
+    """
+    return "%s%02d%s%03d.hgt" % ('N' if lat0 >= 0 else 'S', abs(lat0),
+                                 'E' if lon0 >= 0 else 'W', abs(lon0))
+
+class HgtResolver(AltiResolver):
+    """
+    Reads the ground levels from SRTM .hgt tiles found in 'directory'
+    (1 or 3 arc second, 1 degree tiles of big endian int16, north to
+    south rows). Tiles are opened on demand as memory maps, at most
+    'max_tiles' at a time (least recently used ones are closed).
+    Levels are interpolated bilinearly. Voids and missing tiles
+    give 'missing' (NaN by default).
+    """
+    def __init__(self, directory, max_tiles=16, missing=numpy.nan):
+        self.directory = directory
+        self.max_tiles = max_tiles
+        self.missing = missing
+        self.tiles = collections.OrderedDict()
+        self.opened = 0
+
+    def source(self):
+        # SRTM1 and SRTM3 tiles have the same names, not the same size
+        paths = []
+        if os.path.isdir(self.directory):
+            paths = [os.path.join(self.directory, n) for n in os.listdir(self.directory)
+                     if n.lower().endswith(".hgt")]
+        return "hgt %s %s" % (os.path.abspath(self.directory), filesIdentity(paths))
+
+    def _findTile(self, name):
+        for n in (name, name.lower()):
+            path = os.path.join(self.directory, n)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def getTile(self, lat0, lon0):
+        """
+        Returns the memory map of the tile at (lat0, lon0), or None
+        if there is no such tile.
+        """
+        key = (lat0, lon0)
+        if key in self.tiles:
+            tile = self.tiles.pop(key)
+            self.tiles[key] = tile
+            return tile
+
+        tile = None
+        path = self._findTile(hgtTileName(lat0, lon0))
+        if path is not None:
+            size = int(round(math.sqrt(os.path.getsize(path) / 2)))
+            if size * size * 2 != os.path.getsize(path):
+                raise error.ASCException("%s is not a SRTM tile" % path)
+            tile = numpy.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+            self.opened += 1
+
+        self.tiles[key] = tile
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def _interpolate(self, tile, lat0, lon0, lons, lats):
+        last = tile.shape[0] - 1
+        x = (lons - lon0) * last
+        y = (lat0 + 1 - lats) * last
+        col = numpy.clip(numpy.floor(x).astype(int), 0, last - 1)
+        row = numpy.clip(numpy.floor(y).astype(int), 0, last - 1)
+        dx = x - col
+        dy = y - row
+
+        corners = [tile[row, col], tile[row, col + 1],
+                   tile[row + 1, col], tile[row + 1, col + 1]]
+        corners = [c.astype(float) for c in corners]
+        for c in corners:
+            c[c == HGT_VOID] = numpy.nan
+
+        top = corners[0] * (1 - dx) + corners[1] * dx
+        bottom = corners[2] * (1 - dx) + corners[3] * dx
+        levels = top * (1 - dy) + bottom * dy
+        levels[numpy.isnan(levels)] = self.missing
+        return levels
+
+    def levelRange(self, minlon, minlat, maxlon, maxlat):
+        """
+        Returns the (lowest, highest) levels of the samples covering
+        the bounding box, bounding any interpolated level in it, or
+        None if a tile is missing or there are voids.
+        """
+        lows = []
+        highs = []
+        lat_start, lon_start = int(math.floor(minlat)), int(math.floor(minlon))
+        for lat0 in xrange(lat_start, max(int(math.ceil(maxlat)), lat_start + 1)):
+            for lon0 in xrange(lon_start, max(int(math.ceil(maxlon)), lon_start + 1)):
+                tile = self.getTile(lat0, lon0)
+                if tile is None:
+                    return None
+                last = tile.shape[0] - 1
+                col0 = int(math.floor((max(minlon, lon0) - lon0) * last))
+                col1 = int(math.ceil((min(maxlon, lon0 + 1) - lon0) * last))
+                row0 = int(math.floor((lat0 + 1 - min(maxlat, lat0 + 1)) * last))
+                row1 = int(math.ceil((lat0 + 1 - max(minlat, lat0)) * last))
+                samples = tile[max(row0, 0):row1 + 1, max(col0, 0):col1 + 1]
+                if (samples == HGT_VOID).any():
+                    return None
+                lows.append(samples.min())
+                highs.append(samples.max())
+        return (float(min(lows)), float(max(highs)))
+
+    def getGroundLevelsAt(self, lons, lats):
+        lons = numpy.asarray(lons, dtype=float)
+        lats = numpy.asarray(lats, dtype=float)
+        levels = numpy.empty(len(lons))
+        levels.fill(self.missing)
+
+        lat0s = numpy.floor(lats).astype(int)
+        lon0s = numpy.floor(lons).astype(int)
+        keys, inverse = numpy.unique(lat0s * 1000 + lon0s, return_inverse=True)
+        for k in xrange(len(keys)):
+            idx = (inverse == k).nonzero()[0]
+            lat0, lon0 = lat0s[idx[0]], lon0s[idx[0]]
+            tile = self.getTile(lat0, lon0)
+            if tile is not None:
+                levels[idx] = self._interpolate(tile, lat0, lon0, lons[idx], lats[idx])
+        return levels
+
+# default grid of CachingResolver (degrees): the 3 arc second
+# resolution of SRTM3/ASTER tiles
+CACHE_GRID = 1 / 1200.
+CACHE_SIZE = 100000
+
+def quantize(lons, lats, grid):
+    """
+    Returns the (cols, rows) integer arrays of the cells of a grid
+    of 'grid' degrees the points are in. The cell (col, row) is
+    centered on (col * grid, row * grid).
+    """
+    return (numpy.round(numpy.asarray(lons, dtype=float) / grid).astype(int),
+            numpy.round(numpy.asarray(lats, dtype=float) / grid).astype(int))
+
+class CachingResolver(AltiResolver):
+    """
+    Wraps the AltiResolver 'resolver', remembering the last
+    'max_size' ground levels it gave. Points are snapped to a grid
+    of 'grid' degrees and the wrapped resolver is only asked for the
+    centers of the cells that are not cached yet, so that points
+    falling in the same cell share a single level.
+    """
+    def __init__(self, resolver, grid=CACHE_GRID, max_size=CACHE_SIZE):
+        self.resolver = resolver
+        self.grid = grid
+        self.max_size = max_size
+        self.cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __str__(self):
+        return "%d hit(s), %d miss(es), %d eviction(s), %d cached cell(s)" % (
+            self.hits, self.misses, self.evictions, len(self.cache))
+
+    def getGroundLevelsAt(self, lons, lats):
+        cols, rows = quantize(lons, lats, self.grid)
+        levels = numpy.empty(len(cols))
+
+        missing = collections.OrderedDict()
+        for i, key in enumerate(zip(cols, rows)):
+            level = self.cache.pop(key, None)
+            if level is None:
+                missing.setdefault(key, []).append(i)
+                continue
+            self.cache[key] = level
+            levels[i] = level
+
+        if missing:
+            keys = missing.keys()
+            found = self.resolver.getGroundLevelsAt([c * self.grid for c, r in keys],
+                                                    [r * self.grid for c, r in keys])
+            for key, level in zip(keys, found):
+                levels[missing[key]] = level
+                self.cache[key] = level
+
+        self.misses += len(missing)
+        self.hits += len(cols) - len(missing)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return levels
+
+    def flush(self):
+        self.resolver.flush()
+
+    def source(self):
+        return self.resolver.source()
+
+# number of new levels kept in memory by StoredResolver before they
+# are written to the store
+STORE_FLUSH = 10000
+
+class StoredResolver(AltiResolver):
+    """
+    Wraps the AltiResolver 'resolver' with the persistent
+    elevstore.ElevationStore 'store': levels are read from the store
+    first, the wrapped resolver is only asked for the centers of the
+    cells missing from it. New levels are written to the store by
+    flush(), automatically once 'flush_size' of them are pending.
+    Unknown (NaN) levels are not stored.
+    """
+    def __init__(self, resolver, store, flush_size=STORE_FLUSH):
+        self.resolver = resolver
+        self.store = store
+        self.flush_size = flush_size
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self):
+        return "%d hit(s), %d miss(es) in %s" % (self.hits, self.misses, self.store.path)
+
+    def _resolve(self, keys):
+        grid = self.store.grid
+        levels = self.resolver.getGroundLevelsAt([c * grid for c, r in keys],
+                                                 [r * grid for c, r in keys])
+        found = {}
+        for key, level in zip(keys, levels):
+            found[key] = level
+            if not numpy.isnan(level):
+                self.pending[key] = level
+        return found
+
+    def getGroundLevelsAt(self, lons, lats):
+        cols, rows = quantize(lons, lats, self.store.grid)
+        keys = zip(cols, rows)
+
+        found = {}
+        for key in keys:
+            if key in self.pending:
+                found[key] = self.pending[key]
+        wanted = set(keys).difference(found)
+        if wanted:
+            found.update(self.store.lookup(wanted))
+        missing = [k for k in wanted if k not in found]
+        self.hits += len(wanted) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            found.update(self._resolve(missing))
+            if len(self.pending) >= self.flush_size:
+                self.flush()
+
+        return numpy.array([found[k] for k in keys], dtype=float)
+
+    def flush(self):
+        self.resolver.flush()
+        self.store.insert(self.pending)
+        self.pending = {}
+
+    def source(self):
+        return self.resolver.source()
+
+    def prewarm(self, minlon, minlat, maxlon, maxlat, batch=elevstore.STORE_BATCH):
+        """
+        Fills the store with the levels of all the cells of the
+        bounding box not stored yet. Returns the number of cells
+        resolved.
+        """
+        (col0, col1), (row0, row1) = quantize([minlon, maxlon], [minlat, maxlat],
+                                              self.store.grid)
+        resolved = 0
+        for row in xrange(row0, row1 + 1):
+            keys = [(col, row) for col in xrange(col0, col1 + 1)]
+            for start in xrange(0, len(keys), batch):
+                chunk = keys[start:start + batch]
+                stored = self.store.lookup(chunk)
+                missing = [k for k in chunk if k not in stored]
+                if missing:
+                    self._resolve(missing)
+                    resolved += len(missing)
+                if len(self.pending) >= self.flush_size:
+                    self.flush()
+        self.flush()
+        return resolved
+
+# number of prefetches whose levels are kept (the track being checked
+# and the next one)
+PREFETCH_DEPTH = 2
+
+class _Prefetch:
+    """
+    Points asked to a resolver in the background, and their levels
+    once collected.
+    """
+    def __init__(self, keys, pending):
+        self.keys = set(keys)
+        self.pending = pending
+        self.levels = None
+
+    def has(self, key):
+        if self.levels is not None:
+            return key in self.levels
+        return key in self.keys
+
+class PrefetchingResolver(AltiResolver):
+    """
+    Wraps the AltiResolver 'resolver': prefetch() asks it for the
+    ground levels of a set of points (eg. the parts of the next track
+    near AGL zones) in a background thread, while the caller does
+    something else. Prefetches are resolved one after the other, and
+    the levels of the last 'depth' ones are served from memory, a
+    lookup only waiting for the prefetches holding its points. Other
+    points are asked to 'resolver' directly, once all the prefetches
+    are over (resolvers are not shared between threads).
+    """
+    def __init__(self, resolver, depth=PREFETCH_DEPTH):
+        self.resolver = resolver
+        self.depth = depth
+        self.jobs = collections.deque()
+        self._pool = None
+        self._pid = None
+
+        self.prefetched = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_time = 0.
+        self.wait_time = 0.
+        self.lookup_time = 0.
+
+    def __str__(self):
+        return "%d point(s) prefetched in %.3fs (%.3fs waited for), " \
+            "%d failed prefetch(es), %d hit(s), %d miss(es), %.3fs in lookups" % (
+            self.prefetched, self.prefetch_time, self.wait_time, self.failed,
+            self.hits, self.misses, self.lookup_time)
+
+    def _background(self, lons, lats):
+        start = time.time()
+        levels = self.resolver.getGroundLevelsAt(lons, lats)
+        return dict(zip(zip(lons, lats), levels)), time.time() - start
+
+    def _collect(self, job):
+        # waits for the prefetch 'job' if still in progress
+        if job.pending is None:
+            return
+        start = time.time()
+        pending, job.pending = job.pending, None
+        job.keys = None
+        try:
+            job.levels, elapsed = pending.get()
+        except Exception:
+            # its points are asked to the resolver again when looked
+            # up, raising there if it still fails
+            job.levels = {}
+            self.failed += 1
+            return
+        finally:
+            self.wait_time += time.time() - start
+        self.prefetch_time += elapsed
+        self.prefetched += len(job.levels)
+
+    def _collectAll(self):
+        for job in self.jobs:
+            self._collect(job)
+
+    def prefetch(self, lons, lats):
+        """
+        Starts resolving the given points in the background, after
+        the ones of the previous prefetches. The levels of the oldest
+        prefetch are forgotten once more than 'depth' are kept.
+        """
+        # threads are not inherited by forked processes (batch workers)
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = multiprocessing.pool.ThreadPool(1)
+            self._pid = os.getpid()
+            self.jobs.clear()
+        # a point may be near several zones
+        keys = list(set(zip([float(l) for l in lons], [float(l) for l in lats])))
+        if not keys:
+            return
+        self.jobs.append(_Prefetch(keys, self._pool.apply_async(
+                    self._background, ([k[0] for k in keys], [k[1] for k in keys]))))
+        while len(self.jobs) > self.depth:
+            self._collect(self.jobs.popleft())
+
+    def getGroundLevelsAt(self, lons, lats):
+        start = time.time()
+        waited = self.wait_time
+
+        levels = numpy.empty(len(lons))
+        keys = zip(lons, lats)
+        missing = range(len(keys))
+        for job in self.jobs:
+            if not missing:
+                break
+            if not [i for i in missing if job.has(keys[i])]:
+                continue
+            self._collect(job)
+            left = []
+            for i in missing:
+                level = job.levels.get(keys[i])
+                if level is None:
+                    left.append(i)
+                else:
+                    levels[i] = level
+            missing = left
+        if missing:
+            self._collectAll()
+            levels[missing] = self.resolver.getGroundLevelsAt([lons[i] for i in missing],
+                                                              [lats[i] for i in missing])
+        self.hits += len(lons) - len(missing)
+        self.misses += len(missing)
+        self.lookup_time += time.time() - start - (self.wait_time - waited)
+        return levels
+
+    def flush(self):
+        self._collectAll()
+        self.resolver.flush()
+
+    def source(self):
+        return self.resolver.source()
+
+def layersStatistics(altir):
+    """
+    Returns the list of the counters (as strings) of the prefetch,
+    cache and store layers wrapping the resolver 'altir'.
+    """
+    kinds = ((PrefetchingResolver, "prefetch"), (CachingResolver, "cache"),
+             (StoredResolver, "store"))
+    stats = []
+    while isinstance(altir, tuple([cls for cls, kind in kinds])):
+        for cls, kind in kinds:
+            if isinstance(altir, cls):
+                stats.append("elevation %s: %s" % (kind, altir))
+        altir = altir.resolver
+    return stats
+
+RESOLVER_MODES = ("ossim", "ossim-worker", "geonames", "random", "hgt")
+
+def createResolver(mode, ossim_config=None, hgt_dir=None, geonames_url=GEONAMES_URL,
+                   geonames_connections=GEONAMES_CONNECTIONS, ossim_workers=OSSIM_WORKERS):
+    """
+    Returns the AltiResolver for 'mode' (one of RESOLVER_MODES).
+    Raises error.ASCException if 'mode' is unknown or if its
+    configuration is missing.
+    """
+    if mode == "ossim":
+        if not ossim_config:
+            raise error.ASCException("Missing config file for ossim")
+        return OssimResolverWrapper(ossim_config)
+    elif mode == "ossim-worker":
+        if not ossim_config:
+            raise error.ASCException("Missing config file for ossim-worker")
+        return OssimWorkerResolver(ossim_config, ossim_workers)
+    elif mode == "geonames":
+        return ConcurrentGeoNamesResolver(url=geonames_url,
+                                          connections=geonames_connections)
+    elif mode == "random":
+        return RandomResolver()
+    elif mode == "hgt":
+        if not hgt_dir:
+            raise error.ASCException("Missing SRTM tiles directory for hgt")
+        return HgtResolver(hgt_dir)
+    raise error.ASCException("Incorrect altitude resolver mode %s" % mode)
+
+def addArguments(parser, required=True):
+    """
+    Adds the options selecting the altitude resolver to the
+    argparse 'parser'. See fromArguments().
+    """
+    parser.add_argument('--altiresolver', metavar='MODE', type=str,
+                        help='Altitude resolver mode (%s)' % ", ".join(RESOLVER_MODES),
+                        required=required)
+
+    parser.add_argument('--altiresolver-ossim-config', metavar='FILE', type=str,
+                        help='Config file path for ossim and ossim-worker modes',
+                        required=False)
+
+    parser.add_argument('--altiresolver-ossim-workers', metavar='N', type=int,
+                        default=OSSIM_WORKERS,
+                        help='Number of ossim processes for ossim-worker mode '
+                        '(default %(default)s)')
+
+    parser.add_argument('--altiresolver-hgt-dir', metavar='DIR', type=str,
+                        help='Directory of the SRTM .hgt tiles for hgt mode',
+                        required=False)
+
+    parser.add_argument('--altiresolver-geonames-url', metavar='URL', type=str,
+                        default=GEONAMES_URL,
+                        help='Base URL of the GeoNames services (default %(default)s)')
+
+    parser.add_argument('--altiresolver-geonames-connections', metavar='N', type=int,
+                        default=GEONAMES_CONNECTIONS,
+                        help='Number of concurrent GeoNames requests (default %(default)s)')
+
+    parser.add_argument('--altiresolver-cache', metavar='N', type=int, default=0,
+                        help='Number of ground levels to keep in memory '
+                        '(default: no cache)')
+
+    parser.add_argument('--altiresolver-cache-grid', metavar='DEG', type=float,
+                        default=CACHE_GRID,
+                        help='Size of the cache and store cells, matching the '
+                        'elevation data resolution (default %(default)s)')
+
+    parser.add_argument('--altiresolver-store', metavar='FILE', type=str,
+                        help='SQLite database where the ground levels are kept '
+                        'across runs (eg. ~/.cache/airspace-checker/elevation.sqlite)',
+                        required=False)
+
+    parser.add_argument('--altiresolver-prefetch', action="store_true", default=False,
+                        help='Resolve the ground levels near the AGL zones of a track '
+                        'in the background while the previous one is checked. Only '
+                        'worth it with remote resolvers (geonames, ossim-worker)')
+
+def fromArguments(args):
+    """
+    Returns the AltiResolver selected by the options added by
+    addArguments().
+    """
+    altir = createResolver(args.altiresolver, args.altiresolver_ossim_config,
+                           args.altiresolver_hgt_dir, args.altiresolver_geonames_url,
+                           args.altiresolver_geonames_connections,
+                           args.altiresolver_ossim_workers)
+    if args.altiresolver_store:
+        source = altir.source()
+        if source is None:
+            raise error.ASCException("The levels of the %s resolver cannot be stored"
+                                     % args.altiresolver)
+        store = elevstore.ElevationStore(args.altiresolver_store,
+                                         args.altiresolver_cache_grid, source)
+        altir = StoredResolver(altir, store)
+    if args.altiresolver_cache > 0:
+        altir = CachingResolver(altir, args.altiresolver_cache_grid,
+                                args.altiresolver_cache)
+    if args.altiresolver_prefetch:
+        altir = PrefetchingResolver(altir)
+    return altir
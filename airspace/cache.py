@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import time
+import hashlib
+import tempfile
+import cPickle
+
+import shapely.wkb
+
+import airspace
+import airspace.parser
+import util
+
+CACHE_EXT = ".zones"
+
+def defaultCacheDir():
+    return os.environ.get('AIRSPACE_CACHE_DIR',
+                          os.path.join(os.path.expanduser("~"), ".cache",
+                                       "airspace-checker"))
+
+def contentHash(filename):
+    """
+    Returns the SHA1 hex digest of the content of 'filename'.
+    """
+    h = hashlib.sha1()
+    fin = open(filename, "rb")
+    try:
+        while True:
+            buf = fin.read(1 << 16)
+            if not buf:
+                break
+            h.update(buf)
+    finally:
+        fin.close()
+    return h.hexdigest()
+
+class ZoneCache:
+    """
+    On-disk cache of compiled zones (meta + WKB geometry).
+    Entries are keyed by the content hash of the OpenAir file,
+    the geometry settings (QUADSEG, ARC_TOLERANCE) and the parser version, so
+    that any change to one of them is a cache miss.
+    """
+    def __init__(self, cachedir=None, version=airspace.parser.PARSER_VERSION):
+        self.cachedir = cachedir or defaultCacheDir()
+        self.version = version
+
+    def settingsKey(self):
+        return airspace.parser.settingsKey(self.version)
+
+    def _path(self, digest):
+        return os.path.join(self.cachedir,
+                            "%s-%s%s" % (digest, self.settingsKey(), CACHE_EXT))
+
+    def _entries(self):
+        if not os.path.isdir(self.cachedir):
+            return []
+        return [os.path.join(self.cachedir, f)
+                for f in os.listdir(self.cachedir) if f.endswith(CACHE_EXT)]
+
+    def load(self, filename, digest=None):
+        """
+        Returns the list of airspace.Zone cached for 'filename'
+        or None if there is no valid entry.
+        """
+        path = self._path(digest or contentHash(filename))
+        if not os.path.exists(path):
+            return None
+
+        fin = open(path, "rb")
+        try:
+            try:
+                entries = cPickle.load(fin)
+            except Exception, e:
+                util.debug_print("WARNING, corrupted cache entry %s (%s)" % (path, e))
+                return None
+        finally:
+            fin.close()
+
+        # keep track of last use for prune()
+        os.utime(path, None)
+        return [airspace.Zone(meta, shapely.wkb.loads(wkb), fingerprint)
+                for meta, wkb, fingerprint in entries]
+
+    def store(self, filename, zones, digest=None):
+        """
+        Stores 'zones' as the compiled content of 'filename'.
+        """
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+        path = self._path(digest or contentHash(filename))
+        entries = [(z.meta, z.geometry.wkb, z.fingerprint) for z in zones]
+
+        fd, tmppath = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+        fout = os.fdopen(fd, "wb")
+        try:
+            cPickle.dump(entries, fout, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            fout.close()
+        os.rename(tmppath, path)
+
+    def invalidate(self, filename=None):
+        """
+        Removes all entries for the content of 'filename' (whatever
+        the settings they were built with), or the whole cache if
+        no filename is given. Returns the number of removed entries.
+        """
+        prefix = contentHash(filename) + "-" if filename else ""
+        removed = 0
+        for path in self._entries():
+            if os.path.basename(path).startswith(prefix):
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def prune(self, max_entries=None, max_age=None):
+        """
+        Removes entries built with other settings than the current
+        ones, entries not used for more than 'max_age' seconds, and
+        the least recently used ones above 'max_entries'.
+        Returns the number of removed entries.
+        """
+        suffix = "-%s%s" % (self.settingsKey(), CACHE_EXT)
+        now = time.time()
+
+        kept = []
+        removed = 0
+        for path in self._entries():
+            mtime = os.path.getmtime(path)
+            if not path.endswith(suffix) or \
+                    (max_age is not None and now - mtime > max_age):
+                os.remove(path)
+                removed += 1
+            else:
+                kept.append((mtime, path))
+
+        if max_entries is not None and len(kept) > max_entries:
+            kept.sort(reverse=True)
+            for mtime, path in kept[max_entries:]:
+                os.remove(path)
+                removed += 1
+        return removed
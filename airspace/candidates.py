@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+
+import numpy
+import shapely.geometry
+
+import limits
+
+# number of track points in a chunk queried against the spatial index
+CHUNK_POINTS = 64
+
+# bounds (meters) of the terrain elevation, used to turn AGL
+# limits into conservative altitude envelopes for 3D indexes
+TERRAIN_MIN = -500.
+TERRAIN_MAX = 4810.
+# stands for UNL
+ALTITUDE_MAX = 100000.
+
+def chunkPoints(text):
+    """
+    argparse type of the --chunk-points options: chunks share their
+    end point, so they need at least 2 points (see chunkBounds()).
+    """
+    value = int(text)
+    if value < 2:
+        raise argparse.ArgumentTypeError("chunks need at least 2 points, not %s" % text)
+    return value
+
+def limitBounds(altispecif, terrain_min=TERRAIN_MIN, terrain_max=TERRAIN_MAX):
+    """
+    Returns the (lowest, highest) altitudes in meters an altitude
+    limit (a 'floor' or 'ceiling' meta dict) can take anywhere.
+    """
+    meters, agl = limits.compileLimit(altispecif)
+    if agl:
+        return (meters + terrain_min, meters + terrain_max)
+    meters = min(meters, ALTITUDE_MAX)
+    return (meters, meters)
+
+def verticalEnvelope(meta, terrain_min=TERRAIN_MIN, terrain_max=TERRAIN_MAX):
+    """
+    Returns the (low, high) altitudes in meters between which a
+    point may be inside the zone described by 'meta', whatever the
+    terrain below it (or within the zone 'terrain' envelope if
+    known, see limits.terrainEnvelope()).
+    """
+    terrain_min, terrain_max = meta.get('terrain', (terrain_min, terrain_max))
+    low = limitBounds(meta['floor'], terrain_min, terrain_max)[0]
+    high = limitBounds(meta['ceiling'], terrain_min, terrain_max)[1]
+    # some zones have their limits swapped in the source data
+    return (min(low, high), max(low, high))
+
+def indexBounds(zone, dimension=2):
+    """
+    Returns the bounds of 'zone' in a spatial index of 'dimension'
+    2 (lon, lat) or 3 (lon, lat, altitude envelope).
+    """
+    minx, miny, maxx, maxy = zone.geometry.bounds
+    if dimension == 2:
+        return (minx, miny, maxx, maxy)
+    low, high = verticalEnvelope(zone.meta)
+    return (minx, miny, low, maxx, maxy, high)
+
+def chunkBounds(coords, max_points=CHUNK_POINTS, dimension=2):
+    """
+    Splits the (N,2+) array 'coords' of a track into chunks of at
+    most 'max_points' points, consecutive chunks sharing their end
+    point so that no segment is lost. Chunk i starts at point
+    i * (max_points - 1). Returns the (M,4) array of the chunks
+    bounding boxes (minx, miny, maxx, maxy), or the (M,6) array
+    (minx, miny, minz, maxx, maxy, maxz) if 'dimension' is 3.
+    """
+    assert max_points >= 2, "chunks need at least 2 points"
+    step = max_points - 1
+    xy = coords[:, :dimension]
+    starts = numpy.arange(0, max(len(xy) - 1, 1), step)
+    ends = numpy.minimum(starts + max_points, len(xy))
+
+    # min/max of [start, end) for each chunk: reduceat over the
+    # non overlapping parts, then merge with the shared end point
+    mins = numpy.minimum.reduceat(xy, starts)
+    maxs = numpy.maximum.reduceat(xy, starts)
+    last = xy[ends - 1]
+    return numpy.hstack((numpy.minimum(mins, last), numpy.maximum(maxs, last)))
+
+def chunkCandidates(spatial_index, bounds):
+    """
+    Queries 'spatial_index' with each chunk bounding box of 'bounds'
+    (see chunkBounds()). Returns a dict: zone id -> sorted indexes
+    of the chunks that may cross the zone.
+    """
+    candidates = {}
+    for i, bbox in enumerate(bounds.tolist()):
+        for fid in spatial_index.intersection(bbox):
+            candidates.setdefault(fid, []).append(i)
+    return candidates
+
+def chunkRanges(indexes, max_points=CHUNK_POINTS):
+    """
+    Returns the (start, stop) point ranges of the runs of consecutive
+    chunks found in 'indexes' (sorted), so that a zone crossed by
+    several chunks in a row gives a single piece of track.
+    """
+    assert max_points >= 2, "chunks need at least 2 points"
+    step = max_points - 1
+    ranges = []
+    first = None
+    last = None
+    for i in indexes:
+        if first is not None and i != last + 1:
+            ranges.append((first * step, last * step + max_points))
+            first = None
+        if first is None:
+            first = i
+        last = i
+    if first is not None:
+        ranges.append((first * step, last * step + max_points))
+    return ranges
+
+def mergeChunks(coords, indexes, max_points=CHUNK_POINTS):
+    """
+    Returns LineStrings made of the runs of consecutive chunks
+    found in 'indexes' (see chunkRanges()).
+    """
+    return [shapely.geometry.LineString(coords[start:stop])
+            for start, stop in chunkRanges(indexes, max_points)]
+
+class CandidateStats:
+    """
+    Number of candidates left after each filtering stage:
+    track: zones whose bbox intersects a whole track bbox
+    chunk: zones whose bbox intersects a chunk bbox
+    pairs: (zone, chunk) pairs sent to the exact tests
+    vertical: (zone, chunk) pairs skipped thanks to the altitude
+      envelopes (3D index only)
+    exact: zones actually crossed by a track (lateral only)
+    """
+    def __init__(self):
+        self.track = 0
+        self.chunk = 0
+        self.pairs = 0
+        self.vertical = 0
+        self.exact = 0
+
+    def __str__(self):
+        return "whole track bbox: %d zone(s), chunk bbox: %d zone(s) " \
+            "(%d zone/chunk pairs, %d skipped by altitude), exact: %d zone(s)" % (
+            self.track, self.chunk, self.pairs, self.vertical, self.exact)
+
+def findCandidates(spatial_index, tracks, max_points=CHUNK_POINTS, stats=None):
+    """
+    Returns a list of (track, {zone id: chunk indexes}, coords) for
+    each track in 'tracks', 'coords' being the track coordinates as
+    an array, to be given to mergeChunks(). With a 3D index (see
+    indexBounds()), the chunks boxes include the altitudes of the
+    track (which must be 3D). Fills 'stats' (a CandidateStats) with
+    the track and chunk stages if given.
+    """
+    dimension = spatial_index.properties.dimension
+    res = []
+    track_fids = set()
+    chunk_fids = set()
+    for track in tracks:
+        coords = numpy.asarray(track.coords)
+        bounds = chunkBounds(coords, max_points, dimension)
+        candidates = chunkCandidates(spatial_index, bounds)
+        res.append((track, candidates, coords))
+
+        if stats is None:
+            continue
+
+        pairs = sum([len(c) for c in candidates.values()])
+        stats.pairs += pairs
+        chunk_fids.update(candidates.keys())
+
+        track_bounds = list(track.bounds)
+        if dimension == 3:
+            # same queries, whatever the altitude
+            track_bounds[2:2] = [-ALTITUDE_MAX]
+            track_bounds.append(ALTITUDE_MAX)
+            bounds[:, 2] = -ALTITUDE_MAX
+            bounds[:, 5] = ALTITUDE_MAX
+            lateral = chunkCandidates(spatial_index, bounds)
+            stats.vertical += sum([len(c) for c in lateral.values()]) - pairs
+        track_fids.update(spatial_index.intersection(track_bounds))
+
+    if stats is not None:
+        stats.track = len(track_fids)
+        stats.chunk = len(chunk_fids)
+    return res
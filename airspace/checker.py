@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+import shapely.geometry
+
+import candidates
+import classify
+
+def elevationFootprint(track_candidates, zones, max_points=candidates.CHUNK_POINTS):
+    """
+    Returns the (lons, lats) arrays of the points of the tracks whose
+    ground levels confirmZones() may need: those of the chunks near
+    zones with AGL limits. See altiresolver.PrefetchingResolver.
+    """
+    parts = []
+    for track, cands, coords in track_candidates:
+        for fid, indexes in cands.items():
+            if zones[fid].limits.agl:
+                for start, stop in candidates.chunkRanges(indexes, max_points):
+                    parts.append(coords[start:stop, :2])
+    if not parts:
+        return numpy.empty(0), numpy.empty(0)
+    points = numpy.concatenate(parts)
+    return points[:, 0], points[:, 1]
+
+def confirmZones(track_candidates, zones, altir, max_points=candidates.CHUNK_POINTS,
+                 times=None, stats=None):
+    """
+    Checks the tracks against their candidate zones, as returned by
+    candidates.findCandidates(). 'zones' is a dict: id -> Zone and
+    'times' an optional list of time arrays, one per track.
+    Returns a dict: zone -> (parts, crossings), 'parts' being the
+    coordinates lists of the parts of tracks inside the zone and
+    'crossings' the list of classify.Crossing (indexes relative to
+    the part of track they were found in).
+    Fills 'stats' (a candidates.CandidateStats) with the number of
+    zones crossed laterally if given.
+    """
+    lateral = set()
+    confirmed = {}
+    # the ground levels needed by a track are resolved in the
+    # background while the previous one is checked, if 'altir' is an
+    # altiresolver.PrefetchingResolver
+    altir.prefetch(*elevationFootprint(track_candidates[:1], zones, max_points))
+    for n, (track, cands, coords) in enumerate(track_candidates):
+        if n + 1 < len(track_candidates):
+            altir.prefetch(*elevationFootprint(track_candidates[n + 1:n + 2], zones,
+                                               max_points))
+        # zones with AGL limits last, leaving time to a prefetch of
+        # their ground levels
+        for fid, indexes in sorted(cands.items(), key=lambda c: zones[c[0]].limits.agl):
+            zone = zones[fid]
+            edges = None
+            for start, stop in candidates.chunkRanges(indexes, max_points):
+                points = coords[start:stop]
+                if not zone.prepared.intersects(shapely.geometry.LineString(points)):
+                    continue
+                lateral.add(fid)
+
+                if edges is None:
+                    edges = classify.polygonEdges(zone.geometry)
+                floors, ceils = zone.limits.at(altir, points[:, 0], points[:, 1],
+                                               points[:, 2])
+                piece_times = None if times is None else times[n][start:stop]
+                mask, crossings = classify.findCrossings(points, zone.geometry,
+                                                         floors, ceils,
+                                                         piece_times, edges)
+                parts = classify.insideParts(points, crossings)
+                if parts:
+                    zone_parts, zone_crossings = confirmed.get(zone, ([], []))
+                    confirmed[zone] = (zone_parts + parts, zone_crossings + crossings)
+
+    if stats is not None:
+        stats.exact = len(lateral)
+    return confirmed
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+
+# max number of point/edge pairs tested at once by pointsInPolygon()
+# and trackCrossings()
+BLOCK_SIZE = 1 << 20
+# number of consecutive segments tested at once by trackCrossings()
+SEGMENT_RUN = 64
+
+def polygonEdges(polygon):
+    """
+    Returns the (E,4) array (x0, y0, x1, y1) of the edges of all
+    the rings (exterior and interiors) of 'polygon' (a Polygon or
+    a MultiPolygon).
+    """
+    if polygon.geom_type == 'MultiPolygon':
+        return numpy.vstack([polygonEdges(p) for p in polygon.geoms])
+
+    edges = []
+    for ring in [polygon.exterior] + list(polygon.interiors):
+        coords = numpy.asarray(ring.coords)[:, :2]
+        edges.append(numpy.hstack((coords[:-1], coords[1:])))
+    return numpy.vstack(edges)
+
+def pointsInPolygon(xy, polygon, edges=None):
+    """
+    Returns a boolean array telling for each point of the (N,2+)
+    array 'xy' if it lies inside 'polygon' (even-odd rule, so
+    holes are handled). 'edges' can be given to avoid computing
+    polygonEdges() again.
+    """
+    if edges is None:
+        edges = polygonEdges(polygon)
+
+    inside = numpy.zeros(len(xy), dtype=bool)
+
+    # only points in the bbox can be inside
+    minx, miny, maxx, maxy = polygon.bounds
+    x, y = xy[:, 0], xy[:, 1]
+    todo = ((x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy)).nonzero()[0]
+
+    x0, y0, x1, y1 = edges.T
+    step = max(BLOCK_SIZE / len(edges), 1)
+    for start in xrange(0, len(todo), step):
+        idx = todo[start:start + step]
+        px = x[idx][:, numpy.newaxis]
+        py = y[idx][:, numpy.newaxis]
+        straddle = (y0 > py) != (y1 > py)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            xcross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+            crossings = (straddle & (px < xcross)).sum(axis=1)
+        inside[idx] = crossings % 2 == 1
+    return inside
+
+def trackCrossings(points, edges):
+    """
+    Returns the (segments, fractions) arrays of all the crossings of
+    the segments of the track 'points' with 'edges' (see
+    polygonEdges()): segment i (from point i to point i + 1) crosses
+    an edge at 'fraction' of its length.
+    """
+    if not len(edges) or len(points) < 2:
+        return numpy.empty(0, dtype=int), numpy.empty(0)
+    x0, y0, x1, y1 = edges.T
+    ex, ey = x1 - x0, y1 - y0
+    emin = numpy.minimum(edges[:, :2], edges[:, 2:])
+    emax = numpy.maximum(edges[:, :2], edges[:, 2:])
+
+    xy = points[:, :2]
+    lo = numpy.minimum(xy[:-1], xy[1:])
+    hi = numpy.maximum(xy[:-1], xy[1:])
+
+    # consecutive segments are close to each other: each run of them
+    # is only tested against the edges meeting its bounding box
+    segments, fractions = [], []
+    run = max(min(SEGMENT_RUN, BLOCK_SIZE / len(edges)), 1)
+    starts = numpy.arange(0, len(lo), run)
+    runs_lo = numpy.minimum.reduceat(lo, starts)
+    runs_hi = numpy.maximum.reduceat(hi, starts)
+    meets = ((emax[:, 0] >= runs_lo[:, 0, numpy.newaxis]) &
+             (emin[:, 0] <= runs_hi[:, 0, numpy.newaxis]) &
+             (emax[:, 1] >= runs_lo[:, 1, numpy.newaxis]) &
+             (emin[:, 1] <= runs_hi[:, 1, numpy.newaxis]))
+    for r in meets.any(axis=1).nonzero()[0]:
+        start = starts[r]
+        stop = min(start + run, len(lo))
+        near = meets[r].nonzero()[0]
+        idx = numpy.arange(start, stop)[:, numpy.newaxis]
+        px, py = xy[idx, 0], xy[idx, 1]
+        dx, dy = xy[idx + 1, 0] - px, xy[idx + 1, 1] - py
+        ax, ay = x0[near] - px, y0[near] - py
+
+        # t = nt / denom and u = nu / denom must be in [0, 1]
+        denom = dx * ey[near] - dy * ex[near]
+        sign = numpy.sign(denom)
+        nt = (ax * ey[near] - ay * ex[near]) * sign
+        nu = (ax * dy - ay * dx) * sign
+        denom *= sign
+        rows, cols = ((denom > 0) & (nt >= 0) & (nt <= denom) &
+                      (nu >= 0) & (nu <= denom)).nonzero()
+        segments.append(start + rows)
+        fractions.append(nt[rows, cols] / denom[rows, cols])
+    if not segments:
+        return numpy.empty(0, dtype=int), numpy.empty(0)
+    return numpy.concatenate(segments), numpy.concatenate(fractions)
+
+def _levelCrossings(d):
+    # segments and fractions at which a linearly interpolated d goes
+    # through 0 (d being the distance to a limit at each point)
+    d0, d1 = d[:-1], d[1:]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        t = d0 / (d0 - d1)
+        ok = numpy.isfinite(t) & (t > 0) & (t < 1)
+    return ok.nonzero()[0], t[ok]
+
+class Crossing:
+    """
+    Entry in (kind == 'entry') or exit from (kind == 'exit') a zone,
+    between the points 'index' and 'index' + 1 of the track, at
+    'fraction' of that segment. 'point' is the interpolated
+    (lon, lat, alt) and 'time' the interpolated time (None if the
+    track has no time). An entry at index 0 with fraction 0 means
+    the track starts inside the zone.
+    """
+    def __init__(self, kind, index, fraction, point, time=None):
+        self.kind = kind
+        self.index = index
+        self.fraction = fraction
+        self.point = point
+        self.time = time
+
+    def __repr__(self):
+        return "Crossing(%s, %d+%.3f, %s, %s)" % (self.kind, self.index,
+                                                  self.fraction, self.point,
+                                                  self.time)
+
+def membershipMask(points, polygon, floors, ceils, edges=None):
+    """
+    Returns the boolean mask of the points of the (N,3) array
+    'points' (lon, lat, alt in meters) that are inside the zone
+    made of 'polygon' and the 'floors'/'ceils' arrays (meters,
+    one value per point), along with the lateral mask.
+    """
+    lateral = pointsInPolygon(points, polygon, edges)
+    alts = points[:, 2]
+    return lateral & (alts > floors) & (alts < ceils), lateral
+
+def findCrossings(points, polygon, floors, ceils, times=None, edges=None,
+                  inside=False):
+    """
+    Classifies the (N,3) array 'points' against a zone (see
+    membershipMask()). Returns (mask, crossings), 'crossings' being
+    the list of Crossing where the track enters or leaves the zone.
+    Each segment is cut where it crosses an edge of 'polygon' or a
+    limit (the altitude and the limits being linearly interpolated)
+    and every piece is tested at its middle, so a zone entered and
+    left between two samples is found. 'times' is an optional array
+    of times (seconds), interpolated the same way. 'inside' tells if
+    the track is already inside the zone before its first point
+    (see streaming.StreamingChecker).
+    """
+    if edges is None:
+        edges = polygonEdges(polygon)
+
+    mask, lateral = membershipMask(points, polygon, floors, ceils, edges)
+    if len(points) < 2:
+        crossings = []
+        if len(points) and mask[0] != inside:
+            crossings.append(Crossing('entry' if mask[0] else 'exit', 0, 0.0,
+                                      tuple(points[0]),
+                                      None if times is None else times[0]))
+        return mask, crossings
+
+    above = points[:, 2] - floors
+    below = ceils - points[:, 2]
+    count = len(points) - 1
+    lateral_cuts = trackCrossings(points, edges)
+    cuts = [lateral_cuts, _levelCrossings(above), _levelCrossings(below)]
+    segments = numpy.concatenate([s for s, t in cuts])
+    fractions = numpy.concatenate([t for s, t in cuts])
+    inner = (fractions > 0) & (fractions < 1)
+    segments, fractions = segments[inner], fractions[inner]
+    order = numpy.lexsort((fractions, segments))
+    segments, fractions = segments[order], fractions[order]
+    if len(segments):
+        distinct = numpy.concatenate(([True], (segments[1:] != segments[:-1]) |
+                                      (fractions[1:] != fractions[:-1])))
+        segments, fractions = segments[distinct], fractions[distinct]
+
+    # pieces of the segments between their cuts, in track order
+    pieces = 1 + numpy.bincount(segments, minlength=count)
+    first = numpy.cumsum(pieces) - pieces
+    seg = numpy.repeat(numpy.arange(count), pieces)
+    rank = numpy.arange(len(segments)) - numpy.searchsorted(segments, segments)
+    start = numpy.zeros(len(seg))
+    start[first[segments] + 1 + rank] = fractions
+    end = numpy.ones(len(seg))
+    end[first[segments] + rank] = fractions
+    middle = (start + end) / 2
+
+    def interpolate(values, which=slice(None)):
+        s, m = seg[which], middle[which]
+        v0, v1 = values[s], values[s + 1]
+        # infinite limits stay infinite
+        return numpy.where(v0 == v1, v0, v0 + m * (v1 - v0))
+
+    with numpy.errstate(invalid='ignore'):
+        # segments crossing no edge are on one side of the boundary
+        state = lateral[seg]
+        cut = numpy.zeros(count, dtype=bool)
+        cut[lateral_cuts[0]] = True
+        cut = cut[seg].nonzero()[0]
+        if len(cut):
+            xy = numpy.column_stack((interpolate(points[:, 0], cut),
+                                     interpolate(points[:, 1], cut)))
+            state[cut] = pointsInPolygon(xy, polygon, edges)
+        state &= (interpolate(above) > 0) & (interpolate(below) > 0)
+
+    crossings = []
+    previous = numpy.concatenate(([inside], state[:-1]))
+    for k in (state != previous).nonzero()[0]:
+        i, t = seg[k], start[k]
+        if t == 0 and i > 0 and not state[k]:
+            # leaving on a vertex ends the previous segment
+            i, t = i - 1, 1.0
+        point = points[i] + t * (points[i + 1] - points[i])
+        time = None
+        if times is not None:
+            time = times[i] + t * (times[i + 1] - times[i])
+        crossings.append(Crossing('entry' if state[k] else 'exit', int(i), float(t),
+                                  tuple(point), time))
+    return mask, crossings
+
+def insideParts(points, crossings):
+    """
+    Returns the list of coordinates lists of the parts of the track
+    'points' inside the zone, from each entry to the following exit
+    (or to the end of the track), using the interpolated crossing
+    points.
+    """
+    parts = []
+    entry = None
+    for c in crossings:
+        if c.kind == 'entry':
+            entry = c
+        elif entry is not None:
+            part = [entry.point] + [tuple(p) for p in points[entry.index + 1:c.index + 1]]
+            parts.append(part + [c.point])
+            entry = None
+    if entry is not None:
+        parts.append([entry.point] + [tuple(p) for p in points[entry.index + 1:]])
+    # a single point is not a part of track
+    return [part for part in parts if len(part) > 1]
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+
+# number of cells per statement when reading or writing in bulk
+STORE_BATCH = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS levels (
+    source TEXT NOT NULL,
+    grid REAL NOT NULL,
+    col INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    level REAL NOT NULL,
+    PRIMARY KEY (source, grid, col, row)
+)
+"""
+
+class ElevationStore:
+    """
+    Ground levels stored in the SQLite database 'path', one per cell
+    (col, row) of a grid of 'grid' degrees (see
+    altiresolver.quantize()) and per 'source', identifying the data
+    the levels come from (see AltiResolver.source()).
+    The database is in WAL mode so that several processes can read
+    it while one of them writes. Each process opens its own
+    connection.
+    """
+    def __init__(self, path, grid, source):
+        self.path = path
+        self.grid = grid
+        self.source = source
+        self._db = None
+        self._pid = None
+
+    def connection(self):
+        # connections must not be shared with forked processes
+        if self._db is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(self.path, timeout=60)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(SCHEMA)
+            self._db.commit()
+            self._pid = os.getpid()
+        return self._db
+
+    def close(self):
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
+
+    def lookup(self, keys):
+        """
+        Returns a dict: (col, row) -> level for the cells of 'keys'
+        found in the store.
+        """
+        db = self.connection()
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS wanted "
+                   "(col INTEGER, row INTEGER, PRIMARY KEY (col, row))")
+        found = {}
+        keys = list(keys)
+        for start in xrange(0, len(keys), STORE_BATCH):
+            db.execute("DELETE FROM wanted")
+            db.executemany("INSERT OR IGNORE INTO wanted VALUES (?, ?)",
+                           [(int(c), int(r)) for c, r in keys[start:start + STORE_BATCH]])
+            for col, row, level in db.execute(
+                "SELECT l.col, l.row, l.level FROM wanted w JOIN levels l "
+                "ON l.source = ? AND l.grid = ? AND l.col = w.col AND l.row = w.row",
+                (self.source, self.grid)):
+                found[(col, row)] = level
+        db.rollback()
+        return found
+
+    def insert(self, levels):
+        """
+        Stores the levels of the dict 'levels': (col, row) -> level,
+        in a single transaction.
+        """
+        if not levels:
+            return
+        db = self.connection()
+        rows = [(self.source, self.grid, int(c), int(r), float(l))
+                for (c, r), l in levels.iteritems()]
+        for start in xrange(0, len(rows), STORE_BATCH):
+            db.executemany("INSERT OR REPLACE INTO levels VALUES (?, ?, ?, ?, ?)",
+                           rows[start:start + STORE_BATCH])
+        db.commit()
+
+    def count(self):
+        """
+        Returns the number of cells stored for this source and grid.
+        """
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM levels WHERE source = ? AND grid = ?",
+            (self.source, self.grid)).fetchone()[0]
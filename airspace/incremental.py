@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+
+import airspace.parser
+
+def zoneKey(records):
+    """
+    Returns the (class, name) identifying the zone described by
+    'records', with the same encoding as in the shapefile.
+    """
+    aclass, name = None, None
+    for lineno, keyword, value in records:
+        if keyword == 'AC':
+            aclass = value
+        elif keyword == 'AN':
+            name = value
+    return (aclass, name)
+
+class ZonesDiff:
+    """
+    Result of diffZones().
+    added: records of new zones
+    changed: (fid, records) of zones whose records differ
+    removed: (fid, key) of zones not found anymore
+    unchanged: number of zones left untouched
+    """
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.unchanged = 0
+
+    def toBuild(self):
+        return self.added + [records for fid, records in self.changed]
+
+    def toDelete(self):
+        return [fid for fid, records in self.changed] + \
+            [fid for fid, key in self.removed]
+
+def settingsFingerprint(fingerprint, settings):
+    """
+    Returns the fingerprint of a zone whose records have the
+    fingerprint 'fingerprint', completed with 'settings': a string
+    describing how the zone data not coming from the records (eg.
+    terrain envelopes) is computed. Returns 'fingerprint' if there
+    are no such settings.
+    """
+    if fingerprint is None or settings is None:
+        return fingerprint
+    return hashlib.sha1("%s\n%s" % (fingerprint, settings)).hexdigest()
+
+def diffZones(old_fingerprints, zone_records, settings=None):
+    """
+    Compares the fingerprints of an existing shapefile (as returned
+    by shp.loadFingerprints()) with the records of the new OpenAir
+    file (as given by parser.iterZoneRecords()) and the 'settings'
+    (see settingsFingerprint()).
+    Zones are identified by (class, name). A zone is changed if a
+    zone with the same identity exists with another fingerprint, so
+    all zones are rebuilt when the settings change.
+    """
+    diff = ZonesDiff()
+
+    # (key, fingerprint) -> fids, to match unchanged zones even if
+    # several zones share the same name.
+    old_by_fp = {}
+    for fid, key, fingerprint in old_fingerprints:
+        old_by_fp.setdefault((key, fingerprint), []).append(fid)
+
+    remaining = []
+    for records in zone_records:
+        key = zoneKey(records)
+        fingerprint = settingsFingerprint(airspace.parser.fingerprintRecords(records),
+                                          settings)
+        fids = old_by_fp.get((key, fingerprint))
+        if fids:
+            fids.pop(0)
+            diff.unchanged += 1
+        else:
+            remaining.append((key, records))
+
+    old_by_key = {}
+    for (key, fingerprint), fids in sorted(old_by_fp.items()):
+        old_by_key.setdefault(key, []).extend(fids)
+
+    for key, records in remaining:
+        fids = old_by_key.get(key)
+        if fids:
+            diff.changed.append((fids.pop(0), records))
+        else:
+            diff.added.append(records)
+
+    for key, fids in old_by_key.items():
+        for fid in fids:
+            diff.removed.append((fid, key))
+
+    return diff
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+
+import numpy
+
+import classify
+
+FOOT = 0.3048
+
+# terrainEnvelope() sampling step (degrees) for resolvers without
+# levelRange(): 30 arc seconds (~900m), ~100 times less points than
+# the 3 arc second resolution of SRTM3/ASTER. The sampled levels are
+# widened by terrainMargin(), covering a TERRAIN_SLOPE steep rise
+# between samples.
+TERRAIN_STEP = 1 / 120.
+TERRAIN_SLOPE = 1.
+# length (meters) of a degree of latitude
+DEGREE = 111320.
+# padding (degrees) of the area below a zone, covering levels
+# quantized on a cache grid (see altiresolver.CachingResolver)
+TERRAIN_PAD = 1 / 600.
+
+def compileLimit(altispecif):
+    """
+    Converts an altitude meta dict (floor or ceiling of a zone) to
+    (meters, agl): the limit is 'meters' above the ground if 'agl'
+    is True, above the mean sea level otherwise.
+    """
+    if altispecif.get('nolimit'):
+        return (numpy.inf, False)
+    if altispecif.get('fromground'):
+        # not 100% true, as SFC is not at 0 MSL.
+        # approx valid when flying outside of a cave.
+        return (0., False)
+    if 'flevel' in altispecif:
+        return (altispecif['flevel'] * 100 * FOOT, False)
+
+    alti, unit = altispecif['basealti']
+    if unit == 'F':
+        alti *= FOOT
+    return (float(alti), altispecif.get('ref') == 'AGL')
+
+def terrainMargin(step, slope=TERRAIN_SLOPE):
+    """
+    Returns the margin (meters) added to ground levels sampled every
+    'step' degrees: the rise at 'slope' over half the diagonal of a
+    cell of the grid.
+    """
+    return slope * step * DEGREE * math.sqrt(2) / 2
+
+def terrainEnvelope(geometry, altir, step=TERRAIN_STEP, margin=None):
+    """
+    Returns the (lowest, highest) ground levels (meters) 'altir'
+    gives below 'geometry' (padded by TERRAIN_PAD), or None if some
+    of them are unknown. Resolvers having a levelRange() method
+    (HgtResolver) give exact bounds for the bounding box; others
+    are sampled every 'step' degrees, the bounds being widened by
+    'margin' (terrainMargin(step) if None). Each sample is a ground
+    lookup: the 210 AGL zones of france-07_04_2011.txt need ~360000
+    of them with the default step (~18000 GeoNames requests), 29.6
+    millions every 3 arc seconds.
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    if hasattr(altir, 'levelRange'):
+        return altir.levelRange(minx - TERRAIN_PAD, miny - TERRAIN_PAD,
+                                maxx + TERRAIN_PAD, maxy + TERRAIN_PAD)
+
+    if margin is None:
+        margin = terrainMargin(step)
+    area = geometry.buffer(TERRAIN_PAD)
+    minx, miny, maxx, maxy = area.bounds
+    xs, ys = numpy.meshgrid(numpy.arange(minx, maxx + step, step),
+                            numpy.arange(miny, maxy + step, step))
+    grid = numpy.column_stack([xs.ravel(), ys.ravel()])
+    edges = classify.polygonEdges(area)
+    samples = numpy.concatenate([grid[classify.pointsInPolygon(grid, area, edges)],
+                                 edges[:, :2]])
+
+    levels = numpy.asarray(altir.getGroundLevelsAt(samples[:, 0], samples[:, 1]),
+                           dtype=float)
+    if not len(levels) or numpy.isnan(levels).any():
+        return None
+    return (float(levels.min()) - margin, float(levels.max()) + margin)
+
+class VerticalLimits:
+    """
+    Floor and ceiling of a zone, compiled once from its meta dict
+    (see compileLimit()) and evaluated on arrays of points. The
+    optional meta 'terrain' is the (lowest, highest) ground levels
+    below a zone with AGL limits (see terrainEnvelope()).
+    """
+    def __init__(self, meta):
+        self.floor = compileLimit(meta['floor'])
+        self.ceiling = compileLimit(meta['ceiling'])
+        self.agl = self.floor[1] or self.ceiling[1]
+        self.terrain = meta.get('terrain') if self.agl else None
+
+    def groundLevels(self, altir, lons, lats):
+        """
+        Returns the ground levels (meters) at the given points, NaN
+        where 'altir' has no answer.
+        """
+        return numpy.asarray(altir.getGroundLevelsAt(lons, lats), dtype=float)
+
+    def _evaluate(self, limit, ground, count):
+        meters, agl = limit
+        if agl:
+            return ground + meters
+        values = numpy.empty(count)
+        values.fill(meters)
+        return values
+
+    def at(self, altir, lons, lats, alts=None):
+        """
+        Returns the floors and ceilings arrays (meters) at the points
+        'lons'/'lats'. 'altir' is only used for AGL limits, once per
+        point.
+        If the terrain envelope is known and the altitudes 'alts' of
+        the points (a track) are given, the ground is only asked for
+        the points that may be on either side of a limit, and for
+        both ends of the segments crossing one. The other limits are
+        bounds giving the same answers to alts > floors and
+        alts < ceils.
+        """
+        ground = None
+        if self.agl:
+            if self.terrain is not None and alts is not None:
+                ground = self._boundingGround(altir, lons, lats,
+                                              numpy.asarray(alts, dtype=float))
+            else:
+                ground = self.groundLevels(altir, lons, lats)
+        return (self._evaluate(self.floor, ground, len(lons)),
+                self._evaluate(self.ceiling, ground, len(lons)))
+
+    def _range(self, limit):
+        meters, agl = limit
+        if agl:
+            return (meters + self.terrain[0], meters + self.terrain[1])
+        return (meters, meters)
+
+    def _boundingGround(self, altir, lons, lats, alts):
+        floor_low, floor_high = self._range(self.floor)
+        ceiling_low, ceiling_high = self._range(self.ceiling)
+        # lowest ground below the floor and inside, highest above
+        ground = numpy.where(alts >= ceiling_high, float(self.terrain[1]),
+                             float(self.terrain[0]))
+        decided = (alts <= floor_low) | (alts >= ceiling_high) | \
+            ((alts > floor_high) & (alts < ceiling_low))
+
+        asked = numpy.zeros(len(alts), dtype=bool)
+        wanted = ~decided
+        lons = numpy.asarray(lons, dtype=float)
+        lats = numpy.asarray(lats, dtype=float)
+        while True:
+            if wanted.any():
+                ground[wanted] = self.groundLevels(altir, lons[wanted], lats[wanted])
+                asked |= wanted
+
+            # vertical crossings are interpolated from exact limits
+            with numpy.errstate(invalid='ignore'):
+                above = alts > self._evaluate(self.floor, ground, len(alts))
+                below = alts < self._evaluate(self.ceiling, ground, len(alts))
+            changes = (above[:-1] != above[1:]) | (below[:-1] != below[1:])
+            ends = numpy.zeros(len(alts), dtype=bool)
+            ends[:-1] |= changes
+            ends[1:] |= changes
+            wanted = ends & ~asked
+            if not wanted.any():
+                return ground
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Long lived ossim height process, started by
+# altiresolver.OssimWorkerResolver with the ossim config file as
+# argument. The elevation database is opened once, then requests are
+# read from stdin, one per line, and answered on stdout:
+#
+#   ping                      -> pong
+#   heights LAT LON LAT LON   -> ok H H (nan when unknown)
+#   quit                      -> (exits)
+#
+# Anything else is answered by 'error MESSAGE'.
+
+import sys
+
+def serve(heights, fin=sys.stdin, fout=sys.stdout):
+    """
+    Answers the requests read from 'fin' until 'quit' or the end of
+    the input. 'heights(lats, lons)' returns the list of heights.
+    """
+    for line in iter(fin.readline, ""):
+        words = line.split()
+        if not words:
+            continue
+        try:
+            if words[0] == "quit":
+                break
+            elif words[0] == "ping":
+                answer = "pong"
+            elif words[0] == "heights":
+                coords = [float(w) for w in words[1:]]
+                if len(coords) % 2:
+                    raise ValueError("odd number of coordinates")
+                answer = " ".join(["ok"] + [repr(float(h)) for h in
+                                            heights(coords[0::2], coords[1::2])])
+            else:
+                raise ValueError("unknown request %s" % words[0])
+        except Exception, e:
+            answer = "error %s" % str(e).replace("\n", " ")
+        fout.write(answer + "\n")
+        fout.flush()
+
+def ossimHeights(lats, lons):
+    import ossim
+    if hasattr(ossim, 'heights'):
+        return ossim.heights(lats, lons)
+    res = []
+    for lat, lon in zip(lats, lons):
+        r = ossim.height(lat, lon)
+        res.append(r[0] if r else float('nan'))
+    return res
+
+def main():
+    if len(sys.argv) != 2:
+        print >> sys.stderr, "usage: %s OSSIM_CONFIG" % sys.argv[0]
+        return 1
+    import ossim
+    ossim.init(sys.argv[1])
+    serve(ossimHeights)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
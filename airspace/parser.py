@@ -17,13 +17,283 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import antlr3
+import re
+import hashlib
+import multiprocessing
 
-from OpenAirLexer import OpenAirLexer
-from OpenAirParser import OpenAirParser
-from OpenAirWalker import OpenAirWalker
+import numpy
+import shapely.geometry
+import shapely.wkb
+
+import airspace
+import error
+import util
+
+# bump when the zones built from the same input may differ
+# (invalidates the compiled zones cache, see cache.py)
+PARSER_VERSION = 6
+
+# number of zones sent at once to a worker when building in parallel
+POOL_CHUNKSIZE = 16
+
+VALID_CLASSES = ('A', 'C', 'CTR', 'D', 'E', 'GP', 'P', 'Q', 'R', 'W')
+
+altitude_re = re.compile(r'(?:FL\s*(?P<flevel>\d+)'
+                         r'|(?P<alti>\d+)\s*(?P<unit>[MF])\s*(?P<ref>AGL|ASFC|SFC|AMSL|ASL)'
+                         r'|(?P<nolimit>UNL)'
+                         r'|(?P<fromground>SFC|GND))')
+
+class OpenAirException(error.ASCException):
+    def __init__(self, lineno, message):
+        error.ASCException.__init__(self, lineno, message)
+        self.lineno = lineno
+        self.message = message
+
+    def __str__(self):
+        return "line %d: %s" % (self.lineno, self.message)
+
+def parseAltitude(raw):
+    """
+    Converts an AH/AL value to the altitude dict used in zones
+    meta data (same keys as the ANTLR walker: basealti, ref, flevel,
+    nolimit, fromground). Returns None if 'raw' is not understood.
+    Only the first altitude is kept when several are given
+    (eg. 'FL115 3300F ASFC').
+    """
+    m = altitude_re.match(raw)
+    if not m:
+        return None
+
+    altispecif = {}
+    if m.group('flevel'):
+        altispecif['flevel'] = int(m.group('flevel'))
+    elif m.group('alti'):
+        altispecif['basealti'] = (float(m.group('alti')), m.group('unit'))
+        if m.group('ref') in ('AMSL', 'ASL'):
+            altispecif['ref'] = 'AMSL'
+        else:
+            altispecif['ref'] = 'AGL'
+    elif m.group('nolimit'):
+        altispecif['nolimit'] = True
+    else:
+        altispecif['fromground'] = True
+    return altispecif
+
+def iterRecords(fin):
+    """
+    Yields (lineno, keyword, value) for every OpenAir record
+    read from the file object 'fin'. Comments and blank lines
+    are skipped. For 'V' records, the keyword is 'V X' or 'V D'.
+    """
+    for lineno, line in enumerate(fin):
+        line = line.strip()
+        if not line or line[0] == '*' or line.startswith('//'):
+            continue
+
+        fields = line.split(None, 1)
+        keyword = fields[0]
+        value = fields[1] if len(fields) > 1 else ""
+
+        if keyword == 'V':
+            var, sep, value = value.partition('=')
+            keyword = 'V ' + var.strip()
+
+        yield (lineno + 1, keyword, value.strip())
+
+def iterZoneRecords(fin):
+    """
+    Splits the records of 'fin' at 'AC' boundaries and yields
+    the list of records for each zone. Records found before the
+    first 'AC' are dropped.
+    """
+    records = None
+    for record in iterRecords(fin):
+        if record[1] == 'AC':
+            if records:
+                yield records
+            records = [record]
+        elif records is not None:
+            records.append(record)
+    if records:
+        yield records
+
+def settingsKey(version=None):
+    """
+    Returns the geometry settings (util.QUADSEG, util.ARC_TOLERANCE)
+    and the parser version ('version' or PARSER_VERSION) the zones
+    are built with, as a string.
+    """
+    if version is None:
+        version = PARSER_VERSION
+    return "q%d-t%s-v%s" % (util.QUADSEG, util.ARC_TOLERANCE, version)
+
+def fingerprintRecords(records):
+    """
+    Returns a digest of the content of the records of a zone and of
+    the settings it is built with (see settingsKey()).
+    Line numbers, comments and blank lines are not part of it, so
+    moving a zone in the file does not change its fingerprint.
+    """
+    h = hashlib.sha1()
+    h.update(settingsKey() + "\n")
+    for lineno, keyword, value in records:
+        h.update("%s %s\n" % (keyword, value))
+    return h.hexdigest()
+
+def _convZoneCoords(records):
+    """
+    Converts all the coordinates found in the records of a zone
+    at once. Returns a list of (lon, lat), in records order.
+    """
+    raws = []
+    linenos = []
+    for lineno, keyword, value in records:
+        if keyword in ('DP', 'V X'):
+            raws.append(value)
+            linenos.append(lineno)
+        elif keyword == 'DB':
+            raw1, sep, raw2 = value.partition(',')
+            raws += [raw1.strip(), raw2.strip()]
+            linenos += [lineno, lineno]
+
+    lonlats = util.rawLatLonConvToLonLatArray(raws)
+    invalid = numpy.isnan(lonlats[:, 0])
+    if invalid.any():
+        i = invalid.nonzero()[0][0]
+        raise OpenAirException(linenos[i], "invalid coordinates '%s'" % raws[i])
+    return lonlats.tolist()
+
+def buildZone(records):
+    """
+    Builds an airspace.Zone from the records of a single zone
+    as given by iterZoneRecords(). Gives the same meta dict and
+    geometry as the ANTLR walker.
+    """
+    meta = {}
+    direction = "cw"
+    center = None
+    radius = None
+    points = []
+
+    lonlats = iter(_convZoneCoords(records))
+
+    for lineno, keyword, value in records:
+        if keyword == 'AC':
+            if value not in VALID_CLASSES:
+                raise OpenAirException(lineno, "unknown class '%s'" % value)
+            meta['class'] = value
+        elif keyword == 'AN':
+            meta['name'] = value.decode('utf-8')
+        elif keyword in ('AH', 'AL'):
+            altispecif = parseAltitude(value)
+            if altispecif is None:
+                raise OpenAirException(lineno, "invalid altitude '%s'" % value)
+            meta['ceiling' if keyword == 'AH' else 'floor'] = altispecif
+        elif keyword == 'DP':
+            points.append(tuple(lonlats.next()))
+        elif keyword == 'V D':
+            direction = "ccw" if value == '-' else "cw"
+        elif keyword == 'V X':
+            center = shapely.geometry.Point(lonlats.next())
+        elif keyword == 'DB':
+            if center is None:
+                raise OpenAirException(lineno, "arc without center")
+            point1 = shapely.geometry.Point(lonlats.next())
+            point2 = shapely.geometry.Point(lonlats.next())
+            points += util.getArc2(center, point1, point2, direction)
+        elif keyword == 'DC':
+            if center is None:
+                raise OpenAirException(lineno, "circle without center")
+            try:
+                radius = float(value)
+            except ValueError:
+                raise OpenAirException(lineno, "invalid radius '%s'" % value)
+
+    lineno = records[0][0]
+    for key in ('name', 'ceiling', 'floor'):
+        if key not in meta:
+            raise OpenAirException(lineno, "zone without %s" % key)
+
+    util.debug_print(meta['name'])
+
+    if radius is not None:
+        if points:
+            raise OpenAirException(lineno, "zone has both a circle and a polygon")
+        # beware of units: radius in Nautical Mile. 1NM = 1,852km
+        geometry = util.getCircle2(center, radius * 1852)
+    else:
+        geometry = shapely.geometry.Polygon(points)
+
+    return airspace.Zone(meta, geometry, fingerprintRecords(records))
+
+def _buildZoneWkb(records):
+    # runs in pool workers: WKB is much cheaper to send back
+    # than pickled shapely objects.
+    zone = buildZone(records)
+    return (zone.meta, zone.geometry.wkb, zone.fingerprint)
+
+def iterbuild(zone_records, jobs=1):
+    """
+    Builds and yields an airspace.Zone for each item of 'zone_records'
+    (see iterZoneRecords()), in the same order.
+    If 'jobs' is not 1, zones are built by a pool of 'jobs'
+    processes (None for one per CPU).
+    """
+    if jobs == 1:
+        for records in zone_records:
+            yield buildZone(records)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for meta, wkb, fingerprint in pool.imap(_buildZoneWkb, zone_records,
+                                                POOL_CHUNKSIZE):
+            yield airspace.Zone(meta, shapely.wkb.loads(wkb), fingerprint)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def iterparse(filename, jobs=1):
+    """
+    Reads the OpenAir file 'filename' line by line and yields
+    airspace.Zone objects one at a time.
+    See iterbuild() for 'jobs'.
+    """
+    fin = open(filename)
+    try:
+        for zone in iterbuild(iterZoneRecords(fin), jobs):
+            yield zone
+    finally:
+        fin.close()
+
+def parse(filename, cache=None, jobs=1):
+    """
+    Returns the list of all airspace.Zone found in 'filename'.
+    If 'cache' (a cache.ZoneCache) is given, zones are loaded from
+    it when 'filename' has already been compiled, and stored in it
+    otherwise. See iterparse() for 'jobs'.
+    """
+    if cache is None:
+        return list(iterparse(filename, jobs))
+
+    zones = cache.load(filename)
+    if zones is None:
+        zones = list(iterparse(filename, jobs))
+        cache.store(filename, zones)
+    return zones
+
+def parseAntlr(filename):
+    """
+    Former parser, based on the ANTLR generated lexer/parser/walker
+    (see build-parser.sh). Kept for comparison purposes.
+    """
+    import antlr3
+
+    from OpenAirLexer import OpenAirLexer
+    from OpenAirParser import OpenAirParser
+    from OpenAirWalker import OpenAirWalker
 
-def parse(filename):
     finput = open(filename)
     linput = finput.read().decode('utf-8')
 
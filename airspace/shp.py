@@ -18,12 +18,16 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import os
+import os.path
+
 import osgeo.ogr
 import osgeo.osr
 
-import json
+import rtree
 import shapely.wkt
-import airspace 
+import airspace
+import airspace.candidates
 from datetime import date
 
 def setAlti(fieldName, dataDict, feature):
@@ -54,6 +58,71 @@ def setAlti(fieldName, dataDict, feature):
     feature.SetField(upFN + "_F_SFC", sfc)
     feature.SetField(upFN + "_UNL", unl)
 
+def getAlti(fieldName, feature):
+    """
+    Reverse of setAlti(): returns the altitude meta dict stored
+    in the 'fieldName' fields of 'feature'.
+    """
+    upFN = fieldName.upper()
+
+    dataDict = {}
+    alti = feature.GetField(upFN + "_ALTI")
+    flevel = feature.GetField(upFN + "_FL")
+
+    if alti:
+        value, unit = alti.split()
+        dataDict['basealti'] = (float(value), unit)
+        dataDict['ref'] = feature.GetField(upFN + "_REF")
+    elif flevel is not None and flevel != -1:
+        dataDict['flevel'] = flevel
+
+    if feature.GetField(upFN + "_F_SFC"):
+        dataDict['fromground'] = True
+    if feature.GetField(upFN + "_UNL"):
+        dataDict['nolimit'] = True
+    return dataDict
+
+def featureMeta(feature):
+    """
+    Returns the zone meta dict stored in 'feature' (see createFeature()).
+    """
+    meta = {'name' : feature.GetField("NAME"),
+            'class': feature.GetField("CLASS"),
+            'ceiling': getAlti("CEIL", feature),
+            'floor' : getAlti("FLR", feature)}
+
+    # shapefiles written before the terrain envelopes lack the fields
+    if feature.GetFieldIndex("TERR_MIN") >= 0 and feature.IsFieldSet("TERR_MIN"):
+        meta['terrain'] = (feature.GetField("TERR_MIN"), feature.GetField("TERR_MAX"))
+    return meta
+
+def createFeature(dstLayer, z):
+    meta,geometry = z.meta, z.geometry
+    buf = osgeo.ogr.CreateGeometryFromWkt(shapely.wkt.dumps(geometry))
+    feature = osgeo.ogr.Feature(dstLayer.GetLayerDefn())
+    feature.SetGeometry(buf)
+
+    feature.SetField("NAME", meta['name'].encode("utf-8"))
+    feature.SetField("CLASS", meta['class'].encode("utf-8"))
+
+    
+    setAlti("CEIL", meta['ceiling'], feature)
+    setAlti("FLR", meta['floor'], feature)
+
+    feature.SetField("START_DATE", date.today().strftime("%Y-%m-%d %H:%M"))
+    feature.SetField("STOP_DATE", date.today().strftime("%Y-%m-%d %H:%M"))
+
+    if z.fingerprint:
+        feature.SetField("SRC_HASH", z.fingerprint)
+
+    # (an older shapefile being updated has no such fields)
+    if 'terrain' in meta and feature.GetFieldIndex("TERR_MIN") >= 0:
+        feature.SetField("TERR_MIN", meta['terrain'][0])
+        feature.SetField("TERR_MAX", meta['terrain'][1])
+    
+    dstLayer.CreateFeature(feature)
+
+    feature.Destroy()
 
 def writeToShp(filename, zones):
     spatialRef = osgeo.osr.SpatialReference()
@@ -117,50 +186,162 @@ def writeToShp(filename, zones):
     dstLayer.CreateField(fieldDef)
 
 
-    for z in zones:
-        meta,geometry = z.meta, z.geometry
-        buf = osgeo.ogr.CreateGeometryFromWkt(shapely.wkt.dumps(geometry))
-        feature = osgeo.ogr.Feature(dstLayer.GetLayerDefn())
-        feature.SetGeometry(buf)
+    # fingerprint of the OpenAir records, used for incremental updates
+    fieldDef = osgeo.ogr.FieldDefn("SRC_HASH", osgeo.ogr.OFTString)
+    fieldDef.SetWidth(40)
+    dstLayer.CreateField(fieldDef)
 
-        feature.SetField("NAME", meta['name'].encode("utf-8"))
-        feature.SetField("CLASS", meta['class'].encode("utf-8"))
+    # ground levels envelope below zones with AGL limits (meters)
+    fieldDef = osgeo.ogr.FieldDefn("TERR_MIN", osgeo.ogr.OFTReal)
+    dstLayer.CreateField(fieldDef)
 
-        
-        setAlti("CEIL", meta['ceiling'], feature)
-        setAlti("FLR", meta['floor'], feature)
+    fieldDef = osgeo.ogr.FieldDefn("TERR_MAX", osgeo.ogr.OFTReal)
+    dstLayer.CreateField(fieldDef)
 
-        feature.SetField("START_DATE", date.today().strftime("%Y-%m-%d %H:%M"))
-        feature.SetField("STOP_DATE", date.today().strftime("%Y-%m-%d %H:%M"))
+    for z in zones:
+        createFeature(dstLayer, z)
+            
+    dstFile.Destroy()
         
-        dstLayer.CreateFeature(feature)
 
+def loadFingerprints(shpfile):
+    """
+    Returns the list of (fid, (class, name), fingerprint) for all
+    features in 'shpfile', or None if the shapefile has been written
+    without fingerprints.
+    """
+    srcFile = osgeo.ogr.Open(shpfile)
+    srcLayer = srcFile.GetLayer(0)
+
+    if srcLayer.GetLayerDefn().GetFieldIndex("SRC_HASH") < 0:
+        return None
+
+    fingerprints = []
+    srcLayer.ResetReading()
+    feature = srcLayer.GetNextFeature()
+    while feature:
+        fingerprints.append((feature.GetFID(),
+                             (feature.GetField("CLASS"), feature.GetField("NAME")),
+                             feature.GetField("SRC_HASH")))
         feature.Destroy()
-            
+        feature = srcLayer.GetNextFeature()
+    return fingerprints
+
+def updateShp(filename, removed_fids, zones):
+    """
+    Patches an existing shapefile written by writeToShp(): features
+    with fid in 'removed_fids' are deleted and 'zones' are appended.
+    """
+    dstFile = osgeo.ogr.Open(filename, 1)
+    dstLayer = dstFile.GetLayer(0)
+
+    for fid in removed_fids:
+        dstLayer.DeleteFeature(fid)
+    if removed_fids:
+        # shapefile deletion only marks records, really remove them
+        dstFile.ExecuteSQL("REPACK %s" % dstLayer.GetName())
+
+    for z in zones:
+        createFeature(dstLayer, z)
+
     dstFile.Destroy()
-        
 
+def indexBasename(shpfile, dimension=2):
+    """
+    Returns the base name of the spatial index files (.idx/.dat)
+    stored next to 'shpfile', for an index of 'dimension' 2 or 3
+    (see candidates.indexBounds()).
+    """
+    if shpfile.lower().endswith(".shp"):
+        basename = shpfile[:-4]
+    else:
+        basename = shpfile.rstrip(os.sep)
+    if dimension == 3:
+        basename += "-3d"
+    return basename
+
+def indexProperties(dimension):
+    properties = rtree.index.Property()
+    properties.dimension = dimension
+    return properties
+
+def writeIndex(shpfile):
+    """
+    Writes disk-backed rtree indexes of the bounding boxes of all
+    features of 'shpfile', keyed by their feature id: a 2D one and
+    a 3D one also bounded by the altitude envelope of the zones.
+    """
+    srcFile = osgeo.ogr.Open(shpfile)
+    srcLayer = srcFile.GetLayer(0)
 
-def loadFromShp(shpfile):
+    for dimension in (2, 3):
+        basename = indexBasename(shpfile, dimension)
+        for ext in (".idx", ".dat"):
+            if os.path.exists(basename + ext):
+                os.remove(basename + ext)
+
+        def bounds():
+            srcLayer.ResetReading()
+            feature = srcLayer.GetNextFeature()
+            while feature:
+                minx, maxx, miny, maxy = feature.GetGeometryRef().GetEnvelope()
+                if dimension == 2:
+                    bbox = (minx, miny, maxx, maxy)
+                else:
+                    low, high = airspace.candidates.verticalEnvelope(featureMeta(feature))
+                    bbox = (minx, miny, low, maxx, maxy, high)
+                yield (feature.GetFID(), bbox, None)
+                feature.Destroy()
+                feature = srcLayer.GetNextFeature()
+
+        properties = indexProperties(dimension)
+        if srcLayer.GetFeatureCount() > 0:
+            index = rtree.index.Index(basename, bounds(), properties=properties)
+        else:
+            # bulk loading refuses empty streams
+            index = rtree.index.Index(basename, properties=properties)
+        index.close()
+    srcFile.Destroy()
+
+def openIndex(shpfile, dimension=2):
+    """
+    Opens the index of 'dimension' written by writeIndex() for
+    'shpfile'. Returns None if there is no such index.
+    """
+    basename = indexBasename(shpfile, dimension)
+    if not os.path.exists(basename + ".idx"):
+        return None
+    return rtree.index.Index(basename, properties=indexProperties(dimension))
+
+def memoryIndex(zones, dimension=2):
+    """
+    Builds an in-memory rtree index of the bounding boxes of
+    'zones', a dict: id -> Zone. To be used when there is no
+    index on disk (see openIndex()).
+    """
+    index = rtree.index.Index(properties=indexProperties(dimension))
+    for fid, zone in zones.items():
+        index.add(fid, airspace.candidates.indexBounds(zone, dimension))
+    return index
+
+def loadFromShp(shpfile, fids=None):
+    """
+    Loads all zones of 'shpfile', or only the features with
+    their id in 'fids' (in that order).
+    """
     srcFile = osgeo.ogr.Open(shpfile)
     srcLayer = srcFile.GetLayer(0)
     
     zones = []
 
-    for i in range(srcLayer.GetFeatureCount()):
+    if fids is None:
+        fids = range(srcLayer.GetFeatureCount())
+
+    for i in fids:
         feature = srcLayer.GetFeature(i)
-        name = feature.GetField("NAME")
-        aclass = feature.GetField("CLASS")
-        ceiling = feature.GetField("CEILING")
-        floor = feature.GetField("FLOOR")
         geometry = feature.GetGeometryRef()
-        
-        meta = {'name' : name,
-                'class': aclass,
-                'ceiling': json.loads(ceiling),
-                'floor' : json.loads(floor)}
+        meta = featureMeta(feature)
         sh_geometry = shapely.wkt.loads(geometry.ExportToWkt())
 
         zones.append(airspace.Zone(meta,sh_geometry))
     return zones
-
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy
+import shapely.geometry
+
+import classify
+
+# half size (degrees) of the box around the aircraft for which
+# candidate zones are kept (~5km in latitude)
+NEIGHBOURHOOD = 0.05
+
+class ZoneEvent:
+    """
+    Entry in (kind == 'entry') or exit from (kind == 'exit') 'zone',
+    found between fix number 'index' and the following one, at the
+    interpolated 'point' (lon, lat, alt) and 'time'.
+    """
+    def __init__(self, kind, zone, index, point, time=None):
+        self.kind = kind
+        self.zone = zone
+        self.index = index
+        self.point = point
+        self.time = time
+
+    def __repr__(self):
+        return "ZoneEvent(%s, %s, %s, %s)" % (self.kind, self.zone.meta['name'],
+                                              self.point, self.time)
+
+class StreamingChecker:
+    """
+    Checks a track fed one fix at a time (see feed()), for live
+    tracking. Candidate zones are taken from the spatial index for
+    a box of +/- 'neighbourhood' degrees around the aircraft, and
+    the index is only queried again when the aircraft leaves it.
+    'zones' is a dict: id -> Zone, 'spatial_index' an rtree index
+    keyed by the same ids and 'altir' the AltiResolver used for AGL
+    limits.
+    """
+    def __init__(self, zones, spatial_index, altir, neighbourhood=NEIGHBOURHOOD):
+        self.zones = zones
+        self.spatial_index = spatial_index
+        self.altir = altir
+        self.neighbourhood = neighbourhood
+
+        self.box = None
+        self.candidates = set()
+        # ids of the zones we are inside
+        self.inside = set()
+        self._edges = {}
+        self.last = None
+        self.count = 0
+        self.queries = 0
+
+    def _inBox(self, lon, lat):
+        minx, miny, maxx, maxy = self.box
+        return minx <= lon <= maxx and miny <= lat <= maxy
+
+    def _updateNeighbourhood(self, lon, lat):
+        n = self.neighbourhood
+        box = (lon - n, lat - n, lon + n, lat + n)
+        if self.last is not None:
+            # the last segment must stay covered
+            plon, plat = self.last[0], self.last[1]
+            box = (min(box[0], plon), min(box[1], plat),
+                   max(box[2], plon), max(box[3], plat))
+        self.box = box
+        self.candidates = set(self.spatial_index.intersection(box))
+        self.queries += 1
+
+        for fid in self._edges.keys():
+            if fid not in self.candidates and fid not in self.inside:
+                del self._edges[fid]
+
+    def _edgesOf(self, fid):
+        edges = self._edges.get(fid)
+        if edges is None:
+            edges = classify.polygonEdges(self.zones[fid].geometry)
+            self._edges[fid] = edges
+        return edges
+
+    def _crossings(self, fid, fixes, was_inside):
+        # events of zone 'fid' on the last segment (or at the first fix),
+        # and whether the aircraft ends inside it
+        zone = self.zones[fid]
+        points = numpy.array([f[:3] for f in fixes], dtype=float)
+        times = None
+        if None not in [f[3] for f in fixes]:
+            times = numpy.array([f[3] for f in fixes], dtype=float)
+
+        # exact limits at both ends (see VerticalLimits.at())
+        floors, ceils = zone.limits.at(self.altir, points[:, 0], points[:, 1],
+                                       points[:, 2])
+        mask, crossings = classify.findCrossings(points, zone.geometry, floors, ceils,
+                                                 times, self._edgesOf(fid), was_inside)
+        now_inside = was_inside
+        if crossings:
+            now_inside = crossings[-1].kind == 'entry'
+        first = self.count - len(fixes) + 1
+        return ([ZoneEvent(c.kind, zone, first + c.index, c.point, c.time)
+                 for c in crossings], now_inside)
+
+    def feed(self, lon, lat, alt, time=None):
+        """
+        Processes a new fix (alt in meters, time in seconds).
+        Returns the list of ZoneEvent found since the previous fix,
+        including the zones entered and left between both fixes.
+        """
+        fix = (lon, lat, alt, time)
+        if self.box is None or not self._inBox(lon, lat):
+            self._updateNeighbourhood(lon, lat)
+
+        if self.last is None:
+            fixes = [fix]
+        else:
+            fixes = [self.last, fix]
+        if len(fixes) == 1 or self.last[:2] == fix[:2]:
+            shape = shapely.geometry.Point(lon, lat)
+        else:
+            shape = shapely.geometry.LineString([self.last[:2], fix[:2]])
+        events = []
+        inside = set()
+        for fid in self.candidates | self.inside:
+            was_inside = fid in self.inside
+            if not was_inside and not self.zones[fid].prepared.intersects(shape):
+                continue
+            zone_events, now_inside = self._crossings(fid, fixes, was_inside)
+            events += zone_events
+            if now_inside:
+                inside.add(fid)
+
+        self.inside = inside
+        self.last = fix
+        self.count += 1
+        return events
+
+    def insideZones(self):
+        """
+        Returns the zones the aircraft is currently in.
+        """
+        return [self.zones[fid] for fid in self.inside]
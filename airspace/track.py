@@ -26,9 +26,169 @@
 #####################################################################################
 
 import re
-import util
+import time
+import calendar
+import xml.etree.cElementTree
+import os
+import numpy
 import osgeo.ogr
 import shapely.wkt
+import shapely.geometry
+
+fraction_re = re.compile(r'\.\d+')
+offset_re = re.compile(r'([+-])(\d\d):?(\d\d)$')
+
+def parseGpxTime(raw):
+    """
+    Converts a GPX time ('2011-04-07T10:42:03Z', optionally with
+    fractional seconds, 'Z' or a '+HH:MM' UTC offset) to seconds
+    since the epoch (UTC). Times without offset are taken as UTC.
+    """
+    raw = raw.strip()
+    seconds = calendar.timegm(time.strptime(raw[:19], "%Y-%m-%dT%H:%M:%S"))
+    end = 19
+    frac = fraction_re.match(raw, end)
+    if frac:
+        seconds += float(frac.group(0))
+        end = frac.end()
+    offset = offset_re.match(raw, end)
+    if offset:
+        sign, hours, minutes = offset.groups()
+        shift = int(hours) * 3600 + int(minutes) * 60
+        seconds -= shift if sign == '+' else -shift
+    return seconds
+
+def iterGpxPoints(gpxfilename):
+    """
+    Reads the track points of a GPX file one at a time and yields
+    (lon, lat, ele, time) with the raw strings of the file, 'ele' and
+    'time' are None when missing. None is yielded at the end of each
+    track segment.
+    """
+    for event, elem in xml.etree.cElementTree.iterparse(gpxfilename):
+        if elem.tag.endswith('trkseg'):
+            elem.clear()
+            yield None
+            continue
+        if not elem.tag.endswith('trkpt'):
+            continue
+        ele, t = None, None
+        for child in elem:
+            if child.tag.endswith('ele'):
+                ele = child.text
+            elif child.tag.endswith('time'):
+                t = child.text
+        yield (elem.get('lon'), elem.get('lat'), ele, t)
+        elem.clear()
+
+def iterGpxFixes(gpxfilename):
+    """
+    Reads the track points of a GPX file one at a time and yields
+    (lon, lat, ele, time) for each one, 'time' in seconds since the
+    epoch. 'ele' and 'time' are None when missing.
+    """
+    for point in iterGpxPoints(gpxfilename):
+        if point is None:
+            continue
+        lon, lat, ele, t = point
+        yield (float(lon), float(lat),
+               None if ele is None else float(ele),
+               None if t is None else parseGpxTime(t))
+
+def parseGpxTimes(raws):
+    """
+    Converts a list of GPX times to an array of seconds since the
+    epoch (see parseGpxTime()), NaN for None.
+    """
+    res = numpy.empty(len(raws))
+    res.fill(numpy.nan)
+    known = [i for i, raw in enumerate(raws) if raw is not None]
+    if not known:
+        return res
+
+    stripped = [raws[i].strip() for i in known]
+    # a single conversion for the usual UTC times ('Z'), one
+    # parseGpxTime() call per time when some have a UTC offset
+    if all(raw.endswith('Z') for raw in stripped):
+        try:
+            stamps = numpy.array([raw[:-1] for raw in stripped], dtype='datetime64[us]')
+            res[known] = stamps.astype(numpy.int64) / 1e6
+            return res
+        except ValueError:
+            pass
+    res[known] = [parseGpxTime(raw) for raw in stripped]
+    return res
+
+class TrackSegment:
+    """
+    Points of a GPX track segment as float64 arrays: 'lons', 'lats',
+    'eles' (NaN when missing) and 'times' (seconds since the epoch,
+    NaN when missing).
+    """
+    def __init__(self, lons, lats, eles, times):
+        self.lons = lons
+        self.lats = lats
+        self.eles = eles
+        self.times = times
+        self._geometry = None
+
+    def __len__(self):
+        return len(self.lons)
+
+    def hasTimes(self):
+        return not numpy.isnan(self.times).any()
+
+    def coords(self):
+        """
+        Returns the (N,3) array of (lon, lat, ele), missing
+        elevations set to 0.
+        """
+        return numpy.column_stack((self.lons, self.lats,
+                                   numpy.nan_to_num(self.eles)))
+
+    def geometry(self):
+        """
+        Returns the segment as a 3D shapely LineString, built on
+        the first call.
+        """
+        if self._geometry is None:
+            self._geometry = shapely.geometry.LineString(self.coords())
+        return self._geometry
+
+def _makeSegment(points, projection):
+    lons, lats, eles, times = zip(*points)
+    lons = numpy.array(lons, dtype=numpy.float64)
+    lats = numpy.array(lats, dtype=numpy.float64)
+    if projection is not None:
+        lons, lats = projection(lons, lats)
+    eles = numpy.array(['nan' if e is None else e for e in eles], dtype=numpy.float64)
+    return TrackSegment(lons, lats, eles, parseGpxTimes(times))
+
+def loadGpxSegments(gpxfilename, projection=None):
+    """
+    Loads the track segments of a GPX file as a list of
+    TrackSegment, empty segments left out. If 'projection' (a
+    pyproj.Proj) is given, the WGS84 coordinates of the file are
+    projected (lons and lats are then x and y).
+    """
+    segments = []
+    points = []
+    for point in iterGpxPoints(gpxfilename):
+        if point is not None:
+            points.append(point)
+        elif points:
+            segments.append(_makeSegment(points, projection))
+            points = []
+    if points:
+        segments.append(_makeSegment(points, projection))
+    return segments
+
+def lineSegments(segments):
+    """
+    Returns the segments of 'segments' (TrackSegment) that are lines,
+    i.e. have at least 2 points.
+    """
+    return [s for s in segments if len(s) >= 2]
 
 def loadSimpleTxt(txtfile):
     fin = open(txtfile, "r")
@@ -44,16 +204,30 @@ def loadSimpleTxt(txtfile):
 
 def loadFromGpxToShapely(gpxfilename, detectProjection=True):
     """
-    From a GPX, loads all lines/multilines and returns
-    a list of shapely representation
+    From a GPX, loads all track segments that are lines and returns
+    a list of shapely representation (see lineSegments()).
+    'detectProjection' is unused, GPX coordinates are always WGS84.
     """
-    return [shapely.wkt.loads(x) for x in loadFromGpx(gpxfilename, detectProjection)]
+    return [s.geometry() for s in lineSegments(loadGpxSegments(gpxfilename))]
 
 def loadFromGpx(gpxfilename, detectProjection=True):
     """
     From a GPX, loads all lines/multilines and returns
     WKT representation
     """
+    # needed for loading elevation data from GPX.
+    # if not set, then elevation is not set (=>0)
+    previous = os.environ.get('GPX_ELE_AS_25D')
+    os.environ['GPX_ELE_AS_25D'] = 'YES'
+    try:
+        return _loadFromGpx(gpxfilename, detectProjection)
+    finally:
+        if previous is None:
+            del os.environ['GPX_ELE_AS_25D']
+        else:
+            os.environ['GPX_ELE_AS_25D'] = previous
+
+def _loadFromGpx(gpxfilename, detectProjection):
     driver = osgeo.ogr.GetDriverByName('GPX')
     dataSource = driver.Open(gpxfilename, 0)
     geoms_to_return = []
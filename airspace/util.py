@@ -23,13 +23,14 @@ import osgeo.ogr
 import osgeo.osr
 import os
 import os.path
-import sys
 import math
 
+import numpy
 import pyproj
 import shapely.geometry
 
 import altiresolver
+import limits
 
 DEBUG=False
 
@@ -41,10 +42,12 @@ latlong.ImportFromProj4('+proj=latlong')
 
 geod_wgs84 = pyproj.Geod(ellps='WGS84')
 
-# needed for loading elevation data from GPX.
-# if not set, then elevation is not set (=>0)
-os.environ['GPX_ELE_AS_25D'] = 'YES'
 QUADSEG=90
+# maximum distance (meters) between an arc and its chords. If None,
+# circles and arcs use QUADSEG segments per quarter whatever their radius.
+ARC_TOLERANCE=None
+# arc vertices closer than this fraction of a step to an arc end are dropped
+ARC_SNAP=0.1
 
 def debug_print(s):
     if DEBUG:
@@ -55,114 +58,186 @@ class InvalidDataException(Exception):
         self.message = message
 
 
-def getCircle2(center, radius, quadseg=QUADSEG):
+def getQuadSeg(radius, tolerance=None):
     """
-    Returns a polygon object approximating a circle centered on
-    'center' with a radius 'radius'. Radius in meters.
+    Returns the number of segments per quarter of circle to use for
+    a circle of 'radius' meters so that chords are never further
+    than 'tolerance' meters (ARC_TOLERANCE by default) from the arc.
+    Returns QUADSEG if no tolerance is set.
     """
+    if tolerance is None:
+        tolerance = ARC_TOLERANCE
+    if tolerance is None:
+        return QUADSEG
+    if tolerance >= radius:
+        return 1
+
+    # sagitta of a chord spanning 'angle': radius * (1 - cos(angle/2))
+    max_angle = math.degrees(2 * math.acos(1 - float(tolerance) / radius))
+    return max(1, int(math.ceil(90.0 / max_angle)))
+
+def getPointsAtAzimuths(center_x, center_y, azimuths, radius):
+    """
+    Returns a (N,2) array of (lon, lat) points at 'radius' meters
+    (scalar or one per point) of the center, in the directions given
+    by the 'azimuths' array (degrees). Single geodesic pass.
+    """
+    n = len(azimuths)
+    radius = numpy.asarray(radius, dtype=numpy.float64)
+    if radius.ndim == 0:
+        radius = numpy.repeat(radius, n)
+
+    lons, lats, backaz = geod_wgs84.fwd(numpy.repeat(float(center_x), n),
+                                        numpy.repeat(float(center_y), n),
+                                        numpy.asarray(azimuths, dtype=numpy.float64),
+                                        radius)
+    return numpy.column_stack((lons, lats))
+
+def getCirclePoints(center_x, center_y, radius, start_az, span, quadseg=None):
+    """
+    Returns a (N,2) array of (lon, lat) points at 'radius' meters
+    of the center, starting at azimuth 'start_az' (degrees) and
+    going clockwise for 'span' degrees (counterclockwise if 'span'
+    is negative).
+    """
+    quadseg = quadseg or getQuadSeg(numpy.max(radius))
+    nseg = max(1, int(math.ceil(abs(span) * quadseg / 90.0)))
+    azimuths = start_az + numpy.linspace(0.0, span, nseg + 1)
+    return getPointsAtAzimuths(center_x, center_y, azimuths, radius)
 
-    long2, lat2, invangle = geod_wgs84.fwd(center.x, center.y, 0, radius)
-
-    return getCircleByPoints(center, shapely.geometry.Point(long2, lat2))
+def getGridAzimuths(start_az, span, quadseg=None):
+    """
+    Returns the azimuths of the vertices of a full circle (multiples
+    of 90/quadseg degrees, see getCircle2()) strictly inside the arc
+    starting at 'start_az' and going for 'span' degrees (clockwise if
+    positive), in the arc order. Vertices closer than ARC_SNAP step
+    to an end of the arc are left out.
+    """
+    quadseg = quadseg or QUADSEG
+    step = 90.0 / quadseg
+    eps = step * ARC_SNAP
+    end_az = start_az + span
+    if span > 0:
+        first = math.floor((start_az + eps) / step) + 1
+        last = math.ceil((end_az - eps) / step) - 1
+        ks = numpy.arange(first, last + 1)
+    else:
+        first = math.ceil((start_az - eps) / step) - 1
+        last = math.floor((end_az + eps) / step) + 1
+        ks = numpy.arange(first, last - 1, -1)
+    # same azimuths as the ones used by getCircle2()
+    return (ks % (4 * quadseg)) * step
 
-def getCircleByPoints(center, point, quadseg=QUADSEG):
+def getCircle2(center, radius, quadseg=None):
     """
     Returns a polygon object approximating a circle centered on
     'center' with a radius 'radius'. Radius in meters.
+    The number of segments per quarter is given by getQuadSeg()
+    if 'quadseg' is not given.
     """
+    points = getCirclePoints(center.x, center.y, radius, 0.0, 360.0, quadseg)
+    points[-1] = points[0]
+    return shapely.geometry.Polygon(points)
 
-    dstproj = pyproj.Proj('+proj=ortho +lon_0=%f +lat_0=%f' % (center.x, center.y))
-    srcproj = pyproj.Proj(ellps='WGS84', proj='latlong')
-    new_cx, new_cy = pyproj.transform(srcproj, dstproj, center.x, center.y)
-    new_px, new_py = pyproj.transform(srcproj, dstproj, point.x, point.y)
+def getCircleByPoints(center, point, quadseg=None):
+    """
+    Returns a polygon object approximating a circle centered on
+    'center' and going through 'point'.
+    """
+    az, backaz, radius = geod_wgs84.inv(center.x, center.y, point.x, point.y)
+    points = getCirclePoints(center.x, center.y, radius, az, 360.0, quadseg)
+    points[-1] = points[0]
+    return shapely.geometry.Polygon(points)
 
-    s_c = shapely.geometry.Point(new_cx, new_cy)
-    s_p = shapely.geometry.Point(new_px, new_py)
+def getArc2(center, point1, point2, direction="ccw", quadseg=None):
+    """
+    Returns the list of points of the arc centered on 'center', from
+    'point1' to 'point2' going in 'direction' ("cw" or "ccw").
+    The arc ends are the given points. In between, vertices are at the
+    same azimuths as the ones of getCircle2() (the first and last ones
+    are computed from the azimuths of the ends, no vertex search), so
+    arcs follow the circle built for the same center and radius.
+    If both points are not at the same distance of the center, the
+    radius is linearly interpolated (wrt. azimuth) from one to the other.
+    """
+    az1, backaz, radius1 = geod_wgs84.inv(center.x, center.y, point1.x, point1.y)
+    az2, backaz, radius2 = geod_wgs84.inv(center.x, center.y, point2.x, point2.y)
 
-    circle = s_c.buffer(s_c.distance(s_p), quadseg)
-    
-    cpoints = []
-    # project back to lat/lon
-    for px,py in circle.exterior.coords:
-        x,y = pyproj.transform(dstproj, srcproj, px, py)
-        cpoints.append((x,y))
-    return shapely.geometry.Polygon(cpoints)
-
-def getArc2(center, point1, point2, direction="ccw"):
-    az1,az2,arc_radius = geod_wgs84.inv(point1.x, point1.y, center.x, center.y)
-    az1,az2,arc_radius2 = geod_wgs84.inv(point2.x, point2.y, center.x, center.y)
-
-    if arc_radius != arc_radius2:
+    if radius1 != radius2:
         debug_print("WARNING, invalid arc (distances center/p1|p2 are not the same) ")
-##        raise InvalidDataException("%f / %f" %(arc_radius, arc_radius2))
-        
-
-    radius = shapely.geometry.Point(point1).distance(shapely.geometry.Point(point2))
-
-    circle = getCircleByPoints(center, point1)
-    
-    circle_ls = circle.exterior.coords
-    ((lp1,lp1_idx), (lp2, lp2_idx)) = findNearestPoints2(circle_ls, point1, point2)
-    
-    points = []
-
-    si,ei = lp1_idx, lp2_idx
-
-    if si > ei:
-        if direction == "ccw":
-            points += list(point1.coords) + [x for x in reversed(list(circle_ls)[ei+1:si])] + list(point2.coords)
-        else:
-            points += list(point1.coords) + list(circle_ls)[si+1:]
-            points += list(circle_ls)[:ei] + list(point2.coords)
-    else: # si <= ei
-        if direction == "ccw":
-            points += list(point1.coords) + [x for x in reversed(list(circle_ls)[0:si])] 
-            points += [x for x in reversed(list(circle_ls)[ei+1:])] + list(point2.coords)
-        else:
-            points += list(point1.coords) + list(circle_ls)[si+1:ei] + list(point2.coords)
-
-    return points
-    
-
-def findNearestPoints2(line, point1, point2):
-    d1 = None
-    nn1 = None
-    nn1_idx = None
+##        raise InvalidDataException("%f / %f" %(radius1, radius2))
 
-    d2 = None
-    nn2 = None
-    nn2_idx = None
-
-    for idx_p, p in enumerate(line) :
-        sp = shapely.geometry.Point(p)
-        td1 = point1.distance(sp)
-        td2 = point2.distance(sp)
+    if direction == "ccw":
+        span = -((az1 - az2) % 360.0) or -360.0
+    else:
+        span = (az2 - az1) % 360.0 or 360.0
 
-        if not d1 or td1 < d1 :
-            d1 = td1
-            nn1 = sp
-            nn1_idx = idx_p
-        if not d2 or td2 < d2 :
-            d2 = td2
-            nn2 = sp
-            nn2_idx = idx_p
+    quadseg = quadseg or getQuadSeg(max(radius1, radius2))
+    azimuths = getGridAzimuths(az1, span, quadseg)
+    # angular distance from the arc start, whatever the azimuths range
+    done = ((azimuths - az1) * math.copysign(1.0, span)) % 360.0
+    radius = radius1 + (radius2 - radius1) * done / abs(span)
+    arc = getPointsAtAzimuths(center.x, center.y, azimuths, radius)
 
-    return ((nn1, nn1_idx), (nn2, nn2_idx))
+    return list(point1.coords) + [tuple(p) for p in arc] + list(point2.coords)
 
 
 coords = '(?P<lat%s>\d+:\d+(:|\.)\d+)\s?(?P<d1%s>[NSns]) (?P<lon%s>\d+:\d+(:|\.)\d+)\s?(?P<d2%s>[EWew])'
+coords_re = re.compile(coords % ("","","",""))
+
+# same as coords, with minutes (and their decimals) and seconds in
+# their own groups, matching whole lines (see rawLatLonConvToLonLatArray())
+coords_split_re = re.compile('^(\d+):(\d+\.\d+|\d+(?=:)):?(\d*)\s?([NSns]) (\d+):(\d+\.\d+|\d+(?=:)):?(\d*)\s?([EWew])[^\n]*$', re.M)
 
 def rawLatLonConv(raw):
-    m = re.match(coords % ("","","",""), raw)
+    m = coords_re.match(raw)
     if m:
         return latlon_to_deg(m)
 
 def rawLatLonConvToLonLat(raw):
-    m = re.match(coords % ("","","",""), raw)
+    m = coords_re.match(raw)
     if m:
         lat,lon = latlon_to_deg(m)
         return (lon,lat)
-        
+
+def rawLatLonConvToLonLatArray(raws):
+    """
+    Batch version of rawLatLonConvToLonLat(): converts a sequence of
+    raw coordinates strings to a (N,2) array of (lon, lat).
+    Rows for strings that can't be parsed are set to NaN.
+    """
+    n = len(raws)
+    res = numpy.empty((n, 2))
+    res.fill(numpy.nan)
+
+    # a single regexp pass over all the strings, only falling back
+    # to one match per string to find out which ones are invalid.
+    valid = slice(None)
+    groups = coords_split_re.findall("\n".join(raws))
+    if len(groups) != n:
+        valid = []
+        groups = []
+        for i, raw in enumerate(raws):
+            m = coords_split_re.match(raw)
+            if m:
+                valid.append(i)
+                groups.append(m.groups())
+    if not groups:
+        return res
+
+    g = numpy.array(groups, dtype='S16')
+    for secs in (g[:, 2], g[:, 6]):
+        secs[secs == ''] = '0'
+    # lat deg, min, sec, lon deg, min, sec
+    dms = g[:, [0, 1, 2, 4, 5, 6]].astype(numpy.float64)
+    hemis = g[:, [3, 7]]
+
+    res[valid] = (dms[:, [3, 0]] + dms[:, [4, 1]] / 60.0 + dms[:, [5, 2]] / 3600.)
+    negative = (hemis[:, [1, 0]] == numpy.array(['W', 'S'])) | \
+        (hemis[:, [1, 0]] == numpy.array(['w', 's']))
+    res[valid] = numpy.where(negative, -res[valid], res[valid])
+    return res
+
 def latlonStr_to_deg(lat, latdir, lon, londir):
     """
     Converts various lat/lon string coordinates representation
@@ -175,14 +250,14 @@ def latlonStr_to_deg(lat, latdir, lon, londir):
         lat_deg = lats[0] + lats[1]/60.0 + lats[2]/3600.
     elif len(lats) == 2: ## hours, mins.decimals
         lat_deg = lats[0] + lats[1]/60.0
-    if latdir == "S":
+    if latdir.upper() == "S":
         lat_deg = -lat_deg
 
     if len(lons) == 3: ## hours,mins,secs
         lon_deg = lons[0] + lons[1]/60.0 + lons[2]/3600.
     elif len(lons) == 2: ## hours, mins.decimals
         lon_deg = lons[0] + lons[1]/60.0
-    if londir == "W":
+    if londir.upper() == "W":
         lon_deg = -lon_deg
 
     return (lat_deg, lon_deg)
@@ -208,6 +283,15 @@ def latlon_to_deg(m, i=None):
     
     return latlonStr_to_deg(lat, latdir, lon, londir)
 
+def vertexCount(geometry):
+    """
+    Returns the number of vertices of all the rings (exteriors and
+    interiors) of 'geometry', a Polygon or a MultiPolygon.
+    """
+    if geometry.geom_type == 'MultiPolygon':
+        return sum([vertexCount(p) for p in geometry.geoms])
+    return sum([len(ring.coords) for ring in [geometry.exterior] + list(geometry.interiors)])
+
 def getSubLineStringInZone(linestring, zone):
     linestrings = []
 
@@ -254,59 +338,19 @@ def writeGeometriesToShapeFile(geometries, shapefile):
 
 
 def getCeilAtPoint(altir, metazone, lon, lat):
-    ## missing AGL, ASFC, GND
-    metaceils = metazone['ceiling']
-    ceils = []
-
-    for ceil_spec in metaceils:
-        if 'flevel' in ceil_spec:
-            ceils.append(ceil_spec['flevel'] * 100 * 0.3048)
-        elif 'ref' in ceil_spec and ceil_spec['ref'] == 'SFC':
-            # not 100% true, as SFC is not at 0 MSL.
-            # approx valid when flying outside of a cave.
-            #
-            # /!\ does not really make sense to use SFC for the ceiling...
-            ceils.append(0)
-        elif 'nolimit' in ceil_spec:
-            ceils.append(sys.maxint)
-        elif 'ref' in ceil_spec and ceil_spec['ref'] == 'AMSL':
-            ceils.append(ceil_spec['basealti'])
-        elif 'ref' in ceil_spec and ceil_spec['ref'] == "AGL":
-            ground_level = altir.getGroundLevelAt(lat,lon)
-            ceils.append(ceil_spec['basealti'] + ground_level)
-        else:
-            print "FIXME, error"
-            print ceil_spec
-            print metazone
-            sys.exit(-1)
-
-        return max(ceils)
+    """
+    Returns the ceiling (meters) of the zone described by 'metazone'
+    at the given point. See limits.VerticalLimits to evaluate many
+    points at once.
+    """
+    floors, ceils = limits.VerticalLimits(metazone).at(altir, [lon], [lat])
+    return ceils[0]
 
 def getFloorAtPoint(altir, metazone, lon, lat):
-    ## missing AGL, ASFC, GND
-    metafloors = metazone['floor']
-
-    floors = []
-    
-    for floor_spec in metafloors:
-        if 'flevel' in floor_spec:
-            floors.append(floor_spec['flevel'] * 100 * 0.3048)
-        elif 'ref' in floor_spec and floor_spec['ref'] == "SFC":
-            # not 100% true, as SFC is not at 0 MSL.
-            # approx valid when flying outside of a cave.
-            floors.append(0)
-        elif 'nolimit' in floor_spec:
-            # does not make sense to use UNL as floor.
-            floors.append(sys.maxint)
-        elif 'ref' in floor_spec and floor_spec['ref'] == "AMSL":
-            floors.append(floor_spec['basealti'])
-        elif 'ref' in floor_spec and floor_spec['ref'] == "AGL":
-            ground_level = altir.getGroundLevelAt(lat,lon)
-            floors.append(floor_spec['basealti'] + ground_level)
-        else:
-            print "FIXME, ERROR!"
-            print floor_spec
-            print metazone
-            sys.exit(-1)
-            
-    return max(floors)
+    """
+    Returns the floor (meters) of the zone described by 'metazone'
+    at the given point. See limits.VerticalLimits to evaluate many
+    points at once.
+    """
+    floors, ceils = limits.VerticalLimits(metazone).at(altir, [lon], [lat])
+    return floors[0]
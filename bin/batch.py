@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import glob
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+
+import airspace
+import airspace.shp
+import airspace.track
+import airspace.candidates
+import airspace.checker
+import airspace.altiresolver
+import airspace.error
+
+# zones, spatial index and resolver, set up once in the parent
+# before the workers are forked so that they share them
+_context = {}
+
+def findTracks(inputs):
+    """
+    Returns the sorted list of GPX files found in 'inputs': files,
+    directories (searched recursively) or glob patterns.
+    """
+    found = set()
+    for inp in inputs:
+        if os.path.isdir(inp):
+            for dirpath, dirnames, filenames in os.walk(inp):
+                for f in filenames:
+                    if f.lower().endswith(".gpx"):
+                        found.add(os.path.join(dirpath, f))
+        else:
+            found.update(glob.glob(inp))
+    return sorted(found)
+
+def loadDone(output):
+    """
+    Returns the set of tracks already checked in the JSON lines file
+    'output'. Tracks whose check failed are not part of it, so that
+    they are checked again (their new line is appended). A partly
+    written last line (interrupted run) is removed.
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+
+    fin = open(output, "rb+")
+    try:
+        good = 0
+        for line in iter(fin.readline, ""):
+            # the next line would be glued to a line without its end
+            if not line.endswith("\n"):
+                break
+            try:
+                res = json.loads(line)
+            except ValueError:
+                break
+            if 'error' not in res:
+                done.add(res['track'])
+            good += len(line)
+        fin.truncate(good)
+    finally:
+        fin.close()
+    return done
+
+def initWorker(shapefile):
+    # a disk-backed index must not share its file handles with
+    # other processes
+    if _context['disk_index']:
+        _context['index'] = airspace.shp.openIndex(shapefile, 3)
+
+def checkTrack(path):
+    """
+    Checks the GPX file 'path' against the shared zones (runs in
+    workers). Returns the JSON line describing the result.
+    """
+    start = time.time()
+    res = {'track': path}
+    try:
+        segments = airspace.track.lineSegments(airspace.track.loadGpxSegments(path))
+        if not segments:
+            raise airspace.error.ASCException("no track found")
+        times = None
+        if all(s.hasTimes() for s in segments):
+            times = [s.times for s in segments]
+
+        stats = airspace.candidates.CandidateStats()
+        track_candidates = airspace.candidates.findCandidates(
+            _context['index'], [s.geometry() for s in segments],
+            _context['chunk_points'], stats)
+        confirmed = airspace.checker.confirmZones(track_candidates, _context['zones'],
+                                                  _context['altir'],
+                                                  _context['chunk_points'], times, stats)
+        # levels kept by a store are written once per track
+        _context['altir'].flush()
+
+        res['zones'] = []
+        for zone, (parts, crossings) in confirmed.items():
+            res['zones'].append({
+                    'name': zone.meta['name'],
+                    'class': zone.meta['class'],
+                    'crossings': [{'kind': c.kind,
+                                   'lon': c.point[0], 'lat': c.point[1], 'alt': c.point[2],
+                                   'time': c.time} for c in crossings]})
+        res['candidates'] = {'track': stats.track, 'chunk': stats.chunk,
+                             'skipped_by_altitude': stats.vertical,
+                             'exact': stats.exact}
+    except Exception, e:
+        res['error'] = "%s: %s" % (e.__class__.__name__, e)
+        traceback.print_exc()
+    res['seconds'] = time.time() - start
+    return json.dumps(res)
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks many tracks at once.')
+    parser.add_argument('inputs', metavar='GPX', type=str, nargs='+',
+                        help='GPX files, directories or glob patterns')
+
+    parser.add_argument('--shapefile', metavar='SHP', type=str,
+                        help='airspace data as ESRI Shapefile',
+                        required=True)
+
+    airspace.altiresolver.addArguments(parser)
+
+    parser.add_argument('--output', metavar='JSONL', type=str, required=True,
+                        help='results, one JSON object per line. Tracks already '
+                        'in this file are skipped (resume), unless their check '
+                        'failed: they are checked again and a new line is appended')
+
+    parser.add_argument('--jobs', metavar='N', type=int, default=0,
+                        help='number of worker processes (default: one per CPU)')
+
+    parser.add_argument('--chunk-points', metavar='N', type=airspace.candidates.chunkPoints,
+                        default=airspace.candidates.CHUNK_POINTS,
+                        help='number of track points per spatial index query (default %(default)s)')
+
+    args = parser.parse_args()
+
+    try:
+        altir = airspace.altiresolver.fromArguments(args)
+    except airspace.error.ASCException, e:
+        print e
+        return -1
+
+    tracks = findTracks(args.inputs)
+    done = loadDone(args.output)
+    todo = [t for t in tracks if t not in done]
+    print "%d track(s) found, %d already checked" % (len(tracks), len(tracks) - len(todo))
+    if not todo:
+        return 0
+
+    zones = dict(enumerate(airspace.shp.loadFromShp(args.shapefile)))
+    spatial_index = airspace.shp.openIndex(args.shapefile, 3)
+    disk_index = spatial_index is not None
+    if not disk_index:
+        spatial_index = airspace.shp.memoryIndex(zones, 3)
+    print "Loaded %d zones" % len(zones)
+
+    _context.update(zones=zones, index=spatial_index, disk_index=disk_index,
+                    altir=altir, chunk_points=args.chunk_points)
+
+    fout = open(args.output, "a")
+    start = time.time()
+    pool = multiprocessing.Pool(args.jobs or None, initWorker, (args.shapefile,))
+    try:
+        for n, line in enumerate(pool.imap_unordered(checkTrack, todo)):
+            # one line at a time, so that an interrupted run can be resumed
+            fout.write(line + "\n")
+            fout.flush()
+            if (n + 1) % 100 == 0:
+                print "%d/%d track(s) checked" % (n + 1, len(todo))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        fout.close()
+
+    elapsed = time.time() - start
+    print "%d track(s) checked in %.1fs (%.1f tracks/s)" % (len(todo), elapsed,
+                                                           len(todo) / elapsed)
+    return 0
+
+if __name__ == "__main__":
+    main()
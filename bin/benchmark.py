@@ -0,0 +1,1303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import resource
+import argparse
+import tempfile
+import shutil
+import multiprocessing
+import random
+import math
+
+import airspace.parser
+import airspace.cache
+import airspace.util
+import airspace.candidates
+import airspace.classify
+import airspace.limits
+import airspace.checker
+import airspace.shp
+import airspace.altiresolver
+import airspace.streaming
+import airspace.elevstore
+import airspace.track
+
+import tests.standins
+
+import numpy
+import pyproj
+import shapely.geometry
+import rtree
+
+def runIsolated(func, *args):
+    """
+    Runs func(*args) in a forked child so that its peak memory
+    is not polluted by previous runs. Returns (result, seconds,
+    peak RSS in kB). The result must be a string.
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        start = time.time()
+        try:
+            res = func(*args)
+        except Exception, e:
+            res = "FAILED (%s)" % e
+        elapsed = time.time() - start
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        os.write(wfd, "%f %d %s" % (elapsed, maxrss, res))
+        os.close(wfd)
+        os._exit(0)
+
+    os.close(wfd)
+    out = ""
+    while True:
+        buf = os.read(rfd, 4096)
+        if not buf:
+            break
+        out += buf
+    os.close(rfd)
+    os.waitpid(pid, 0)
+
+    elapsed, maxrss, res = out.split(' ', 2)
+    return res, float(elapsed), int(maxrss)
+
+def report(label, func, *args):
+    res, elapsed, maxrss = runIsolated(func, *args)
+    print "%-30s %8.3fs %8d kB  %s" % (label, elapsed, maxrss, res)
+
+
+def _streamNative(filename):
+    n = 0
+    for z in airspace.parser.iterparse(filename):
+        n += 1
+    return "%d zones" % n
+
+def _listNative(filename):
+    return "%d zones" % len(airspace.parser.parse(filename))
+
+def _listAntlr(filename):
+    return "%d zones" % len(airspace.parser.parseAntlr(filename))
+
+def benchParser(args):
+    for filename in args.openair:
+        print filename
+        report("native (generator)", _streamNative, filename)
+        report("native (list)", _listNative, filename)
+        report("ANTLR", _listAntlr, filename)
+
+
+def _parseCached(filename, cachedir):
+    cache = airspace.cache.ZoneCache(cachedir)
+    return "%d zones" % len(airspace.parser.parse(filename, cache))
+
+def benchCache(args):
+    cachedir = tempfile.mkdtemp()
+    try:
+        for filename in args.openair:
+            print filename
+            report("cold cache", _parseCached, filename, cachedir)
+            report("warm cache", _parseCached, filename, cachedir)
+    finally:
+        shutil.rmtree(cachedir)
+
+
+def _parseParallel(filename, jobs):
+    return "%d zones" % len(airspace.parser.parse(filename, jobs=jobs))
+
+def benchParallel(args):
+    jobs_list = args.jobs
+    if not jobs_list:
+        jobs_list = [1]
+        while jobs_list[-1] * 2 <= multiprocessing.cpu_count():
+            jobs_list.append(jobs_list[-1] * 2)
+
+    for filename in args.openair:
+        print filename
+        ref = None
+        for jobs in jobs_list:
+            res, elapsed, maxrss = runIsolated(_parseParallel, filename, jobs)
+            if ref is None:
+                ref = elapsed
+            print "%3d job(s) %8.3fs  speedup x%.2f  %s" % (jobs, elapsed,
+                                                         ref / elapsed, res)
+
+
+def loadRawCoords(filenames):
+    raws = []
+    for filename in filenames:
+        fin = open(filename)
+        for lineno, keyword, value in airspace.parser.iterRecords(fin):
+            if keyword in ('DP', 'V X'):
+                raws.append(value)
+            elif keyword == 'DB':
+                raws += [c.strip() for c in value.split(',')]
+        fin.close()
+    return raws
+
+def timeit(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+def benchCoords(args):
+    raws = loadRawCoords(args.openair)
+    print "%d coordinates" % len(raws)
+
+    per_string = timeit(lambda: [airspace.util.rawLatLonConvToLonLat(r) for r in raws])
+    batch = timeit(airspace.util.rawLatLonConvToLonLatArray, raws)
+    print "per string %8.3fs" % per_string
+    print "batch      %8.3fs  speedup x%.2f" % (batch, per_string / batch)
+
+
+def loadArcs(filenames):
+    """
+    Returns (center, point1, point2, direction) for all DB records.
+    """
+    conv = lambda raw: shapely.geometry.Point(airspace.util.rawLatLonConvToLonLat(raw.strip()))
+    arcs = []
+    for filename in filenames:
+        fin = open(filename)
+        for records in airspace.parser.iterZoneRecords(fin):
+            direction, center = "cw", None
+            for lineno, keyword, value in records:
+                if keyword == 'V D':
+                    direction = "ccw" if value == '-' else "cw"
+                elif keyword == 'V X':
+                    center = conv(value)
+                elif keyword == 'DB':
+                    raw1, raw2 = value.split(',')
+                    arcs.append((center, conv(raw1), conv(raw2), direction))
+        fin.close()
+    return arcs
+
+def legacyArc(center, point1, point2, direction):
+    """
+    Former arc slicing: builds the whole circle and looks for the
+    vertices nearest to the arc ends.
+    """
+    az, backaz, radius = airspace.util.geod_wgs84.inv(center.x, center.y,
+                                                      point1.x, point1.y)
+    circle_ls = list(airspace.util.getCircle2(center, radius).exterior.coords)
+
+    d1, d2 = None, None
+    for idx_p, p in enumerate(circle_ls):
+        sp = shapely.geometry.Point(p)
+        td1 = point1.distance(sp)
+        td2 = point2.distance(sp)
+        if d1 is None or td1 < d1:
+            d1, si = td1, idx_p
+        if d2 is None or td2 < d2:
+            d2, ei = td2, idx_p
+
+    if si > ei:
+        if direction == "ccw":
+            return list(point1.coords) + list(reversed(circle_ls[ei+1:si])) + list(point2.coords)
+        return list(point1.coords) + circle_ls[si+1:] + circle_ls[:ei] + list(point2.coords)
+    if direction == "ccw":
+        return list(point1.coords) + list(reversed(circle_ls[0:si])) + \
+            list(reversed(circle_ls[ei+1:])) + list(point2.coords)
+    return list(point1.coords) + circle_ls[si+1:ei] + list(point2.coords)
+
+def benchArcs(args):
+    arcs = loadArcs(args.openair)
+    print "%d arcs" % len(arcs)
+
+    start = time.time()
+    legacy = [legacyArc(*arc) for arc in arcs]
+    legacy_time = time.time() - start
+
+    start = time.time()
+    analytic = [airspace.util.getArc2(*arc) for arc in arcs]
+    analytic_time = time.time() - start
+
+    print "full circle + nearest vertex %8.3fs" % legacy_time
+    print "azimuth indexing             %8.3fs  speedup x%.2f" % (analytic_time,
+                                                               legacy_time / analytic_time)
+
+    # distance between both outputs, in meters (approx. at these latitudes)
+    dists = []
+    for l, a in zip(legacy, analytic):
+        if len(l) > 1 and len(a) > 1:
+            dists.append(shapely.geometry.LineString(l).hausdorff_distance(
+                    shapely.geometry.LineString(a)) * 111000)
+    dists.sort()
+    print "hausdorff distance to former output: median %.2fm, p95 %.2fm, max %.2fm" % (
+        dists[len(dists) / 2], dists[int(len(dists) * .95)], dists[-1])
+
+
+def randomTracks(zones, count, seed=0):
+    """
+    Returns 'count' straight tracks (20 points) crossing the area
+    covered by 'zones'.
+    """
+    rand = random.Random(seed)
+    minx = min([z.geometry.bounds[0] for z in zones])
+    miny = min([z.geometry.bounds[1] for z in zones])
+    maxx = max([z.geometry.bounds[2] for z in zones])
+    maxy = max([z.geometry.bounds[3] for z in zones])
+
+    tracks = []
+    for i in xrange(count):
+        x0, y0 = rand.uniform(minx, maxx), rand.uniform(miny, maxy)
+        dx, dy = rand.uniform(-1, 1), rand.uniform(-1, 1)
+        tracks.append(shapely.geometry.LineString([(x0 + dx * k / 19., y0 + dy * k / 19.)
+                                                   for k in xrange(20)]))
+    return tracks
+
+def intersectAll(zones, tracks):
+    """
+    Times intersects() + intersection() on the (track, zone) pairs
+    whose bounding boxes overlap (best of 3 runs).
+    """
+    pairs = []
+    for track in tracks:
+        tminx, tminy, tmaxx, tmaxy = track.bounds
+        for z in zones:
+            minx, miny, maxx, maxy = z.geometry.bounds
+            if minx <= tmaxx and tminx <= maxx and miny <= tmaxy and tminy <= maxy:
+                pairs.append((track, z.geometry))
+
+    best = None
+    for rep in xrange(3):
+        start = time.time()
+        n = 0
+        for track, geometry in pairs:
+            if track.intersects(geometry):
+                track.intersection(geometry)
+                n += 1
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return n, best
+
+def benchTolerance(args):
+    zones_by_setting = []
+    for tolerance in [None] + args.tolerance:
+        airspace.util.ARC_TOLERANCE = tolerance
+        start = time.time()
+        zones = airspace.parser.parse(args.openair)
+        build = time.time() - start
+        zones_by_setting.append((tolerance, zones, build))
+
+    tracks = randomTracks(zones_by_setting[0][1], args.tracks)
+    ref = None
+    for tolerance, zones, build in zones_by_setting:
+        label = "QUADSEG=%d" % airspace.util.QUADSEG if tolerance is None \
+            else "tolerance %gm" % tolerance
+        vertices = sum([airspace.util.vertexCount(z.geometry) for z in zones])
+        n, elapsed = intersectAll([z for z in zones if z.geometry.is_valid], tracks)
+        if ref is None:
+            ref = elapsed
+        print "%-16s %8d vertices  build %6.3fs  %d intersections %7.3fs (x%.2f)" % (
+            label, vertices, build, n, elapsed, ref / elapsed)
+
+
+def benchPrepared(args):
+    zones = [z for z in airspace.parser.parse(args.openair) if z.geometry.is_valid]
+    tracks = randomTracks(zones, args.tracks)
+    print "%d zones, %d tracks" % (len(zones), len(tracks))
+
+    pairs = []
+    for track in tracks:
+        tminx, tminy, tmaxx, tmaxy = track.bounds
+        for z in zones:
+            minx, miny, maxx, maxy = z.geometry.bounds
+            if minx <= tmaxx and tminx <= maxx and miny <= tmaxy and tminy <= maxy:
+                pairs.append((track, z))
+
+    start = time.time()
+    n_raw = 0
+    for track, z in pairs:
+        if track.intersects(z.geometry):
+            track.intersection(z.geometry)
+            n_raw += 1
+    raw = time.time() - start
+
+    start = time.time()
+    n_prep = 0
+    for track, z in pairs:
+        if z.prepared.intersects(track):
+            track.intersection(z.geometry)
+            n_prep += 1
+    prepared = time.time() - start
+
+    print "%d candidate pairs, %d intersecting" % (len(pairs), n_raw)
+    print "raw geometries      %8.3fs  %8.0f pairs/s" % (raw, len(pairs) / raw)
+    print "prepared geometries %8.3fs  %8.0f pairs/s (x%.2f, %d intersecting)" % (
+        prepared, len(pairs) / prepared, raw / prepared, n_prep)
+
+
+def longTracks(zones, count, points, seed=0):
+    """
+    Returns 'count' cross-country like tracks: random walks of
+    'points' points, about 100m apart (~ 'points' / 10 km long).
+    """
+    rand = random.Random(seed)
+    minx = min([z.geometry.bounds[0] for z in zones])
+    miny = min([z.geometry.bounds[1] for z in zones])
+    maxx = max([z.geometry.bounds[2] for z in zones])
+    maxy = max([z.geometry.bounds[3] for z in zones])
+
+    tracks = []
+    for i in xrange(count):
+        x, y = rand.uniform(minx, maxx), rand.uniform(miny, maxy)
+        heading = rand.uniform(0, 360)
+        coords = []
+        for k in xrange(points):
+            heading += rand.gauss(0, 5)
+            x += 0.0013 * math.sin(math.radians(heading))
+            y += 0.0009 * math.cos(math.radians(heading))
+            coords.append((x, y))
+        tracks.append(shapely.geometry.LineString(coords))
+    return tracks
+
+def withAltitudes(tracks, seed=0):
+    """
+    Returns 3D copies of 'tracks' with a random altitude profile
+    (glider like, between 200m and 4500m).
+    """
+    rand = random.Random(seed)
+    res = []
+    for track in tracks:
+        alt = 1500.
+        coords = []
+        for x, y in track.coords:
+            alt = min(max(alt + rand.gauss(0, 15), 200), 4500)
+            coords.append((x, y, alt))
+        res.append(shapely.geometry.LineString(coords))
+    return res
+
+def _wholeTrack(index, zones, tracks):
+    crossed = 0
+    candidates = 0
+    for track in tracks:
+        for fid in index.intersection(track.bounds):
+            candidates += 1
+            if zones[fid].prepared.intersects(track):
+                track.intersection(zones[fid].geometry)
+                crossed += 1
+    return candidates, crossed
+
+def _chunkedTrack(index, zones, tracks, max_points):
+    crossed = set()
+    candidates = 0
+    for n, (track, cands, coords) in enumerate(
+        airspace.candidates.findCandidates(index, tracks, max_points)):
+        for fid, indexes in cands.items():
+            candidates += 1
+            for piece in airspace.candidates.mergeChunks(coords, indexes, max_points):
+                if zones[fid].prepared.intersects(piece):
+                    piece.intersection(zones[fid].geometry)
+                    crossed.add((n, fid))
+    return candidates, len(crossed)
+
+def benchChunks(args):
+    zones = [z for z in airspace.parser.parse(args.openair) if z.geometry.is_valid]
+    index = rtree.Rtree()
+    for fid, z in enumerate(zones):
+        index.add(fid, z.geometry.bounds)
+    tracks = longTracks(zones, args.tracks, args.points)
+    print "%d zones, %d tracks of %d points" % (len(zones), len(tracks), args.points)
+
+    start = time.time()
+    candidates, crossed = _wholeTrack(index, zones, tracks)
+    ref = time.time() - start
+    print "%-18s %6d candidates %5d crossed %8.3fs" % (
+        "whole track bbox", candidates, crossed, ref)
+
+    for max_points in args.chunk_points:
+        start = time.time()
+        candidates, crossed = _chunkedTrack(index, zones, tracks, max_points)
+        elapsed = time.time() - start
+        print "%-18s %6d candidates %5d crossed %8.3fs (x%.2f)" % (
+            "chunks of %d" % max_points, candidates, crossed, elapsed, ref / elapsed)
+
+
+def constantLimits(meta):
+    """
+    Floor and ceiling of a zone in meters, AGL limits taken
+    above a ground at 0 (good enough for benchmarks).
+    """
+    def limit(spec, default):
+        if 'flevel' in spec:
+            return spec['flevel'] * 100 * 0.3048
+        if 'basealti' in spec:
+            alti, unit = spec['basealti']
+            return alti if unit == 'M' else alti * 0.3048
+        return default
+    return limit(meta['floor'], 0.), limit(meta['ceiling'], float('inf'))
+
+def _vertexLoop(pairs):
+    inside = 0
+    for points, zone, floor, ceil in pairs:
+        track = shapely.geometry.LineString(points)
+        inter = track.intersection(zone.geometry)
+        for part in getattr(inter, 'geoms', [inter]):
+            if part.geom_type != 'LineString':
+                continue
+            for p in part.coords:
+                if p[2] > floor and p[2] < ceil:
+                    inside += 1
+    return inside
+
+def _vectorized(pairs):
+    crossings = 0
+    for points, zone, floor, ceil in pairs:
+        floors = numpy.empty(len(points))
+        floors.fill(floor)
+        ceils = numpy.empty(len(points))
+        ceils.fill(ceil)
+        mask, zone_crossings = airspace.classify.findCrossings(points, zone.geometry,
+                                                               floors, ceils)
+        crossings += len(zone_crossings)
+    return crossings
+
+def _sameAsIntersection(pairs):
+    # with unbounded limits, the inside parts must be the intersection
+    # computed by shapely
+    same = 0
+    for points, zone, floor, ceil in pairs:
+        count = len(points)
+        mask, crossings = airspace.classify.findCrossings(
+            points, zone.geometry, numpy.repeat(-numpy.inf, count),
+            numpy.repeat(numpy.inf, count))
+        length = sum([shapely.geometry.LineString(numpy.array(p)[:, :2]).length
+                      for p in airspace.classify.insideParts(points, crossings)])
+        inter = shapely.geometry.LineString(points[:, :2]).intersection(zone.geometry)
+        if abs(length - inter.length) <= 1e-9 * max(inter.length, 1):
+            same += 1
+    return same
+
+def benchClassify(args):
+    zones = [z for z in airspace.parser.parse(args.openair) if z.geometry.is_valid]
+    index = rtree.Rtree()
+    for fid, z in enumerate(zones):
+        index.add(fid, z.geometry.bounds)
+
+    pairs = []
+    for track in withAltitudes(longTracks(zones, args.tracks, args.points)):
+        points = numpy.array(track.coords)
+        for fid in index.intersection(track.bounds):
+            if zones[fid].prepared.intersects(track):
+                floor, ceil = constantLimits(zones[fid].meta)
+                pairs.append((points, zones[fid], floor, ceil))
+    print "%d (track, zone) pairs, %d points per track" % (len(pairs), args.points)
+
+    start = time.time()
+    inside = _vertexLoop(pairs)
+    ref = time.time() - start
+    print "intersection + vertex loop %8.3fs  %d vertices inside" % (ref, inside)
+
+    start = time.time()
+    crossings = _vectorized(pairs)
+    elapsed = time.time() - start
+    print "vectorized classification  %8.3fs  %d interpolated crossings (x%.2f)" % (
+        elapsed, crossings, ref / elapsed)
+    print "same inside parts as the intersection: %d/%d pairs" % (
+        _sameAsIntersection(pairs), len(pairs))
+
+
+def benchIndex3d(args):
+    zones = dict(enumerate([z for z in airspace.parser.parse(args.openair)
+                            if z.geometry.is_valid]))
+    tracks = withAltitudes(longTracks(zones.values(), args.tracks, args.points))
+    print "%d zones, %d tracks of %d points" % (len(zones), len(tracks), args.points)
+
+    ref = None
+    for dimension in (2, 3):
+        index = airspace.shp.memoryIndex(zones, dimension)
+        # counters apart, they need more queries
+        stats = airspace.candidates.CandidateStats()
+        airspace.candidates.findCandidates(index, tracks, stats=stats)
+
+        start = time.time()
+        crossed = 0
+        for track, cands, coords in airspace.candidates.findCandidates(index, tracks):
+            for fid, indexes in cands.items():
+                for piece in airspace.candidates.mergeChunks(coords, indexes):
+                    if zones[fid].prepared.intersects(piece):
+                        piece.intersection(zones[fid].geometry)
+                        crossed += 1
+        elapsed = time.time() - start
+        if ref is None:
+            ref = elapsed
+        print "%dD index  %6d pairs  %6d skipped by altitude  %5d exact intersections " \
+            "%8.3fs (x%.2f)" % (dimension, stats.pairs, stats.vertical, crossed,
+                                elapsed, ref / elapsed)
+
+
+class CountingResolver(airspace.altiresolver.AltiResolver):
+    """
+    Flat ground at 'level', counting the calls and points. Each
+    call takes 'latency' seconds at least (remote resolvers).
+    """
+    def __init__(self, level=500., latency=0):
+        self.level = level
+        self.latency = latency
+        self.calls = 0
+        self.points = 0
+
+    def getGroundLevelsAt(self, lons, lats):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.points += len(lons)
+        levels = numpy.empty(len(lons))
+        levels.fill(self.level)
+        return levels
+
+class HillsResolver(CountingResolver):
+    """
+    Smooth synthetic relief (hills ~10km apart, +/- 'level'),
+    counting the calls and points.
+    """
+    def getGroundLevelsAt(self, lons, lats):
+        CountingResolver.getGroundLevelsAt(self, lons, lats)
+        lons = numpy.asarray(lons, dtype=float)
+        lats = numpy.asarray(lats, dtype=float)
+        return 1000 + self.level * numpy.sin(lons * 50) * numpy.cos(lats * 70)
+
+def legacyLimitsAt(altir, meta, lon, lat):
+    # former util.getFloorAtPoint() + getCeilAtPoint(): the meta
+    # dicts are interpreted again for each point and each limit
+    res = []
+    for spec in (meta['floor'], meta['ceiling']):
+        values = []
+        for s in [spec]:
+            if 'flevel' in s:
+                values.append(s['flevel'] * 100 * 0.3048)
+            elif 'fromground' in s:
+                values.append(0)
+            elif 'nolimit' in s:
+                values.append(sys.maxint)
+            elif 'ref' in s and s['ref'] == 'AMSL':
+                alti, unit = s['basealti']
+                values.append(alti * 0.3048 if unit == 'F' else alti)
+            elif 'ref' in s and s['ref'] == 'AGL':
+                alti, unit = s['basealti']
+                ground = altir.getGroundLevelAt(lat, lon)
+                values.append((alti * 0.3048 if unit == 'F' else alti) + ground)
+        res.append(max(values))
+    return res
+
+def benchLimits(args):
+    zones = airspace.parser.parse(args.openair)
+    rand = numpy.random.RandomState(0)
+    lons = rand.uniform(-5, 8, args.points)
+    lats = rand.uniform(42, 51, args.points)
+    agl = len([z for z in zones if z.limits.agl])
+    print "%d zones (%d with AGL limits), %d points" % (len(zones), agl, args.points)
+
+    altir = CountingResolver()
+    start = time.time()
+    for z in zones:
+        for i in xrange(args.points):
+            legacyLimitsAt(altir, z.meta, lons[i], lats[i])
+    ref = time.time() - start
+    print "per point meta interpretation %8.3fs  %8d resolver requests" % (ref, altir.calls)
+
+    altir = CountingResolver()
+    start = time.time()
+    for z in zones:
+        z.limits.at(altir, lons, lats)
+    elapsed = time.time() - start
+    print "compiled evaluators           %8.3fs  %8d resolver requests (x%.2f)" % (
+        elapsed, altir.calls, ref / elapsed)
+
+def benchElevationCache(args):
+    zones = dict(enumerate([z for z in airspace.parser.parse(args.openair)
+                            if z.geometry.is_valid and z.limits.agl]))
+    index = airspace.shp.memoryIndex(zones, 2)
+    tracks = []
+    for track in withAltitudes(longTracks(zones.values(), args.tracks, args.points)):
+        # fixes every ~100m / 'subdivide'
+        coords = numpy.array(track.coords)
+        steps = numpy.arange((len(coords) - 1) * args.subdivide + 1) / float(args.subdivide)
+        tracks.append(numpy.column_stack([numpy.interp(steps, numpy.arange(len(coords)),
+                                                       coords[:, i]) for i in range(3)]))
+    print "%d AGL zones, %d tracks of %d fixes, %gms per backend request" % (
+        len(zones), len(tracks), len(tracks[0]), args.latency)
+
+    allpoints = numpy.concatenate(tracks)
+    exact = HillsResolver().getGroundLevelsAt(allpoints[:, 0], allpoints[:, 1])
+
+    for grid in [None] + args.grid:
+        backend = HillsResolver(latency=args.latency / 1000.)
+        altir = backend
+        if grid is not None:
+            altir = airspace.altiresolver.CachingResolver(backend, grid, args.size)
+
+        start = time.time()
+        for coords in tracks:
+            checker = airspace.streaming.StreamingChecker(zones, index, altir)
+            for lon, lat, alt in coords:
+                checker.feed(lon, lat, alt)
+        elapsed = time.time() - start
+
+        if grid is None:
+            print "no cache          %7d backend points %8.3fs" % (backend.points, elapsed)
+            continue
+        quantized = airspace.altiresolver.CachingResolver(HillsResolver(), grid)
+        error = numpy.abs(quantized.getGroundLevelsAt(allpoints[:, 0], allpoints[:, 1]) -
+                          exact).max()
+        print "grid %-12.3g %7d backend points %8.3fs  max level error %5.1fm  %s" % (
+            grid, backend.points, elapsed, error, altir)
+
+def _storedLevels(path, grid, points):
+    # runs in the reader processes of benchElevationStore()
+    store = airspace.elevstore.ElevationStore(path, grid, "hills")
+    altir = airspace.altiresolver.StoredResolver(HillsResolver(), store)
+    start = time.time()
+    levels = altir.getGroundLevelsAt(points[:, 0], points[:, 1])
+    return time.time() - start, altir.misses, levels
+
+def benchElevationStore(args):
+    zones = airspace.parser.parse(args.openair)
+    tracks = longTracks(zones, args.tracks, args.points)
+    points = numpy.concatenate([numpy.array(t.coords) for t in tracks])
+    exact = HillsResolver().getGroundLevelsAt(points[:, 0], points[:, 1])
+    grid = args.grid
+    print "%d tracks of %d points, %gms per backend request" % (
+        len(tracks), args.points, args.latency)
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "elevation.sqlite")
+    try:
+        for run in ("cold", "warm"):
+            backend = HillsResolver(latency=args.latency / 1000.)
+            store = airspace.elevstore.ElevationStore(path, grid, "hills")
+            altir = airspace.altiresolver.StoredResolver(backend, store)
+            start = time.time()
+            for track in tracks:
+                coords = numpy.array(track.coords)
+                levels = altir.getGroundLevelsAt(coords[:, 0], coords[:, 1])
+                altir.flush()
+            elapsed = time.time() - start
+            print "%s store  %6d backend requests  %7d backend points  %8.3fs  %s" % (
+                run, backend.calls, backend.points, elapsed, altir)
+            store.close()
+
+        pool = multiprocessing.Pool(args.readers)
+        try:
+            pending = [pool.apply_async(_storedLevels, (path, grid, points))
+                       for i in xrange(args.readers)]
+            results = [r.get() for r in pending]
+        finally:
+            pool.close()
+            pool.join()
+        error = max([numpy.abs(levels - exact).max() for t, misses, levels in results])
+        print "%d concurrent readers: %s, %d miss(es), max level error %.1fm" % (
+            args.readers, ", ".join(["%.3fs" % t for t, misses, levels in results]),
+            sum([misses for t, misses, levels in results]), error)
+
+        backend = HillsResolver()
+        store = airspace.elevstore.ElevationStore(path, grid, "hills")
+        altir = airspace.altiresolver.StoredResolver(backend, store)
+        lon, lat = points[0, 0], points[0, 1]
+        start = time.time()
+        resolved = altir.prewarm(lon - .1, lat - .1, lon + .1, lat + .1)
+        print "prewarm of a 0.2 x 0.2 degrees box: %d cell(s) resolved in %.3fs, " \
+            "%d cell(s) stored" % (resolved, time.time() - start, store.count())
+        print "prewarm again: %d cell(s) resolved" % altir.prewarm(lon - .1, lat - .1,
+                                                                  lon + .1, lat + .1)
+    finally:
+        shutil.rmtree(tmpdir)
+
+def benchGeoNames(args):
+    zones = airspace.parser.parse(args.openair)
+    tracks = longTracks(zones, args.tracks, args.points)
+    print "%d tracks of %d points, %gms per request, 1 failure every %d request(s)" % (
+        len(tracks), args.points, args.latency, args.fail_every)
+
+    ref = None
+    for connections in [0] + args.connections:
+        server = tests.standins.GeoNamesStandIn(latency=args.latency / 1000.,
+                                                fail_every=args.fail_every).start()
+        try:
+            if connections == 0:
+                # former resolver, without the failures
+                server.fail_every = 0
+                altir = airspace.altiresolver.GeoNamesResolver(url=server.url())
+            else:
+                altir = airspace.altiresolver.ConcurrentGeoNamesResolver(
+                    url=server.url(), connections=connections, backoff=0.01)
+
+            start = time.time()
+            levels = []
+            for track in tracks:
+                coords = numpy.array(track.coords)
+                # floor and ceiling of the AGL zones around asked at once
+                lons = numpy.concatenate([coords[:, 0], coords[:, 0]])
+                lats = numpy.concatenate([coords[:, 1], coords[:, 1]])
+                levels.append(altir.getGroundLevelsAt(lons, lats))
+            elapsed = time.time() - start
+            levels = numpy.concatenate(levels)
+        finally:
+            if connections:
+                altir.close()
+            server.stop()
+
+        if ref is None:
+            ref = (elapsed, levels)
+            print "sequential, urllib2  %8.3fs  %5d request(s)  %4d connection(s)  " \
+                "%6d point(s) asked" % (elapsed, server.requests, server.connections,
+                                        server.points)
+            continue
+        print "%2d connection(s)     %8.3fs  %5d request(s)  %4d connection(s)  " \
+            "%6d point(s) asked  (x%.1f)  same levels: %s  %s" % (
+            connections, elapsed, server.requests, server.connections, server.points,
+            ref[0] / elapsed, numpy.array_equal(levels, ref[1]), altir)
+def benchPrefetch(args):
+    zones = dict(enumerate([z for z in airspace.parser.parse(args.openair)
+                            if z.geometry.is_valid]))
+    index = airspace.shp.memoryIndex(zones, 3)
+    tracks = withAltitudes(longTracks(zones.values(), args.tracks, args.points))
+    print "%d zones (%d AGL), %d tracks of %d points, %gms per backend request" % (
+        len(zones), len([z for z in zones.values() if z.limits.agl]), len(tracks),
+        args.points, args.latency)
+
+    ref = None
+    # the tracks checked one by one (one track files), then all at
+    # once (segments of a file), the levels of a track being
+    # resolved while the previous one is checked
+    for prefetch, grouped in ((False, False), (True, False), (False, True), (True, True)):
+        backend = HillsResolver(latency=args.latency / 1000.)
+        altir = backend
+        if prefetch:
+            altir = airspace.altiresolver.PrefetchingResolver(backend)
+
+        start = time.time()
+        crossings = []
+        groups = [tracks] if grouped else [[t] for t in tracks]
+        for group in groups:
+            track_candidates = airspace.candidates.findCandidates(index, group)
+            confirmed = airspace.checker.confirmZones(track_candidates, zones, altir)
+            altir.flush()
+            crossings += [(z.meta['name'], c.kind, c.point)
+                          for z, (parts, cs) in confirmed.items() for c in cs]
+        elapsed = time.time() - start
+        crossings.sort()
+
+        label = "%s, %s" % ("prefetch" if prefetch else "no prefetch",
+                            "all tracks" if grouped else "track by track")
+        if not prefetch:
+            ref = (elapsed, crossings)
+            print "%-28s %8.3fs  %5d backend requests  %6d points" % (
+                label, elapsed, backend.calls, backend.points)
+            continue
+        print "%-28s %8.3fs  %5d backend requests  %6d points  (x%.2f)  " \
+            "same crossings: %s\n  %s" % (label, elapsed, backend.calls, backend.points,
+                                          ref[0] / elapsed, crossings == ref[1], altir)
+
+def benchTerrain(args):
+    parsed = [z for z in airspace.parser.parse(args.openair) if z.geometry.is_valid]
+    zones = dict(enumerate(parsed))
+    index = airspace.shp.memoryIndex(zones, 3)
+    index2d = airspace.shp.memoryIndex(zones, 2)
+    agl = [z for z in parsed if z.limits.agl]
+
+    start = time.time()
+    backend = HillsResolver()
+    envelopes = [airspace.limits.terrainEnvelope(z.geometry, backend, args.step,
+                                                 args.margin) for z in agl]
+    print "%d AGL zones, envelopes in %.3fs (%d points sampled)" % (
+        len(agl), time.time() - start, backend.points)
+
+    # envelopes checked at random points below the zones
+    rand = numpy.random.RandomState(0)
+    worst = -numpy.inf
+    for z, envelope in zip(agl, envelopes):
+        minx, miny, maxx, maxy = z.geometry.bounds
+        xy = numpy.column_stack([rand.uniform(minx, maxx, 1000), rand.uniform(miny, maxy, 1000)])
+        xy = xy[airspace.classify.pointsInPolygon(xy, z.geometry)]
+        levels = HillsResolver().getGroundLevelsAt(xy[:, 0], xy[:, 1])
+        if len(levels):
+            worst = max(worst, envelope[0] - levels.min(), levels.max() - envelope[1])
+    print "worst level outside of an envelope: %.1fm (< 0 is safe)" % worst
+
+    tracks = withAltitudes(longTracks(parsed, args.tracks, args.points))
+    ref = None
+    for terrain in (False, True):
+        if terrain:
+            for z, envelope in zip(agl, envelopes):
+                z.meta['terrain'] = envelope
+                z.limits = airspace.limits.VerticalLimits(z.meta)
+
+        backend = HillsResolver()
+        start = time.time()
+        crossings = []
+        events = []
+        for n, track in enumerate(tracks):
+            track_candidates = airspace.candidates.findCandidates(index, [track])
+            confirmed = airspace.checker.confirmZones(track_candidates, zones, backend)
+            crossings += sorted([(z.meta['name'], c.kind, c.point)
+                                 for z, (parts, cs) in confirmed.items() for c in cs])
+        elapsed = time.time() - start
+        for track in tracks[:args.streamed]:
+            checker = airspace.streaming.StreamingChecker(zones, index2d, backend)
+            for lon, lat, alt in track.coords:
+                events += [(e.kind, e.zone.meta['name'], e.point)
+                           for e in checker.feed(lon, lat, alt)]
+
+        if ref is None:
+            ref = (crossings, events)
+            print "ground below each point  %8.3fs  %7d points asked" % (elapsed,
+                                                                      backend.points)
+            continue
+        print "terrain envelopes        %8.3fs  %7d points asked  same crossings: %s, " \
+            "same streamed events: %s" % (elapsed, backend.points, crossings == ref[0],
+                                          events == ref[1])
+
+
+FAKE_OSSIM_HEIGHT = """#!%(python)s
+# stand-in for ossim-height: -P CONFIG LAT LON
+import sys, time, math
+time.sleep(%(init)f)
+lat, lon = float(sys.argv[3]), float(sys.argv[4])
+print "Opening elevation database..."
+print "Height above MSL: %%r" %% (1000 + 500 * math.sin(lon * 50) * math.cos(lat * 70))
+"""
+
+def benchOssim(args):
+    rand = numpy.random.RandomState(0)
+    lons = rand.uniform(5, 7, args.points)
+    lats = rand.uniform(44, 46, args.points)
+    exact = HillsResolver().getGroundLevelsAt(lons, lats)
+    print "%d points, %gms to open the elevation database" % (args.points, args.init)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        height = os.path.join(tmpdir, "ossim-height")
+        tests.standins.writeScript(height, FAKE_OSSIM_HEIGHT, init=args.init / 1000.)
+        former_exec = airspace.altiresolver.OSSIM_HEIGHT_EXEC
+        airspace.altiresolver.OSSIM_HEIGHT_EXEC = height
+        try:
+            count = min(args.points, args.process_points)
+            altir = airspace.altiresolver.OssimResolverProcess("fake.conf")
+            start = time.time()
+            levels = altir.getGroundLevelsAt(lons[:count], lats[:count])
+            elapsed = time.time() - start
+        finally:
+            airspace.altiresolver.OSSIM_HEIGHT_EXEC = former_exec
+        print "one process per point  %8.0f points/s  (%d points)  max error %.3gm" % (
+            count / elapsed, count, numpy.abs(levels - exact[:count]).max())
+
+        for crash in (0, args.crash):
+            worker = os.path.join(tmpdir, "ossim-worker-%d" % crash)
+            tests.standins.writeOssimWorker(worker, init=args.init / 1000., crash=crash)
+            for workers in args.workers:
+                altir = airspace.altiresolver.OssimWorkerResolver(
+                    "fake.conf", workers, command=[worker], batch=args.batch)
+                try:
+                    start = time.time()
+                    altir.check()
+                    started = time.time() - start
+                    start = time.time()
+                    levels = numpy.concatenate([
+                            altir.getGroundLevelsAt(lons[i:i + args.track],
+                                                    lats[i:i + args.track])
+                            for i in xrange(0, args.points, args.track)])
+                    elapsed = time.time() - start
+                finally:
+                    altir.close()
+                print "%2d worker(s)%-11s %8.0f points/s  (start %.3fs)  max error %.3gm  %s" % (
+                    workers, ", crashing" if crash else "", args.points / elapsed,
+                    started, numpy.abs(levels - exact).max(), altir)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def writeHgtTile(directory, lat0, lon0, size):
+    """
+    Writes a synthetic SRTM tile whose levels are a plane:
+    1000 + 3 * lat + 2 * lon (lat/lon counted in samples from the
+    tile corner), so that bilinear interpolation is exact. Sample
+    (row, col) == (1, 1) is a void.
+    """
+    rows, cols = numpy.mgrid[0:size, 0:size]
+    lats = lat0 + 1 - rows / float(size - 1)
+    lons = lon0 + cols / float(size - 1)
+    levels = numpy.round(1000 + 3 * (lats - lat0) * (size - 1) +
+                         2 * (lons - lon0) * (size - 1))
+    levels[1, 1] = airspace.altiresolver.HGT_VOID
+    path = os.path.join(directory, airspace.altiresolver.hgtTileName(lat0, lon0))
+    levels.astype('>i2').tofile(path)
+
+def expectedHgtLevels(lons, lats, size):
+    return 1000 + 3 * (lats - numpy.floor(lats)) * (size - 1) + \
+        2 * (lons - numpy.floor(lons)) * (size - 1)
+
+def benchHgt(args):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for lat0 in (44, 45):
+            for lon0 in (5, 6):
+                writeHgtTile(tmpdir, lat0, lon0, args.size)
+
+        rand = numpy.random.RandomState(0)
+        lons = rand.uniform(5, 7, args.points)
+        lats = rand.uniform(44, 46, args.points)
+        expected = expectedHgtLevels(lons, lats, args.size)
+        # the void sample is next to the north west corner of the tiles
+        near_void = ((lons - numpy.floor(lons)) * (args.size - 1) < 2) & \
+            ((numpy.ceil(lats) - lats) * (args.size - 1) < 2)
+        expected[near_void] = numpy.nan
+
+        for max_tiles in (16, 1):
+            altir = airspace.altiresolver.HgtResolver(tmpdir, max_tiles)
+            start = time.time()
+            levels = altir.getGroundLevelsAt(lons, lats)
+            elapsed = time.time() - start
+            valid = ~numpy.isnan(expected)
+            print "%d points, max %2d open tiles: %.3fs (%.0f points/s), " \
+                "%d tile openings, max error %.3gm, voids ok: %s" % (
+                args.points, max_tiles, elapsed, args.points / elapsed,
+                altir.opened, numpy.abs(levels[valid] - expected[valid]).max(),
+                numpy.array_equal(numpy.isnan(levels), ~valid))
+
+        # one point at a time, as the former resolvers
+        altir = airspace.altiresolver.HgtResolver(tmpdir)
+        count = min(args.points, 10000)
+        start = time.time()
+        for i in xrange(count):
+            altir.getGroundLevelAt(lats[i], lons[i])
+        elapsed = time.time() - start
+        print "%d points one at a time: %.3fs (%.0f points/s)" % (count, elapsed,
+                                                                count / elapsed)
+
+        # outside of the tiles
+        outside = airspace.altiresolver.HgtResolver(tmpdir).getGroundLevelsAt([10.5], [45.5])
+        print "missing tile gives", outside[0]
+    finally:
+        shutil.rmtree(tmpdir)
+
+def writeGpx(path, hours, segments, seed=0):
+    """
+    Writes a GPX log of 'hours' hours at one fix per second, split
+    in 'segments' track segments. One fix out of 50 has no elevation.
+    Returns the number of fixes.
+    """
+    rnd = random.Random(seed)
+    lon, lat, ele = 5.5, 45.0, 1500.
+    t = 1302172923
+    fixes = int(hours * 3600)
+    fout = open(path, "w")
+    fout.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<gpx version="1.1" creator="benchmark" '
+               'xmlns="http://www.topografix.com/GPX/1/1">\n<trk><name>log</name>\n')
+    for n in xrange(fixes):
+        if n % (fixes / segments + 1) == 0:
+            if n:
+                fout.write('</trkseg>\n')
+            fout.write('<trkseg>\n')
+        lon += rnd.uniform(-1e-4, 1e-4)
+        lat += rnd.uniform(-1e-4, 1e-4)
+        ele += rnd.uniform(-3, 3)
+        fout.write('<trkpt lat="%.7f" lon="%.7f">' % (lat, lon))
+        if n % 50:
+            fout.write('<ele>%.1f</ele>' % ele)
+        fout.write('<time>%s</time></trkpt>\n' %
+                   time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t + n)))
+    fout.write('</trkseg>\n</trk>\n</gpx>\n')
+    fout.close()
+    return fixes
+
+def _gpxOgr(path):
+    import shapely.wkt
+    lines = [shapely.wkt.loads(x) for x in airspace.track.loadFromGpx(path)]
+    return "%d line(s), %d points" % (len(lines), sum(len(l.coords) for l in lines))
+
+def _gpxFixes(path):
+    fixes = list(airspace.track.iterGpxFixes(path))
+    line = shapely.geometry.LineString([(lon, lat, ele or 0.)
+                                        for lon, lat, ele, t in fixes])
+    return "1 line, %d points" % len(line.coords)
+
+def _gpxArrays(path, projection=None):
+    segments = airspace.track.loadGpxSegments(path, projection)
+    return "%d segment(s), %d points" % (len(segments), sum(len(s) for s in segments))
+
+def _gpxGeometries(path):
+    lines = [s.geometry() for s in airspace.track.loadGpxSegments(path)]
+    return "%d line(s), %d points" % (len(lines), sum(len(l.coords) for l in lines))
+
+def benchGpx(args):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, "log.gpx")
+        fixes = writeGpx(path, args.hours, args.segments)
+        print "%gh log, %d fixes in %d segment(s), %.1f MB" % (
+            args.hours, fixes, args.segments, os.path.getsize(path) / 1e6)
+
+        report("OGR -> WKT -> shapely", _gpxOgr, path)
+        report("iterGpxFixes -> shapely", _gpxFixes, path)
+        report("arrays", _gpxArrays, path)
+        report("arrays, Lambert 93", _gpxArrays, path,
+               pyproj.Proj(init='epsg:2154'))
+        report("arrays -> shapely", _gpxGeometries, path)
+
+        # same points as the fix by fix reader
+        segments = airspace.track.loadGpxSegments(path)
+        ref = numpy.array([(lon, lat, numpy.nan if ele is None else ele, t)
+                           for lon, lat, ele, t in airspace.track.iterGpxFixes(path)])
+        got = numpy.concatenate([numpy.column_stack((s.lons, s.lats, s.eles, s.times))
+                                 for s in segments])
+        print "same fixes as iterGpxFixes: %s" % (
+            numpy.array_equal(numpy.isnan(ref), numpy.isnan(got)) and
+            numpy.array_equal(ref[~numpy.isnan(ref)], got[~numpy.isnan(got)]))
+
+        try:
+            import shapely.wkt
+            legacy = [shapely.wkt.loads(x) for x in airspace.track.loadFromGpx(path)]
+        except Exception, e:
+            print "OGR GPX driver not available (%s)" % e
+        else:
+            print "same lines as OGR: %s" % (
+                len(legacy) == len(segments) and
+                all(numpy.allclose(numpy.array(l.coords), s.coords())
+                    for l, s in zip(legacy, segments)))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks.')
+    subparsers = parser.add_subparsers()
+
+    sub = subparsers.add_parser('parser',
+                                help='OpenAir parsers speed and peak memory')
+    sub.add_argument('openair', metavar='OpenAir', type=str, nargs='+',
+                     help='OpenAir files to parse')
+    sub.set_defaults(func=benchParser)
+
+    sub = subparsers.add_parser('cache',
+                                help='parsing with a cold and a warm zones cache')
+    sub.add_argument('openair', metavar='OpenAir', type=str, nargs='+',
+                     help='OpenAir files to parse')
+    sub.set_defaults(func=benchCache)
+
+    sub = subparsers.add_parser('parallel',
+                                help='zone building scaling wrt. number of processes')
+    sub.add_argument('openair', metavar='OpenAir', type=str, nargs='+',
+                     help='OpenAir files to parse')
+    sub.add_argument('--jobs', metavar='N', type=int, nargs='+',
+                     help='process counts to try (default: 1, 2, 4... up to CPU count)')
+    sub.set_defaults(func=benchParallel)
+
+    sub = subparsers.add_parser('coords',
+                                help='per string vs batch coordinates conversion')
+    sub.add_argument('openair', metavar='OpenAir', type=str, nargs='+',
+                     help='OpenAir files to take coordinates from')
+    sub.set_defaults(func=benchCoords)
+
+    sub = subparsers.add_parser('arcs',
+                                help='arc building: nearest vertex search vs azimuth indexing')
+    sub.add_argument('openair', metavar='OpenAir', type=str, nargs='+',
+                     help='OpenAir files to take arcs from')
+    sub.set_defaults(func=benchArcs)
+
+    sub = subparsers.add_parser('tolerance',
+                                help='vertex count and intersection speed wrt. arc tolerance')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to compile')
+    sub.add_argument('--tolerance', metavar='METERS', type=float, nargs='+',
+                     default=[1.0, 5.0, 20.0], help='arc tolerances to try')
+    sub.add_argument('--tracks', metavar='N', type=int, default=200,
+                     help='number of random tracks to intersect')
+    sub.set_defaults(func=benchTolerance)
+
+    sub = subparsers.add_parser('prepared',
+                                help='zone/track intersection with raw vs prepared geometries')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to compile')
+    sub.add_argument('--tracks', metavar='N', type=int, default=2000,
+                     help='number of random tracks to intersect')
+    sub.set_defaults(func=benchPrepared)
+
+    sub = subparsers.add_parser('chunks',
+                                help='candidate filtering with whole track vs chunk bboxes')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to compile')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of random long tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=3000,
+                     help='number of points per track')
+    sub.add_argument('--chunk-points', metavar='N', nargs='+',
+                     type=airspace.candidates.chunkPoints, default=[16, 32, 128],
+                     help='chunk sizes to compare')
+    sub.set_defaults(func=benchChunks)
+
+    sub = subparsers.add_parser('classify',
+                                help='per vertex vs vectorized track classification')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to compile')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of random long tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=3000,
+                     help='number of points per track')
+    sub.set_defaults(func=benchClassify)
+
+    sub = subparsers.add_parser('index3d',
+                                help='candidate filtering with a 2D vs 3D spatial index')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to compile')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of random long tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=3000,
+                     help='number of points per track')
+    sub.set_defaults(func=benchIndex3d)
+
+    sub = subparsers.add_parser('limits',
+                                help='vertical limits: per point vs compiled evaluators')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to compile')
+    sub.add_argument('--points', metavar='N', type=int, default=1000,
+                     help='number of points per zone')
+    sub.set_defaults(func=benchLimits)
+
+    sub = subparsers.add_parser('elevcache',
+                                help='quantized elevation cache wrt. its grid size')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file whose AGL zones are used')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of tracks to check')
+    sub.add_argument('--points', metavar='N', type=int, default=300,
+                     help='number of points per track, ~100m apart')
+    sub.add_argument('--subdivide', metavar='N', type=int, default=10,
+                     help='number of fixes per track point')
+    sub.add_argument('--latency', metavar='MS', type=float, default=1,
+                     help='duration of a backend request')
+    sub.add_argument('--grid', metavar='DEG', type=float, nargs='+',
+                     default=[1 / 3600., airspace.altiresolver.CACHE_GRID, 1 / 240.],
+                     help='cache grid sizes to compare')
+    sub.add_argument('--size', metavar='N', type=int,
+                     default=airspace.altiresolver.CACHE_SIZE,
+                     help='cache size')
+    sub.set_defaults(func=benchElevationCache)
+
+    sub = subparsers.add_parser('store',
+                                help='persistent elevation store: cold/warm runs, readers')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file giving the area of the tracks')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=3000,
+                     help='number of points per track, ~100m apart')
+    sub.add_argument('--latency', metavar='MS', type=float, default=5,
+                     help='duration of a backend request')
+    sub.add_argument('--grid', metavar='DEG', type=float,
+                     default=airspace.altiresolver.CACHE_GRID,
+                     help='store grid size')
+    sub.add_argument('--readers', metavar='N', type=int, default=4,
+                     help='number of concurrent reader processes')
+    sub.set_defaults(func=benchElevationStore)
+
+    sub = subparsers.add_parser('geonames',
+                                help='GeoNames resolvers against a local stand-in server')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file giving the area of the tracks')
+    sub.add_argument('--tracks', metavar='N', type=int, default=5,
+                     help='number of tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=500,
+                     help='number of points per track, ~100m apart')
+    sub.add_argument('--latency', metavar='MS', type=float, default=20,
+                     help='duration of a request')
+    sub.add_argument('--fail-every', metavar='N', type=int, default=10,
+                     help='a request out of N fails (HTTP 503)')
+    sub.add_argument('--connections', metavar='N', type=int, nargs='+',
+                     default=[1, 4, 16],
+                     help='numbers of concurrent connections to compare')
+    sub.set_defaults(func=benchGeoNames)
+
+    sub = subparsers.add_parser('prefetch',
+                                help='ground levels prefetch along the tracks')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to check the tracks against')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=3000,
+                     help='number of points per track, ~100m apart')
+    sub.add_argument('--latency', metavar='MS', type=float, default=20,
+                     help='duration of a backend request')
+    sub.set_defaults(func=benchPrefetch)
+
+    sub = subparsers.add_parser('terrain',
+                                help='AGL limits with and without terrain envelopes')
+    sub.add_argument('openair', metavar='OpenAir', type=str,
+                     help='OpenAir file to check the tracks against')
+    sub.add_argument('--tracks', metavar='N', type=int, default=20,
+                     help='number of tracks')
+    sub.add_argument('--points', metavar='N', type=int, default=3000,
+                     help='number of points per track, ~100m apart')
+    sub.add_argument('--streamed', metavar='N', type=int, default=5,
+                     help='number of tracks also fed to the streaming checker')
+    sub.add_argument('--step', metavar='DEG', type=float, default=1 / 240.,
+                     help='ground sampling step')
+    sub.add_argument('--margin', metavar='METERS', type=float,
+                     help='margin added to the sampled levels (default: '
+                     'limits.terrainMargin() of the step)')
+    sub.set_defaults(func=benchTerrain)
+
+    sub = subparsers.add_parser('ossim',
+                                help='ossim process per point vs long lived workers '
+                                '(stand-in scripts)')
+    sub.add_argument('--points', metavar='N', type=int, default=200000,
+                     help='number of points to resolve')
+    sub.add_argument('--track', metavar='N', type=int, default=5000,
+                     help='number of points per call (a track)')
+    sub.add_argument('--process-points', metavar='N', type=int, default=200,
+                     help='number of points for the process per point resolver')
+    sub.add_argument('--init', metavar='MS', type=float, default=50,
+                     help='time to open the elevation database')
+    sub.add_argument('--workers', metavar='N', type=int, nargs='+', default=[1, 2, 4],
+                     help='numbers of workers to compare')
+    sub.add_argument('--batch', metavar='N', type=int,
+                     default=airspace.altiresolver.OSSIM_WORKER_BATCH,
+                     help='number of points per worker request')
+    sub.add_argument('--crash', metavar='N', type=int, default=7,
+                     help='the crashing workers exit on their Nth request')
+    sub.set_defaults(func=benchOssim)
+
+    sub = subparsers.add_parser('hgt',
+                                help='SRTM resolver on synthetic tiles')
+    sub.add_argument('--points', metavar='N', type=int, default=1000000,
+                     help='number of points to resolve')
+    sub.add_argument('--size', metavar='N', type=int, default=1201,
+                     help='tiles size (1201 for SRTM3, 3601 for SRTM1)')
+    sub.set_defaults(func=benchHgt)
+
+    sub = subparsers.add_parser('gpx',
+                                help='GPX loaders on a synthetic multi-hour log')
+    sub.add_argument('--hours', metavar='H', type=float, default=8,
+                     help='duration of the log, one fix per second')
+    sub.add_argument('--segments', metavar='N', type=int, default=4,
+                     help='number of track segments')
+    sub.set_defaults(func=benchGpx)
+
+    args = parser.parse_args()
+    args.func(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
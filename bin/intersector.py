@@ -21,10 +21,13 @@ import sys
 import airspace
 import airspace.shp
 import airspace.track
-import rtree
+import airspace.candidates
+import airspace.checker
 import airspace.altiresolver
+import airspace.error
 import argparse
 import geojson
+import shapely.geometry
 
 def main():
     parser = argparse.ArgumentParser(description='Check airspace.')
@@ -35,47 +38,22 @@ def main():
                         help='airspace data as ESRI Shapefile',
                         required=True)
 
-    parser.add_argument('--altiresolver', metavar='MODE', type=str, 
-                        help='Altitude resolver mode (ossim, geonames, random)',
-                        required=True)
-
-    parser.add_argument('--altiresolver-ossim-config', metavar='FILE', type=str, 
-                        help='Config file path for ossim mode',
-                        required=False)
+    airspace.altiresolver.addArguments(parser)
     
     parser.add_argument('--dumpjson', metavar='FILE', type=str, 
                         help='dump intersecting data as GeoJSON in FILE',
                         required=False)
 
+    parser.add_argument('--chunk-points', metavar='N', type=airspace.candidates.chunkPoints,
+                        default=airspace.candidates.CHUNK_POINTS,
+                        help='number of track points per spatial index query (default %(default)s)')
+
     args = parser.parse_args()
 
-    zones = airspace.shp.loadFromShp(args.shapefile)
-    
-    altir = None
-
-    if args.altiresolver == "ossim":
-        if args.altiresolver_ossim_config:
-            # "/home/marc/SRTM/unzipe/ossim_preferences_template"
-            altir = airspace.altiresolver.OssimResolverWrapper(args.altiresolver_ossim_config)
-        else:
-            print "Missing config file for ossim"
-            return -1
-    elif args.altiresolver == "geonames":
-        altir = airspace.altiresolver.GeoNamesResolver()
-    elif args.altiresolver == "random":
-        altir = airspace.altiresolver.RandomResolver()
-    else:
-        print "Incorrect altitude resolver mode ", args.altiresolver 
-        return -1
-
-    for z in zones:
-        if not z.geometry.is_valid:
-            print "NOT VALID:", z.meta
-
-    if zones:
-        print "Loaded %s zones" % len(zones)
-    else:
-        print "No zone loaded, exiting..."
+    try:
+        altir = airspace.altiresolver.fromArguments(args)
+    except airspace.error.ASCException, e:
+        print e
         return -1
 
     tracks = airspace.track.loadFromGpxToShapely(args.track)
@@ -86,89 +64,64 @@ def main():
     else:
         print "Loaded %d track(s)" % len(tracks)
 
-    spatial_index = rtree.Rtree()
+    # (lon, lat, altitude) index, so that zones far above or below
+    # the track are not candidates
+    spatial_index = airspace.shp.openIndex(args.shapefile, 3)
 
-    # build spatial index for airspaces
-    for idx,zone in enumerate(zones):
-        bbox = zone.geometry.bounds
-        spatial_index.add(idx, bbox)
-    
-    # first filtering wrt. spatial index
-    potential_zones = []
-    for track in tracks:
-        potential_zones += [(zones[i], track) for i in spatial_index.intersection(track.bounds)]
-    
-    print "Potential zones after first filter:", len(potential_zones)
-    for pot_zone in potential_zones:
-        print "-", pot_zone[0].meta['name']
-
-    potential_zones2 = {}
-
-    for pot_zone,track in potential_zones:
-        if track.intersects(pot_zone.geometry):
-            inter_track = track.intersection(pot_zone.geometry)
-            inters = potential_zones2.get(pot_zone, [])
-            inters.append(inter_track)
-            potential_zones2[pot_zone] = inters
-    
-    print "Found %d potential zone(s):" % len(potential_zones2)
-
-    for p in potential_zones2:
-        print "-", p.meta['name']
-
-    confirmed_zones = {}
-
-    for pot_z in potential_zones2:
-        confirmed = False
-        import shapely.geometry.multilinestring
-        import shapely.geometry.linestring
-
-        for it in potential_zones2[pot_z]:
-            if isinstance(it, shapely.geometry.multilinestring.MultiLineString):
-                for it_ls in list(it):
-                    new_inter_coords = []
-                    for p in it_ls.coords:
-                        floor = airspace.util.getFloorAtPoint(altir, pot_z.meta, p[0], p[1])
-                        ceil = airspace.util.getCeilAtPoint(altir, pot_z.meta, p[0], p[1])
-                        if p[2] > floor and p[2] < ceil:
-                            new_inter_coords.append((p[0], p[1]))
-                        elif new_inter_coords:
-                            l = confirmed_zones.get(pot_z,[])
-                            l.append(new_inter_coords)
-                            confirmed_zones[pot_z] = l
-                            new_inter_coords = []
-                        ## print floor, "<", p[2], "<", ceil
-                            # if not confirmed:
-                            #     confirmed_zones.append(pot_z)
-                            #     confirmed = True
-                        
-            elif isinstance(it, shapely.geometry.linestring.LineString):
-                new_inter_coords = []
-                for p in it.coords:
-                    floor = airspace.util.getFloorAtPoint(altir, pot_z.meta, p[0], p[1])
-                    ceil = airspace.util.getCeilAtPoint(altir, pot_z.meta, p[0], p[1])
-
-                    if p[2] > floor and p[2] < ceil:
-                        new_inter_coords.append((p[0], p[1]))
-                    elif new_inter_coords:
-                        l = confirmed_zones.get(pot_z,[])
-                        l.append(new_inter_coords)
-                        confirmed_zones[pot_z] = l
-                        new_inter_coords = []
-
-                    ## print floor, "<", p[2], "<", ceil
-                        # if not confirmed:
-                        #     confirmed_zones.append(pot_z)
-                        #     confirmed = True
+    if spatial_index is None:
+        print "No spatial index found for %s, loading all zones" % args.shapefile
+        zones = dict(enumerate(airspace.shp.loadFromShp(args.shapefile)))
+        spatial_index = airspace.shp.memoryIndex(zones, 3)
+    else:
+        zones = None
+
+    # first filtering wrt. spatial index, using short chunks of
+    # the tracks instead of the whole tracks bbox
+    stats = airspace.candidates.CandidateStats()
+    track_candidates = airspace.candidates.findCandidates(spatial_index, tracks,
+                                                          args.chunk_points, stats)
+
+    if zones is None:
+        # only load zones that may be crossed
+        fids = set()
+        for track, candidates, coords in track_candidates:
+            fids.update(candidates.keys())
+        fids = sorted(fids)
+        zones = dict(zip(fids, airspace.shp.loadFromShp(args.shapefile, fids)))
+
+    for z in zones.values():
+        if not z.geometry.is_valid:
+            print "NOT VALID:", z.meta
+
+    print "Loaded %s zones" % len(zones)
+
+    print "Potential zones after first filter:", stats.chunk
+    for track, candidates, coords in track_candidates:
+        for fid in candidates:
+            print "-", zones[fid].meta['name']
+
+    # lateral test, only with the chunks near each zone, then
+    # classification of the track points wrt. each zone (lateral and
+    # vertical limits), with entry/exit points interpolated
+    confirmed_zones = airspace.checker.confirmZones(track_candidates, zones, altir,
+                                                    args.chunk_points, stats=stats)
+    print "Candidates per stage:", stats
+    altir.flush()
+    for line in airspace.altiresolver.layersStatistics(altir):
+        print line
 
     intersections = []
     for z in confirmed_zones:
-        i = airspace.Intersection(z, shapely.geometry.multilinestring.MultiLineString(confirmed_zones[z]))
+        parts, crossings = confirmed_zones[z]
+        tracks2d = [[(p[0], p[1]) for p in part] for part in parts]
+        i = airspace.Intersection(z, shapely.geometry.MultiLineString(tracks2d))
         intersections.append(i)
 
     print "Confirmed zone(s) :", len(confirmed_zones), len(intersections)
     for conf_zone in confirmed_zones:
         print "-", conf_zone.meta['name']
+        for c in confirmed_zones[conf_zone][1]:
+            print "   %s at lon %f, lat %f, alt %.0fm" % ((c.kind,) + c.point)
 
     # if we asked for GeoJSON dump
     if args.dumpjson:
@@ -19,12 +19,122 @@
 
 import airspace.parser
 import airspace.shp
+import airspace.cache
+import airspace.incremental
+import airspace.util
+import airspace.limits
+import airspace.altiresolver
+import airspace.error
 
 import sys
 
 import argparse
 import os
 
+def checkValidity(res, args):
+    valid_res = []
+    skipped = []
+    print "Checking for validity"
+    for r in res:
+        meta,geometry = r.meta, r.geometry
+        if not geometry.is_valid:
+            print "NOT VALID:", meta
+
+            if args.skip_invalid:
+                skipped.append(r)
+            else:
+                import shapely.wkt
+                test_geo = geometry.buffer(0.0000001)
+
+                if args.fix and test_geo.is_valid:
+                    print "replaced, ok"
+                    valid_res.append(airspace.Zone(meta, test_geo, r.fingerprint))
+                else:
+                    valid_res.append(r)
+                    print "Invalid kept."
+        else:
+            valid_res.append(r)
+    return valid_res, skipped
+
+def addTerrain(zones, altir, step, margin):
+    """
+    Stores in the meta of the zones with AGL limits the envelope of
+    the ground levels below them, so that most track points can be
+    checked against these limits without asking for the ground.
+    """
+    found = 0
+    for z in zones:
+        if not z.limits.agl:
+            continue
+        envelope = airspace.limits.terrainEnvelope(z.geometry, altir, step, margin)
+        if envelope is None:
+            print "No terrain envelope for", z.meta['name']
+            continue
+        z.meta['terrain'] = envelope
+        z.limits = airspace.limits.VerticalLimits(z.meta)
+        found += 1
+    altir.flush()
+    print "Terrain envelope of %d zone(s) with AGL limits" % found
+
+def terrainSettings(args, altir):
+    """
+    Returns a string describing how the terrain envelopes are
+    computed with 'altir', None if they are not.
+    """
+    if altir is None:
+        return None
+    return "terrain %s %s step %r margin %r" % (args.altiresolver, altir.source(),
+                                                args.terrain_step, args.terrain_margin)
+
+def setFingerprints(zones, settings):
+    # the shapefile records the settings of the zones, so that an
+    # incremental update with other ones rebuilds them
+    for z in zones:
+        z.fingerprint = airspace.incremental.settingsFingerprint(z.fingerprint, settings)
+
+def incrementalUpdate(args, altir):
+    """
+    Only rebuilds zones added or changed since the shapefile
+    was written, and patches it.
+    """
+    fingerprints = None
+    if os.path.exists(args.shapefile):
+        fingerprints = airspace.shp.loadFingerprints(args.shapefile)
+    if fingerprints is None:
+        print "No zone fingerprint found in %s, do a full build first." % args.shapefile
+        return -1
+
+    fin = open(args.openair)
+    try:
+        diff = airspace.incremental.diffZones(fingerprints,
+                                              airspace.parser.iterZoneRecords(fin),
+                                              terrainSettings(args, altir))
+    finally:
+        fin.close()
+
+    for records in diff.added:
+        print "+", airspace.incremental.zoneKey(records)[1]
+    for fid, records in diff.changed:
+        print "~", airspace.incremental.zoneKey(records)[1]
+    for fid, key in diff.removed:
+        print "-", key[1]
+    print "%d added, %d changed, %d removed, %d unchanged" % (len(diff.added),
+                                                             len(diff.changed),
+                                                             len(diff.removed),
+                                                             diff.unchanged)
+
+    res = airspace.parser.iterbuild(diff.toBuild(), args.jobs or None)
+    valid_res, skipped = checkValidity(res, args)
+    if skipped:
+        print "Skipped %d zones" % len(skipped)
+    if altir is not None:
+        addTerrain(valid_res, altir, args.terrain_step, args.terrain_margin)
+    setFingerprints(valid_res, terrainSettings(args, altir))
+
+    airspace.shp.updateShp(args.shapefile, diff.toDelete(), valid_res)
+    airspace.shp.writeIndex(args.shapefile)
+    return 0
+
 def main():
     parser = argparse.ArgumentParser(description='Compile OpenAIR file into ESRI Shapefile.')
     parser.add_argument('--openair', metavar='OpenAir', type=str, 
@@ -37,8 +147,66 @@ def main():
                         help='try to fix incorrect geometries USE WITH CARE!!!')
     parser.add_argument('--skip-invalid', action="store_true", default=False, 
                         help='Skip invalid geometries.')
+    parser.add_argument('--jobs', metavar='N', type=int, default=1, 
+                        help='number of processes building zones (0: one per CPU)')
+    parser.add_argument('--arc-tolerance', metavar='METERS', type=float, 
+                        help='maximum distance between arcs/circles and their segments '
+                        '(default: %d segments per quarter of circle)' % airspace.util.QUADSEG)
+    parser.add_argument('--incremental', action="store_true", default=False, 
+                        help='only rebuild zones changed since the existing shapefile was written')
+    parser.add_argument('--no-cache', action="store_true", default=False, 
+                        help='do not use the compiled zones cache')
+    parser.add_argument('--cache-dir', metavar='DIR', type=str, 
+                        help='compiled zones cache directory (default: %s)'
+                        % airspace.cache.defaultCacheDir())
+    parser.add_argument('--clear-cache', action="store_true", default=False, 
+                        help='remove all compiled zones from the cache')
+    parser.add_argument('--prune-cache', metavar='N', type=int, 
+                        help='keep only the N most recently used cache entries')
+
+    # the ground levels below zones with AGL limits are only
+    # computed if a resolver is given
+    airspace.altiresolver.addArguments(parser, required=False)
+    parser.add_argument('--terrain-step', metavar='DEG', type=float,
+                        default=airspace.limits.TERRAIN_STEP,
+                        help='ground sampling step below zones with AGL limits '
+                        '(default %(default)s, not used by the hgt resolver). Each '
+                        'sample is a ground lookup: ~360000 for the AGL zones of '
+                        'France with the default step, 29.6 millions every 3 arc '
+                        'seconds')
+    parser.add_argument('--terrain-margin', metavar='METERS', type=float,
+                        help='margin added to the sampled ground levels (default: '
+                        'a 45 degrees rise over half a step diagonal, %.0fm with '
+                        'the default step, not used by the hgt resolver)'
+                        % airspace.limits.terrainMargin(airspace.limits.TERRAIN_STEP))
 
     args = parser.parse_args()
+    if args.terrain_margin is None:
+        args.terrain_margin = airspace.limits.terrainMargin(args.terrain_step)
+
+    altir = None
+    if args.altiresolver:
+        try:
+            altir = airspace.altiresolver.fromArguments(args)
+        except airspace.error.ASCException, e:
+            print e
+            return -1
+
+    airspace.util.ARC_TOLERANCE = args.arc_tolerance
+
+    cache = None
+    if not args.no_cache:
+        cache = airspace.cache.ZoneCache(args.cache_dir)
+        if args.clear_cache:
+            print "Removed %d cache entries" % cache.invalidate()
+        if args.prune_cache is not None:
+            print "Pruned %d cache entries" % cache.prune(max_entries=args.prune_cache)
+
+    if not args.openair:
+        return
+
+    if args.incremental:
+        return incrementalUpdate(args, altir)
 
     already_warned = False
     for ext in [".shp", ".shx", ".dbf"]:
@@ -52,30 +220,12 @@ def main():
                 print "exiting. Use --force to overwrite"
                 return
 
-    res = airspace.parser.parse(args.openair)
-
-    valid_res = []
-    skipped = []
-    print "Checking for validity"
-    for r in res:
-        meta,geometry = r.meta, r.geometry
-        if not geometry.is_valid:
-            print "NOT VALID:", meta
-
-            if args.skip_invalid:
-                skipped.append(r)
-            else:
-                import shapely.wkt
-                test_geo = geometry.buffer(0.0000001)
+    res = airspace.parser.parse(args.openair, cache, args.jobs or None)
 
-                if args.fix and test_geo.is_valid:
-                    print "replaced, ok"
-                    valid_res.append(airspace.Zone(meta, test_geo))
-                else:
-                    valid_res.append(r)
-                    print "Invalid kept."
-        else:
-            valid_res.append(r)
+    valid_res, skipped = checkValidity(res, args)
+    if altir is not None:
+        addTerrain(valid_res, altir, args.terrain_step, args.terrain_margin)
+    setFingerprints(valid_res, terrainSettings(args, altir))
 
     if not valid_res:
         print "Parser returned 0 zones, not writing anything."
@@ -83,6 +233,8 @@ def main():
         print "Found %d zones" %len(valid_res),
         if skipped:
             print", and skipped %d zones" %len(skipped)
+        print "Total vertex count: %d" % sum([airspace.util.vertexCount(r.geometry)
+                                             for r in valid_res])
         
         ok = True
         for r in valid_res:
@@ -92,6 +244,7 @@ def main():
                 ok = False
 
         airspace.shp.writeToShp(args.shapefile, valid_res)
+        airspace.shp.writeIndex(args.shapefile)
 
 if __name__ == "__main__":
     main()
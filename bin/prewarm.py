@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import argparse
+
+import airspace
+import airspace.shp
+import airspace.altiresolver
+import airspace.error
+
+def main():
+    parser = argparse.ArgumentParser(description='Fills the elevation store with the '
+                                     'ground levels of an area.')
+    parser.add_argument('--bbox', metavar=('MINLON', 'MINLAT', 'MAXLON', 'MAXLAT'),
+                        type=float, nargs=4,
+                        help='area to fill')
+
+    parser.add_argument('--shapefile', metavar='SHP', type=str,
+                        help='fill the bounding boxes of the zones with AGL limits '
+                        'of this airspace data')
+
+    airspace.altiresolver.addArguments(parser)
+
+    args = parser.parse_args()
+    if not args.altiresolver_store:
+        parser.error("--altiresolver-store is required")
+    if (args.bbox is None) == (args.shapefile is None):
+        parser.error("one of --bbox or --shapefile is required")
+
+    try:
+        altir = airspace.altiresolver.fromArguments(args)
+    except airspace.error.ASCException, e:
+        print e
+        return -1
+
+    # the memory cache is of no use here
+    while not isinstance(altir, airspace.altiresolver.StoredResolver):
+        altir = altir.resolver
+
+    if args.bbox:
+        boxes = [args.bbox]
+    else:
+        boxes = [z.geometry.bounds for z in airspace.shp.loadFromShp(args.shapefile)
+                 if z.limits.agl]
+    print "%d area(s) to fill, %d cell(s) already stored" % (len(boxes),
+                                                            altir.store.count())
+
+    start = time.time()
+    resolved = 0
+    for n, box in enumerate(boxes):
+        resolved += altir.prewarm(*box)
+        print "%d/%d area(s), %d cell(s) resolved" % (n + 1, len(boxes), resolved)
+
+    print "%d cell(s) resolved in %.1fs, %d cell(s) stored" % (
+        resolved, time.time() - start, altir.store.count())
+    return 0
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import argparse
+
+import airspace
+import airspace.shp
+import airspace.track
+import airspace.streaming
+import airspace.altiresolver
+import airspace.error
+
+# upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def printHistogram(latencies, width=50):
+    """
+    Prints the histogram of 'latencies' (seconds) over LATENCY_BUCKETS.
+    """
+    counts = [0] * (len(LATENCY_BUCKETS) + 1)
+    for l in latencies:
+        ms = l * 1000
+        i = 0
+        while i < len(LATENCY_BUCKETS) and ms > LATENCY_BUCKETS[i]:
+            i += 1
+        counts[i] += 1
+
+    top = max(counts) or 1
+    for i, count in enumerate(counts):
+        if i < len(LATENCY_BUCKETS):
+            label = "<= %gms" % LATENCY_BUCKETS[i]
+        else:
+            label = "> %gms" % LATENCY_BUCKETS[-1]
+        print "%10s %7d %s" % (label, count, "#" * (count * width / top))
+
+    ordered = sorted(latencies)
+    if ordered:
+        print "p50 %.3fms, p99 %.3fms, max %.3fms" % (
+            ordered[len(ordered) / 2] * 1000,
+            ordered[int(len(ordered) * .99)] * 1000,
+            ordered[-1] * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays a GPX track fix by fix '
+                                     'through the streaming checker.')
+    parser.add_argument('--track', metavar='GPX', type=str,
+                        help='the track to replay', required=True)
+
+    parser.add_argument('--shapefile', metavar='SHP', type=str,
+                        help='airspace data as ESRI Shapefile',
+                        required=True)
+
+    airspace.altiresolver.addArguments(parser)
+
+    parser.add_argument('--speed', metavar='FACTOR', type=float, default=1.0,
+                        help='replay rate wrt. the track times (1 for real time, '
+                        '0 for as fast as possible)')
+
+    parser.add_argument('--neighbourhood', metavar='DEG', type=float,
+                        default=airspace.streaming.NEIGHBOURHOOD,
+                        help='half size of the candidate zones box (default %(default)s)')
+
+    args = parser.parse_args()
+
+    try:
+        altir = airspace.altiresolver.fromArguments(args)
+    except airspace.error.ASCException, e:
+        print e
+        return -1
+
+    zones = dict(enumerate(airspace.shp.loadFromShp(args.shapefile)))
+    spatial_index = airspace.shp.openIndex(args.shapefile)
+    if spatial_index is None:
+        spatial_index = airspace.shp.memoryIndex(zones)
+    print "Loaded %d zones" % len(zones)
+
+    checker = airspace.streaming.StreamingChecker(zones, spatial_index, altir,
+                                                  args.neighbourhood)
+    latencies = []
+    replay_start = time.time()
+    track_start = None
+
+    for lon, lat, ele, t in airspace.track.iterGpxFixes(args.track):
+        if args.speed > 0 and t is not None:
+            if track_start is None:
+                track_start = t
+            delay = replay_start + (t - track_start) / args.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        start = time.time()
+        events = checker.feed(lon, lat, ele or 0., t)
+        latencies.append(time.time() - start)
+
+        for e in events:
+            when = time.strftime("%H:%M:%S", time.gmtime(e.time)) if e.time else "-"
+            print "%s %-5s %s (lon %f, lat %f, alt %.0fm)" % (
+                when, e.kind, e.zone.meta['name'], e.point[0], e.point[1], e.point[2])
+
+    print "%d fixes, %d spatial index queries" % (checker.count, checker.queries)
+    altir.flush()
+    for line in airspace.altiresolver.layersStatistics(altir):
+        print line
+    printHistogram(latencies)
+    return 0
+
+if __name__ == "__main__":
+    main()
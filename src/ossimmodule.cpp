@@ -49,6 +49,21 @@ get_elevation(double lat, double lon){
 
 
 
+// height above MSL only, NaN when unknown
+static double
+get_msl_height(double lat, double lon){
+  ossimGpt gpt;
+  gpt.latd(lat);
+  gpt.lond(lon);
+
+  ossim_float64 hgtAboveMsl = ossimElevManager::instance()->
+    getHeightAboveMSL(gpt);
+
+  if (ossim::isnan(hgtAboveMsl))
+    return ossim::nan();
+  return hgtAboveMsl;
+}
+
 static PyObject *
 ossim_init(PyObject *self, PyObject *args)
 {
@@ -92,10 +107,53 @@ ossim_height(PyObject *self, PyObject *args)
   return get_elevation(lat, lon);
 }
 
+static PyObject *
+ossim_heights(PyObject *self, PyObject *args)
+{
+  PyObject *lats_obj, *lons_obj;
+
+  if (!PyArg_ParseTuple(args, "OO", &lats_obj, &lons_obj))
+        return NULL;
+
+  PyObject *lats = PySequence_Fast(lats_obj, "lats must be a sequence");
+  if (!lats)
+    return NULL;
+  PyObject *lons = PySequence_Fast(lons_obj, "lons must be a sequence");
+  if (!lons) {
+    Py_DECREF(lats);
+    return NULL;
+  }
+
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(lats);
+  if (PySequence_Fast_GET_SIZE(lons) != n) {
+    PyErr_SetString(PyExc_ValueError, "lats and lons must have the same length");
+    Py_DECREF(lats);
+    Py_DECREF(lons);
+    return NULL;
+  }
+
+  PyObject *ret = PyList_New(n);
+  for (Py_ssize_t i = 0; ret && i < n; i++) {
+    double lat = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(lats, i));
+    double lon = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(lons, i));
+    if (PyErr_Occurred()) {
+      Py_CLEAR(ret);
+      break;
+    }
+    PyList_SET_ITEM(ret, i, PyFloat_FromDouble(get_msl_height(lat, lon)));
+  }
+
+  Py_DECREF(lats);
+  Py_DECREF(lons);
+  return ret;
+}
 
 static PyMethodDef OssimMethods[] = {
   {"height",  ossim_height, METH_VARARGS,
    "Give the height of a given point."},
+  {"heights",  ossim_heights, METH_VARARGS,
+   "Give the heights above MSL (NaN if unknown) of the points given as "
+   "sequences of latitudes and longitudes."},
   {"init",  ossim_init, METH_VARARGS,
    "Initialize the OSSIM library."},
   {NULL, NULL, 0, NULL}        /* Sentinel */
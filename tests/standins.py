@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local stand-ins for the elevation services, shared by the tests and
+# bin/benchmark.py.
+
+import os
+import sys
+import time
+import threading
+import urlparse
+import SocketServer
+import BaseHTTPServer
+
+import numpy
+
+import airspace.altiresolver
+
+def hills(lons, lats):
+    """
+    Synthetic ground levels, between 500 and 1500m.
+    """
+    return 1000 + 500 * numpy.sin(numpy.asarray(lons, dtype=float) * 50) * \
+        numpy.cos(numpy.asarray(lats, dtype=float) * 70)
+
+class GeoNamesStandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local stand-in for the GeoNames astergdem/gtopo30 services,
+    answering the levels given by 'levels(lons, lats)' after 'latency'
+    seconds, with HTTP keep-alive. One request out of 'fail_every'
+    gets a 503 error (none if 0). The next requests get the HTTP
+    errors of the 'statuses' list, if any.
+    The number of points of each request is kept in 'batches'.
+    """
+    daemon_threads = True
+
+    def __init__(self, levels=hills, latency=0, fail_every=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), GeoNamesHandler)
+        self.levels = levels
+        self.latency = latency
+        self.fail_every = fail_every
+        self.statuses = []
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.points = 0
+        self.batches = []
+        self.thread = None
+
+    def url(self):
+        return "http://127.0.0.1:%d/" % self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class GeoNamesHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # one write per answer, or Nagle delays the keep-alive answers
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        with self.server.lock:
+            self.server.requests += 1
+            status = None
+            if self.server.statuses:
+                status = self.server.statuses.pop(0)
+            elif self.server.fail_every and \
+                    self.server.requests % self.server.fail_every == 0:
+                status = 503
+        time.sleep(self.server.latency)
+
+        if status is None and url.path.strip('/') not in airspace.altiresolver.VALID_GN_SRC:
+            status = 404
+        if status is not None:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        lats = [float(v) for v in query['lats'][0].split(',')]
+        lons = [float(v) for v in query['lngs'][0].split(',')]
+        with self.server.lock:
+            self.server.points += len(lons)
+            self.server.batches.append(len(lons))
+        body = "".join(["%d\r\n" % round(l) for l in self.server.levels(lons, lats)])
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+FAKE_OSSIM_WORKER = """#!%(python)s
+# stand-in for ossimworker.py, giving the levels of standins.hills().
+# Exits on its CRASH-th request if CRASH is not 0. Hangs on its first
+# request if the file HANG does not exist yet, creating it.
+import os, sys, time, math
+sys.path.insert(0, %(path)r)
+import airspace.ossimworker
+time.sleep(%(init)f)
+count = [0]
+def heights(lats, lons):
+    count[0] += 1
+    if count[0] == %(crash)d:
+        sys.exit(1)
+    if %(hang)r and not os.path.exists(%(hang)r):
+        open(%(hang)r, "w").close()
+        time.sleep(3600)
+    return [1000 + 500 * math.sin(lon * 50) * math.cos(lat * 70)
+            for lat, lon in zip(lats, lons)]
+airspace.ossimworker.serve(heights)
+"""
+
+def writeScript(path, template, **values):
+    """
+    Writes the executable script 'path' from 'template', with the
+    python interpreter ('python') and the root of the sources ('path')
+    in 'values'.
+    """
+    values.update(python=sys.executable,
+                  path=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    fout = open(path, "w")
+    try:
+        fout.write(template % values)
+    finally:
+        fout.close()
+    os.chmod(path, 0755)
+
+def writeOssimWorker(path, init=0, crash=0, hang=""):
+    writeScript(path, FAKE_OSSIM_WORKER, init=init, crash=crash, hang=hang)
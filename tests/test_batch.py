@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import imp
+import json
+import shutil
+import tempfile
+import unittest
+
+batch = imp.load_source("batch", os.path.join(os.path.dirname(os.path.dirname(
+                os.path.abspath(__file__))), "bin", "batch.py"))
+
+class LoadDoneTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, "out.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        fout = open(self.output, "wb")
+        fout.write(text)
+        fout.close()
+
+    def read(self):
+        return open(self.output, "rb").read()
+
+    def test_missing(self):
+        self.assertEqual(batch.loadDone(self.output), set())
+
+    def test_errors_are_retried(self):
+        lines = [json.dumps({'track': "a.gpx", 'zones': []}),
+                 json.dumps({'track': "b.gpx", 'error': "IOError: timed out"}),
+                 json.dumps({'track': "c.gpx", 'error': "IOError: timed out"}),
+                 json.dumps({'track': "c.gpx", 'zones': []})]
+        self.write("\n".join(lines) + "\n")
+        self.assertEqual(batch.loadDone(self.output), set(["a.gpx", "c.gpx"]))
+        self.assertEqual(self.read(), "\n".join(lines) + "\n")
+
+    def test_partial_line(self):
+        first = json.dumps({'track': "a.gpx", 'zones': []}) + "\n"
+        self.write(first + '{"track": "b.gpx", "zo')
+        self.assertEqual(batch.loadDone(self.output), set(["a.gpx"]))
+        self.assertEqual(self.read(), first)
+
+    def test_missing_newline(self):
+        # complete, but the next line would be appended to it
+        first = json.dumps({'track': "a.gpx", 'zones': []}) + "\n"
+        self.write(first + json.dumps({'track': "b.gpx", 'zones': []}))
+        self.assertEqual(batch.loadDone(self.output), set(["a.gpx"]))
+        self.assertEqual(self.read(), first)
+
+if __name__ == "__main__":
+    unittest.main()
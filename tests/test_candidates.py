@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import argparse
+import unittest
+
+import numpy
+
+from airspace.candidates import chunkBounds, chunkPoints, chunkRanges
+
+class ChunksTest(unittest.TestCase):
+    def test_bounds(self):
+        coords = numpy.array([(0, 0), (1, 2), (3, 1), (2, 5), (4, 4)], dtype=float)
+        numpy.testing.assert_array_equal(chunkBounds(coords, 3),
+                                         [(0, 0, 3, 2), (2, 1, 4, 5)])
+        numpy.testing.assert_array_equal(chunkBounds(coords, 2),
+                                         [(0, 0, 1, 2), (1, 1, 3, 2), (2, 1, 3, 5),
+                                          (2, 4, 4, 5)])
+        self.assertEqual(chunkRanges([0, 1, 3], 2), [(0, 3), (3, 5)])
+
+    def test_chunk_points(self):
+        self.assertEqual(chunkPoints("2"), 2)
+        for text in ("1", "0", "-5"):
+            self.assertRaises(argparse.ArgumentTypeError, chunkPoints, text)
+        coords = numpy.zeros((10, 2))
+        self.assertRaises(AssertionError, chunkBounds, coords, 1)
+        self.assertRaises(AssertionError, chunkRanges, [0], 0)
+
+if __name__ == "__main__":
+    unittest.main()
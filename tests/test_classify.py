@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy
+import shapely.geometry
+
+from airspace.classify import findCrossings, insideParts, pointsInPolygon, \
+    polygonEdges
+
+SQUARE = shapely.geometry.Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+
+def star():
+    # concave, with a hole and a second part
+    points = []
+    for i in range(10):
+        radius = 1 if i % 2 else 0.4
+        angle = numpy.pi * i / 5
+        points.append((radius * numpy.cos(angle), radius * numpy.sin(angle)))
+    hole = shapely.geometry.Point(0, 0).buffer(0.2).exterior
+    return shapely.geometry.MultiPolygon([shapely.geometry.Polygon(points, [hole]),
+                                          shapely.geometry.box(1.5, -0.5, 2, 0.5)])
+
+def constant(value, count):
+    values = numpy.empty(count)
+    values.fill(value)
+    return values
+
+class PointsInPolygonTest(unittest.TestCase):
+    def test_known_points(self):
+        xy = numpy.array([(0.5, 0.5), (1.5, 0.5), (-0.1, 0.5), (0.5, 2)])
+        self.assertEqual(list(pointsInPolygon(xy, SQUARE)), [True, False, False, False])
+        # hole, body, notch, notch, second part, outside
+        xy = numpy.array([(0, 0), (0.3, 0), (0.9, 0), (0, 0.9), (1.75, 0), (1.2, 0)])
+        self.assertEqual(list(pointsInPolygon(xy, star())),
+                         [False, True, False, False, True, False])
+
+    def test_shapely(self):
+        polygon = star()
+        xy = numpy.random.RandomState(0).uniform(-1.2, 2.2, (2000, 2))
+        expected = [polygon.contains(shapely.geometry.Point(p)) for p in xy]
+        self.assertEqual(list(pointsInPolygon(xy, polygon, polygonEdges(polygon))),
+                         expected)
+
+class CrossingsTest(unittest.TestCase):
+    def crossings(self, points, floor=0., ceiling=1000., polygon=SQUARE, **kw):
+        points = numpy.array(points, dtype=float)
+        mask, crossings = findCrossings(points, polygon, constant(floor, len(points)),
+                                        constant(ceiling, len(points)), **kw)
+        return points, mask, crossings
+
+    def assertCrossings(self, crossings, expected):
+        self.assertEqual([(c.kind, c.index) for c in crossings],
+                         [(kind, index) for kind, index, fraction in expected])
+        numpy.testing.assert_allclose([c.fraction for c in crossings],
+                                      [fraction for kind, index, fraction in expected])
+
+    def test_clipped_segment(self):
+        # both ends outside, the zone is crossed in between
+        points, mask, crossings = self.crossings([(-1, 0.5, 100), (2, 0.5, 100)],
+                                                 times=numpy.array([0., 30.]))
+        self.assertEqual(list(mask), [False, False])
+        self.assertCrossings(crossings, [('entry', 0, 1 / 3.), ('exit', 0, 2 / 3.)])
+        numpy.testing.assert_allclose([c.time for c in crossings], [10, 20])
+        numpy.testing.assert_allclose(insideParts(points, crossings),
+                                      [[(0, 0.5, 100), (1, 0.5, 100)]])
+
+    def test_clipped_corner(self):
+        points, mask, crossings = self.crossings([(0.5, -0.5, 100), (1.5, 0.5, 100)])
+        self.assertCrossings(crossings, [])
+        points, mask, crossings = self.crossings([(0.4, -0.5, 100), (1.4, 0.5, 100)])
+        self.assertCrossings(crossings, [('entry', 0, 0.5), ('exit', 0, 0.6)])
+
+    def test_climb_through(self):
+        # from below the floor to above the ceiling in one segment
+        points, mask, crossings = self.crossings([(0.5, 0.5, -1000), (0.5, 0.5, 3000)])
+        self.assertCrossings(crossings, [('entry', 0, 0.25), ('exit', 0, 0.5)])
+
+    def test_over_the_top(self):
+        # laterally through the zone, above the ceiling in the middle
+        points, mask, crossings = self.crossings([(-1, 0.5, 500), (0.5, 0.5, 1100),
+                                                  (2, 0.5, 500)])
+        self.assertCrossings(crossings, [('entry', 0, 2 / 3.), ('exit', 0, 5 / 6.),
+                                         ('entry', 1, 1 / 6.), ('exit', 1, 1 / 3.)])
+
+    def test_vertices(self):
+        points, mask, crossings = self.crossings([(-1, 0.5, 100), (0, 0.5, 100),
+                                                  (0.5, 0.5, 100), (1, 0.5, 100),
+                                                  (2, 0.5, 100)])
+        self.assertCrossings(crossings, [('entry', 1, 0), ('exit', 2, 1)])
+        numpy.testing.assert_allclose(insideParts(points, crossings),
+                                      [[(0, 0.5, 100), (0.5, 0.5, 100), (1, 0.5, 100)]])
+
+    def test_inside(self):
+        points = [(0.2, 0.5, 100), (0.8, 0.5, 100)]
+        self.assertCrossings(self.crossings(points)[2], [('entry', 0, 0)])
+        self.assertCrossings(self.crossings(points, inside=True)[2], [])
+        self.assertCrossings(self.crossings(points[:1])[2], [('entry', 0, 0)])
+        self.assertCrossings(self.crossings([(2, 0.5, 100)], inside=True)[2],
+                             [('exit', 0, 0)])
+
+    def test_no_ceiling(self):
+        points, mask, crossings = self.crossings([(-1, 0.5, 100), (2, 0.5, 100)],
+                                                 ceiling=numpy.inf)
+        self.assertCrossings(crossings, [('entry', 0, 1 / 3.), ('exit', 0, 2 / 3.)])
+
+    def test_hole(self):
+        ring = SQUARE.buffer(2, join_style=2)
+        polygon = shapely.geometry.Polygon(ring.exterior, [SQUARE.exterior])
+        points, mask, crossings = self.crossings([(-3, 0.5, 100), (4, 0.5, 100)],
+                                                 polygon=polygon)
+        self.assertCrossings(crossings, [('entry', 0, 1 / 7.), ('exit', 0, 3 / 7.),
+                                         ('entry', 0, 4 / 7.), ('exit', 0, 6 / 7.)])
+
+class IntersectionTest(unittest.TestCase):
+    """
+    With unbounded limits, the inside parts are the intersection of
+    the track and the zone, whatever the sampling of the track.
+    """
+    def test_sparse_tracks(self):
+        polygon = star()
+        rand = numpy.random.RandomState(0)
+        for count in (2, 3, 5, 20, 100):
+            for n in range(20):
+                points = numpy.column_stack((rand.uniform(-1.5, 2.5, (count, 2)),
+                                             rand.uniform(0, 1000, count)))
+                mask, crossings = findCrossings(points, polygon,
+                                                constant(-numpy.inf, count),
+                                                constant(numpy.inf, count))
+                parts = insideParts(points, crossings)
+                length = sum([shapely.geometry.LineString(numpy.array(p)[:, :2]).length
+                              for p in parts])
+                track = shapely.geometry.LineString(points[:, :2])
+                self.assertAlmostEqual(length, track.intersection(polygon).length)
+
+if __name__ == "__main__":
+    unittest.main()
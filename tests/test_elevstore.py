@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import argparse
+import tempfile
+import unittest
+
+import numpy
+
+import airspace.error
+import airspace.altiresolver
+from airspace.altiresolver import GeoNamesResolver, HgtResolver
+
+from test_hgt import writeTile
+
+class SourceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.srtm3 = os.path.join(self.directory, "srtm3")
+        self.srtm1 = os.path.join(self.directory, "srtm1")
+        for path, size, level in ((self.srtm3, 11, 500), (self.srtm1, 21, 700)):
+            os.mkdir(path)
+            writeTile(path, 45, 6, numpy.ones((size, size)) * level)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def resolver(self, *options):
+        parser = argparse.ArgumentParser()
+        airspace.altiresolver.addArguments(parser)
+        return airspace.altiresolver.fromArguments(parser.parse_args(list(options)))
+
+    def test_sources(self):
+        self.assertNotEqual(HgtResolver(self.srtm3).source(),
+                            HgtResolver(self.srtm1).source())
+        # same directory, other tiles
+        source = HgtResolver(self.srtm3).source()
+        writeTile(self.srtm3, 45, 6, numpy.ones((21, 21)))
+        self.assertNotEqual(HgtResolver(self.srtm3).source(), source)
+
+        self.assertNotEqual(GeoNamesResolver("gtopo30").source(),
+                            GeoNamesResolver("astergdem").source())
+        self.assertNotEqual(GeoNamesResolver(url="http://a/").source(),
+                            GeoNamesResolver(url="http://b/").source())
+
+    def test_shared_store(self):
+        path = os.path.join(self.directory, "levels.sqlite")
+        for directory, level in ((self.srtm3, 500), (self.srtm1, 700), (self.srtm3, 500)):
+            altir = self.resolver("--altiresolver", "hgt", "--altiresolver-hgt-dir",
+                                  directory, "--altiresolver-store", path)
+            self.assertEqual(list(altir.getGroundLevelsAt([6.5], [45.5])), [level])
+            altir.flush()
+        self.assertEqual(altir.hits, 1)
+
+    def test_random_not_stored(self):
+        path = os.path.join(self.directory, "levels.sqlite")
+        self.assertRaises(airspace.error.ASCException, self.resolver,
+                          "--altiresolver", "random", "--altiresolver-store", path)
+        self.assertFalse(os.path.exists(path))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import threading
+import unittest
+
+import numpy
+
+import airspace.error
+from airspace.altiresolver import ConcurrentGeoNamesResolver, GEONAMES_BATCH
+
+from standins import GeoNamesStandIn, hills
+
+def seaOnTheWest(lons, lats):
+    # GeoNames gives -9999 for the sea
+    levels = numpy.round(hills(lons, lats))
+    levels[numpy.asarray(lons) < 6] = -9999
+    return levels
+
+class GeoNamesTestCase(unittest.TestCase):
+    levels = staticmethod(hills)
+    latency = 0
+
+    def setUp(self):
+        self.server = GeoNamesStandIn(self.levels, self.latency).start()
+        self.resolvers = []
+
+    def tearDown(self):
+        for altir in self.resolvers:
+            altir.close()
+        self.server.stop()
+
+    def resolver(self, **kw):
+        kw.setdefault('backoff', 0.01)
+        altir = ConcurrentGeoNamesResolver(url=self.server.url(), **kw)
+        self.resolvers.append(altir)
+        return altir
+
+    def points(self, count, seed=0):
+        # with the precision of the requests, so that the stand-in
+        # levels can be compared
+        rand = numpy.random.RandomState(seed)
+        return (numpy.round(rand.uniform(5, 7, count), 6),
+                numpy.round(rand.uniform(44, 46, count), 6))
+
+class LevelsTest(GeoNamesTestCase):
+    levels = staticmethod(seaOnTheWest)
+
+    def test_levels(self):
+        lons, lats = self.points(50)
+        levels = self.resolver().getGroundLevelsAt(lons, lats)
+        expected = numpy.round(hills(lons, lats))
+        expected[lons < 6] = 0
+        numpy.testing.assert_array_equal(levels, expected)
+        self.assertTrue((levels == 0).any())
+
+    def test_feet(self):
+        lons, lats = self.points(10)
+        levels = self.resolver(unit="foot").getGroundLevelsAt(lons, lats)
+        meters = self.resolver().getGroundLevelsAt(lons, lats)
+        numpy.testing.assert_allclose(levels * 0.3048, meters)
+
+    def test_batches(self):
+        lons, lats = self.points(2 * GEONAMES_BATCH + 5)
+        altir = self.resolver()
+        altir.getGroundLevelsAt(lons, lats)
+        self.assertEqual(sorted(self.server.batches),
+                         [5, GEONAMES_BATCH, GEONAMES_BATCH])
+        self.assertEqual(altir.requests, 3)
+
+class ErrorsTest(GeoNamesTestCase):
+    def test_retries(self):
+        self.server.statuses = [503, 502]
+        lons, lats = self.points(5)
+        altir = self.resolver(retries=3, backoff=0.1)
+        start = time.time()
+        levels = altir.getGroundLevelsAt(lons, lats)
+        # 0.1s then 0.2s before the retries
+        self.assertTrue(time.time() - start >= 0.3)
+        numpy.testing.assert_array_equal(levels, numpy.round(hills(lons, lats)))
+        self.assertEqual(altir.retried, 2)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_retries_used_up(self):
+        self.server.statuses = [503] * 3
+        lons, lats = self.points(5)
+        altir = self.resolver(retries=2)
+        self.assertRaises(airspace.error.ASCException, altir.getGroundLevelsAt, lons, lats)
+        self.assertEqual(self.server.requests, 3)
+        # the resolver is still usable
+        levels = altir.getGroundLevelsAt(lons, lats)
+        numpy.testing.assert_array_equal(levels, numpy.round(hills(lons, lats)))
+
+    def test_client_error(self):
+        self.server.statuses = [404]
+        lons, lats = self.points(5)
+        altir = self.resolver(retries=3)
+        self.assertRaises(airspace.error.ASCException, altir.getGroundLevelsAt, lons, lats)
+        # not retried
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(altir.retried, 0)
+
+class CoalescingTest(GeoNamesTestCase):
+    latency = 0.2
+
+    def test_same_call(self):
+        lons, lats = self.points(5)
+        lons = numpy.tile(lons, 10)
+        lats = numpy.tile(lats, 10)
+        altir = self.resolver()
+        levels = altir.getGroundLevelsAt(lons, lats)
+        numpy.testing.assert_array_equal(levels, numpy.round(hills(lons, lats)))
+        self.assertEqual(self.server.points, 5)
+        self.assertEqual(altir.coalesced, 45)
+
+    def test_concurrent_calls(self):
+        lons, lats = self.points(30)
+        altir = self.resolver(connections=4)
+        results = {}
+        def resolve(name, start, stop):
+            results[name] = altir.getGroundLevelsAt(lons[start:stop], lats[start:stop])
+        threads = [threading.Thread(target=resolve, args=("first", 0, 20)),
+                   threading.Thread(target=resolve, args=("second", 10, 30))]
+        threads[0].start()
+        # the second call starts while the points of the first are asked
+        time.sleep(0.05)
+        threads[1].start()
+        for t in threads:
+            t.join()
+
+        expected = numpy.round(hills(lons, lats))
+        numpy.testing.assert_array_equal(results["first"], expected[0:20])
+        numpy.testing.assert_array_equal(results["second"], expected[10:30])
+        self.assertEqual(self.server.points, 30)
+        self.assertEqual(altir.coalesced, 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import airspace.altiresolver
+from airspace.altiresolver import HgtResolver, HGT_VOID, hgtTileName
+
+# 0.1 degree between samples
+SIZE = 11
+
+def writeTile(directory, lat0, lon0, levels, name=None):
+    path = os.path.join(directory, name or hgtTileName(lat0, lon0))
+    numpy.asarray(levels).astype('>i2').tofile(path)
+
+def planeTile(lat0, lon0, size=SIZE):
+    """
+    Levels of a tile on the plane 1000 + 30 * lat + 20 * lon (lat/lon
+    counted in samples from the south west corner), which bilinear
+    interpolation gives exactly.
+    """
+    rows, cols = numpy.mgrid[0:size, 0:size]
+    return 1000 + 30 * (size - 1 - rows) + 20 * cols
+
+def planeLevels(lons, lats, size=SIZE):
+    lons = numpy.asarray(lons, dtype=float)
+    lats = numpy.asarray(lats, dtype=float)
+    return 1000 + 30 * (lats - numpy.floor(lats)) * (size - 1) + \
+        20 * (lons - numpy.floor(lons)) * (size - 1)
+
+def bilinear(levels, lat0, lon0, lon, lat):
+    last = levels.shape[0] - 1
+    x = (lon - lon0) * last
+    y = (lat0 + 1 - lat) * last
+    col, row = min(int(x), last - 1), min(int(y), last - 1)
+    dx, dy = x - col, y - row
+    return (levels[row, col] * (1 - dx) * (1 - dy) +
+            levels[row, col + 1] * dx * (1 - dy) +
+            levels[row + 1, col] * (1 - dx) * dy +
+            levels[row + 1, col + 1] * dx * dy)
+
+class HgtTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+class TileNameTest(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(hgtTileName(45, 6), "N45E006.hgt")
+        self.assertEqual(hgtTileName(0, 0), "N00E000.hgt")
+        self.assertEqual(hgtTileName(-1, -1), "S01W001.hgt")
+        self.assertEqual(hgtTileName(-34, 151), "S34E151.hgt")
+        self.assertEqual(hgtTileName(19, -156), "N19W156.hgt")
+
+class InterpolationTest(HgtTestCase):
+    def test_plane_is_exact(self):
+        writeTile(self.directory, 45, 6, planeTile(45, 6))
+        rand = numpy.random.RandomState(0)
+        lons = rand.uniform(6, 7, 1000)
+        lats = rand.uniform(45, 46, 1000)
+        levels = HgtResolver(self.directory).getGroundLevelsAt(lons, lats)
+        numpy.testing.assert_allclose(levels, planeLevels(lons, lats), atol=1e-6)
+
+    def test_bilinear(self):
+        rand = numpy.random.RandomState(1)
+        tile = rand.randint(0, 4000, (SIZE, SIZE))
+        writeTile(self.directory, 45, 6, tile)
+        lons = rand.uniform(6, 7, 200)
+        lats = rand.uniform(45, 46, 200)
+        levels = HgtResolver(self.directory).getGroundLevelsAt(lons, lats)
+        expected = [bilinear(tile, 45, 6, lon, lat) for lon, lat in zip(lons, lats)]
+        numpy.testing.assert_allclose(levels, expected, atol=1e-6)
+
+    def test_samples(self):
+        tile = planeTile(45, 6)
+        writeTile(self.directory, 45, 6, tile)
+        # on the samples, levels are the ones of the tile
+        levels = HgtResolver(self.directory).getGroundLevelsAt([6.3, 6.0], [45.8, 45.0])
+        numpy.testing.assert_allclose(levels, [tile[2, 3], tile[SIZE - 1, 0]])
+
+    def test_edges(self):
+        for lat0 in (45, 46):
+            for lon0 in (6, 7):
+                writeTile(self.directory, lat0, lon0, planeTile(lat0, lon0))
+        altir = HgtResolver(self.directory)
+        # west and south edges are in the tile, east and north edges
+        # in the next ones
+        lons = [6.0, 6.5, 6.9999999, 7.0, 6.5, 6.5]
+        lats = [45.5, 45.0, 45.5, 45.5, 45.9999999, 46.0]
+        levels = altir.getGroundLevelsAt(lons, lats)
+        numpy.testing.assert_allclose(levels, planeLevels(lons, lats), atol=1e-4)
+        self.assertAlmostEqual(levels[2], 1000 + 30 * 5 + 20 * 10, 3)
+        self.assertAlmostEqual(levels[3], 1000 + 30 * 5)
+
+    def test_negative_coordinates(self):
+        for lat0, lon0 in ((-1, -1), (-34, 151), (19, -156)):
+            writeTile(self.directory, lat0, lon0, planeTile(lat0, lon0))
+        lons = [-0.25, -0.95, 151.5, -155.05]
+        lats = [-0.5, -0.05, -33.15, 19.75]
+        levels = HgtResolver(self.directory).getGroundLevelsAt(lons, lats)
+        numpy.testing.assert_allclose(levels, planeLevels(lons, lats), atol=1e-6)
+
+    def test_lowercase_name(self):
+        writeTile(self.directory, 45, 6, planeTile(45, 6), "n45e006.hgt")
+        levels = HgtResolver(self.directory).getGroundLevelsAt([6.5], [45.5])
+        self.assertAlmostEqual(levels[0], planeLevels([6.5], [45.5])[0])
+
+    def test_not_a_tile(self):
+        open(os.path.join(self.directory, "N45E006.hgt"), "wb").write("\0" * 7)
+        self.assertRaises(airspace.error.ASCException,
+                          HgtResolver(self.directory).getGroundLevelsAt, [6.5], [45.5])
+
+    def test_open_tiles(self):
+        for lon0 in (6, 7, 8):
+            writeTile(self.directory, 45, lon0, planeTile(45, lon0))
+        altir = HgtResolver(self.directory, max_tiles=2)
+        for lon in (6.5, 7.5, 6.5, 8.5, 7.5):
+            altir.getGroundLevelsAt([lon], [45.5])
+        self.assertEqual(len(altir.tiles), 2)
+        # 7 was closed when 8 was opened
+        self.assertEqual(altir.opened, 4)
+
+class VoidTest(HgtTestCase):
+    def setUp(self):
+        HgtTestCase.setUp(self)
+        tile = planeTile(45, 6)
+        tile[5, 5] = HGT_VOID
+        writeTile(self.directory, 45, 6, tile)
+
+    def test_void(self):
+        # the 4 cells around the void sample, then cells next to them
+        lons = [6.45, 6.55, 6.45, 6.55, 6.5, 6.35, 6.65]
+        lats = [45.45, 45.45, 45.55, 45.55, 45.5, 45.5, 45.5]
+        levels = HgtResolver(self.directory).getGroundLevelsAt(lons, lats)
+        self.assertTrue(numpy.isnan(levels[:5]).all())
+        numpy.testing.assert_allclose(levels[5:], planeLevels(lons[5:], lats[5:]))
+
+    def test_missing_value(self):
+        altir = HgtResolver(self.directory, missing=-1)
+        levels = altir.getGroundLevelsAt([6.45, 6.5, 8.5], [45.45, 45.1, 45.5])
+        self.assertEqual(levels[0], -1)
+        self.assertAlmostEqual(levels[1], planeLevels([6.5], [45.1])[0])
+        # no tile
+        self.assertEqual(levels[2], -1)
+
+    def test_missing_tile(self):
+        levels = HgtResolver(self.directory).getGroundLevelsAt([7.5, -6.5], [45.5, 45.5])
+        self.assertTrue(numpy.isnan(levels).all())
+
+class LevelRangeTest(HgtTestCase):
+    def setUp(self):
+        HgtTestCase.setUp(self)
+        rand = numpy.random.RandomState(2)
+        self.tiles = {}
+        for lat0 in (44, 45):
+            for lon0 in (5, 6):
+                self.tiles[(lat0, lon0)] = rand.randint(0, 4000, (SIZE, SIZE))
+                writeTile(self.directory, lat0, lon0, self.tiles[(lat0, lon0)])
+
+    def test_bounds_levels(self):
+        altir = HgtResolver(self.directory)
+        rand = numpy.random.RandomState(3)
+        for n in xrange(50):
+            minlon, maxlon = sorted(rand.uniform(5, 7, 2))
+            minlat, maxlat = sorted(rand.uniform(44, 46, 2))
+            low, high = altir.levelRange(minlon, minlat, maxlon, maxlat)
+            lons = rand.uniform(minlon, maxlon, 500)
+            lats = rand.uniform(minlat, maxlat, 500)
+            # corners of the box too
+            lons = numpy.concatenate((lons, [minlon, minlon, maxlon, maxlon]))
+            lats = numpy.concatenate((lats, [minlat, maxlat, minlat, maxlat]))
+            levels = altir.getGroundLevelsAt(lons, lats)
+            self.assertTrue(low <= levels.min(), (minlon, minlat, maxlon, maxlat))
+            self.assertTrue(levels.max() <= high, (minlon, minlat, maxlon, maxlat))
+
+    def test_samples_only(self):
+        # a box between 4 samples only uses them
+        altir = HgtResolver(self.directory)
+        tile = self.tiles[(45, 6)]
+        low, high = altir.levelRange(6.31, 45.71, 6.39, 45.79)
+        self.assertEqual((low, high), (tile[2:4, 3:5].min(), tile[2:4, 3:5].max()))
+
+    def test_void_or_missing_tile(self):
+        tile = self.tiles[(45, 6)].copy()
+        tile[5, 5] = HGT_VOID
+        writeTile(self.directory, 45, 6, tile)
+        altir = HgtResolver(self.directory)
+        self.assertEqual(altir.levelRange(6.4, 45.4, 6.6, 45.6), None)
+        self.assertNotEqual(altir.levelRange(6.1, 45.1, 6.3, 45.3), None)
+        self.assertEqual(altir.levelRange(6.5, 45.5, 7.5, 45.8), None)
+
+if __name__ == "__main__":
+    unittest.main()
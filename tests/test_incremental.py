@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import StringIO
+
+import airspace.util
+import airspace.parser
+from airspace.incremental import diffZones, settingsFingerprint, zoneKey
+
+OPENAIR = """
+* two zones
+AC R
+AN R 1
+AH 3000F ASFC
+AL SFC
+DP 45:00:00 N 006:00:00 E
+DP 45:10:00 N 006:00:00 E
+DP 45:10:00 N 006:10:00 E
+DP 45:00:00 N 006:00:00 E
+
+AC D
+AN D 2
+AH FL115
+AL 1000F AMSL
+V X=45:30:00 N 006:30:00 E
+DC 5
+"""
+
+def zoneRecords(text=OPENAIR):
+    return list(airspace.parser.iterZoneRecords(StringIO.StringIO(text)))
+
+def builtFingerprints(settings=None):
+    """
+    Fingerprints of a shapefile written from OPENAIR with the
+    current settings (fids are the zone indices).
+    """
+    zones = airspace.parser.iterbuild(zoneRecords())
+    return [(fid, zoneKey(records), settingsFingerprint(z.fingerprint, settings))
+            for fid, (records, z) in enumerate(zip(zoneRecords(), zones))]
+
+class DiffTest(unittest.TestCase):
+    def setUp(self):
+        self.settings = (airspace.util.QUADSEG, airspace.util.ARC_TOLERANCE,
+                         airspace.parser.PARSER_VERSION)
+
+    def tearDown(self):
+        (airspace.util.QUADSEG, airspace.util.ARC_TOLERANCE,
+         airspace.parser.PARSER_VERSION) = self.settings
+
+    def assertRebuilt(self, diff, changed):
+        self.assertEqual(sorted(fid for fid, records in diff.changed), changed)
+        self.assertEqual(diff.unchanged, 2 - len(changed))
+        self.assertEqual((diff.added, diff.removed), ([], []))
+
+    def test_unchanged(self):
+        self.assertRebuilt(diffZones(builtFingerprints(), zoneRecords()), [])
+
+    def test_edited_zone(self):
+        diff = diffZones(builtFingerprints(), zoneRecords(OPENAIR.replace("DC 5", "DC 6")))
+        self.assertRebuilt(diff, [1])
+
+    def test_arc_tolerance(self):
+        old = builtFingerprints()
+        airspace.util.ARC_TOLERANCE = 50
+        self.assertRebuilt(diffZones(old, zoneRecords()), [0, 1])
+
+    def test_quadseg(self):
+        old = builtFingerprints()
+        airspace.util.QUADSEG = 45
+        self.assertRebuilt(diffZones(old, zoneRecords()), [0, 1])
+
+    def test_parser_version(self):
+        old = builtFingerprints()
+        airspace.parser.PARSER_VERSION += 1
+        self.assertRebuilt(diffZones(old, zoneRecords()), [0, 1])
+
+    def test_settings(self):
+        old = builtFingerprints("terrain hgt /srtm")
+        self.assertRebuilt(diffZones(old, zoneRecords(), "terrain hgt /srtm"), [])
+        self.assertRebuilt(diffZones(old, zoneRecords(), "terrain hgt /other"), [0, 1])
+        self.assertRebuilt(diffZones(old, zoneRecords()), [0, 1])
+        self.assertRebuilt(diffZones(builtFingerprints(), zoneRecords(), "terrain hgt /srtm"),
+                           [0, 1])
+
+if __name__ == "__main__":
+    unittest.main()
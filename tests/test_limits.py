@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import numpy
+import shapely.geometry
+
+from airspace.altiresolver import AltiResolver
+from airspace.classify import findCrossings
+from airspace.limits import FOOT, VerticalLimits, compileLimit, terrainEnvelope, \
+    terrainMargin
+
+from standins import hills
+
+class HillsResolver(AltiResolver):
+    """
+    Levels of standins.hills(), counting the points asked.
+    """
+    def __init__(self):
+        self.points = 0
+
+    def getGroundLevelsAt(self, lons, lats):
+        self.points += len(lons)
+        return hills(lons, lats)
+
+class RangeResolver(HillsResolver):
+    def levelRange(self, minlon, minlat, maxlon, maxlat):
+        return (500., 1500.)
+
+def meta(floor, ceiling, terrain=None):
+    m = {'floor': floor, 'ceiling': ceiling}
+    if terrain is not None:
+        m['terrain'] = terrain
+    return m
+
+SFC = {'fromground': True}
+UNL = {'nolimit': True}
+FL65 = {'flevel': 65}
+AGL_1000F = {'basealti': (1000, 'F'), 'ref': 'AGL'}
+AGL_3000F = {'basealti': (3000, 'F'), 'ref': 'AGL'}
+AMSL_1500M = {'basealti': (1500, 'M'), 'ref': 'AMSL'}
+
+class CompileTest(unittest.TestCase):
+    def test_limits(self):
+        self.assertEqual(compileLimit(UNL), (numpy.inf, False))
+        self.assertEqual(compileLimit(SFC), (0, False))
+        self.assertEqual(compileLimit(FL65), (6500 * FOOT, False))
+        self.assertEqual(compileLimit(AGL_1000F), (1000 * FOOT, True))
+        self.assertEqual(compileLimit(AMSL_1500M), (1500, False))
+        self.assertEqual(compileLimit({'basealti': (1500, 'M')}), (1500, False))
+
+class AtTest(unittest.TestCase):
+    def setUp(self):
+        rand = numpy.random.RandomState(0)
+        self.lons = rand.uniform(5, 7, 200)
+        self.lats = rand.uniform(44, 46, 200)
+        self.ground = hills(self.lons, self.lats)
+
+    def test_amsl(self):
+        limits = VerticalLimits(meta(AMSL_1500M, FL65))
+        self.assertFalse(limits.agl)
+        floors, ceils = limits.at(None, self.lons, self.lats)
+        numpy.testing.assert_array_equal(floors, 1500)
+        numpy.testing.assert_array_equal(ceils, 6500 * FOOT)
+
+    def test_agl(self):
+        altir = HillsResolver()
+        limits = VerticalLimits(meta(AGL_1000F, FL65))
+        floors, ceils = limits.at(altir, self.lons, self.lats)
+        numpy.testing.assert_allclose(floors, self.ground + 1000 * FOOT)
+        numpy.testing.assert_array_equal(ceils, 6500 * FOOT)
+        self.assertEqual(altir.points, 200)
+
+    def test_terrain_without_alts(self):
+        # no altitudes to decide with, the ground is asked everywhere
+        altir = HillsResolver()
+        limits = VerticalLimits(meta(SFC, AGL_3000F, (500, 1500)))
+        floors, ceils = limits.at(altir, self.lons, self.lats)
+        numpy.testing.assert_allclose(ceils, self.ground + 3000 * FOOT)
+        self.assertEqual(altir.points, 200)
+
+class BoundingGroundTest(unittest.TestCase):
+    """
+    The terrain envelope must give the same decisions as the ground
+    asked at every point.
+    """
+    def track(self, count, seed, base=1500):
+        # a random walk, climbing and descending through the limits
+        rand = numpy.random.RandomState(seed)
+        lons = 6 + numpy.cumsum(rand.normal(0, 0.002, count))
+        lats = 45 + numpy.cumsum(rand.normal(0, 0.002, count))
+        alts = base + numpy.cumsum(rand.normal(0, 40, count))
+        return lons, lats, alts
+
+    def assertSameDecisions(self, floor, ceiling, base=1500):
+        for seed in range(10):
+            lons, lats, alts = self.track(500, seed, base)
+            exact = HillsResolver()
+            floors, ceils = VerticalLimits(meta(floor, ceiling)).at(exact, lons, lats, alts)
+            bounded = HillsResolver()
+            limits = VerticalLimits(meta(floor, ceiling, (500, 1500)))
+            bfloors, bceils = limits.at(bounded, lons, lats, alts)
+
+            numpy.testing.assert_array_equal(alts > bfloors, alts > floors)
+            numpy.testing.assert_array_equal(alts < bceils, alts < ceils)
+            self.assertTrue(bounded.points < exact.points)
+
+            # so are the interpolated crossings
+            points = numpy.column_stack((lons, lats, alts))
+            area = shapely.geometry.box(5.9, 44.9, 6.1, 45.1)
+            crossings = findCrossings(points, area, floors, ceils)[1]
+            bcrossings = findCrossings(points, area, bfloors, bceils)[1]
+            self.assertEqual([(c.kind, c.index) for c in bcrossings],
+                             [(c.kind, c.index) for c in crossings])
+            numpy.testing.assert_allclose([c.point for c in bcrossings],
+                                          [c.point for c in crossings])
+
+    def test_agl_floor(self):
+        self.assertSameDecisions(AGL_1000F, FL65)
+
+    def test_agl_ceiling(self):
+        self.assertSameDecisions(SFC, AGL_3000F)
+
+    def test_agl_both(self):
+        self.assertSameDecisions(AGL_1000F, AGL_3000F, 2400)
+
+    def test_decided(self):
+        # far above the zone: nothing to ask
+        altir = HillsResolver()
+        limits = VerticalLimits(meta(AGL_1000F, AGL_3000F, (500, 1500)))
+        lons, lats, alts = self.track(100, 0)
+        floors, ceils = limits.at(altir, lons, lats, alts + 5000)
+        self.assertEqual(altir.points, 0)
+        self.assertTrue((alts + 5000 >= ceils).all())
+
+class EnvelopeTest(unittest.TestCase):
+    def test_margin(self):
+        self.assertAlmostEqual(terrainMargin(1 / 120.), 655.96, 2)
+        self.assertAlmostEqual(terrainMargin(1 / 120., 0.5), terrainMargin(1 / 240.))
+
+    def test_level_range(self):
+        altir = RangeResolver()
+        envelope = terrainEnvelope(shapely.geometry.box(6, 45, 6.1, 45.1), altir)
+        self.assertEqual(envelope, (500, 1500))
+        self.assertEqual(altir.points, 0)
+
+    def test_sampled(self):
+        area = shapely.geometry.Point(6, 45).buffer(0.05)
+        altir = HillsResolver()
+        low, high = terrainEnvelope(area, altir, 1 / 600.)
+        levels = hills(*zip(*[(x, y) for x, y in area.exterior.coords]))
+        self.assertTrue(low < levels.min() and levels.max() < high)
+        self.assertTrue(low >= 500 - terrainMargin(1 / 600.))
+        # ~0.1 degree wide, every 1/600 degree
+        self.assertTrue(2000 < altir.points < 5000, altir.points)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import shutil
+import signal
+import tempfile
+import unittest
+import StringIO
+
+import numpy
+
+import airspace.error
+import airspace.ossimworker
+from airspace.altiresolver import OssimWorkerResolver
+
+from standins import hills, writeOssimWorker
+
+class ProtocolTest(unittest.TestCase):
+    def serve(self, requests):
+        fout = StringIO.StringIO()
+        airspace.ossimworker.serve(lambda lats, lons: [l + 1 for l in lats],
+                                   StringIO.StringIO(requests), fout)
+        return fout.getvalue().splitlines()
+
+    def test_requests(self):
+        self.assertEqual(self.serve("ping\nheights 1 2 3.5 4\n\nquit\nping\n"),
+                         ["pong", "ok 2.0 4.5"])
+
+    def test_errors(self):
+        answers = self.serve("heights 1 2 3\nheights a b\nwhat\nping\n")
+        self.assertEqual(len(answers), 4)
+        for answer in answers[:3]:
+            self.assertTrue(answer.startswith("error "), answer)
+        self.assertEqual(answers[3], "pong")
+
+class OssimWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.resolvers = []
+        rand = numpy.random.RandomState(0)
+        self.lons = rand.uniform(5, 7, 30)
+        self.lats = rand.uniform(44, 46, 30)
+
+    def tearDown(self):
+        for altir in self.resolvers:
+            altir.close()
+        shutil.rmtree(self.directory)
+
+    def resolver(self, workers=1, timeout=10, retries=2, **script):
+        command = os.path.join(self.directory, "worker-%d" % len(self.resolvers))
+        writeOssimWorker(command, **script)
+        altir = OssimWorkerResolver("fake.conf", workers, command=[command], batch=7,
+                                    timeout=timeout, retries=retries)
+        self.resolvers.append(altir)
+        return altir
+
+    def assertLevels(self, levels):
+        numpy.testing.assert_allclose(levels, hills(self.lons, self.lats))
+
+    def test_levels(self):
+        altir = self.resolver(workers=2)
+        self.assertLevels(altir.getGroundLevelsAt(self.lons, self.lats))
+        # batches of 7 points
+        self.assertEqual(altir.requests, 5)
+        self.assertEqual(altir.started, 2)
+        self.assertEqual(altir.restarted, 0)
+
+    def test_killed_worker(self):
+        altir = self.resolver(workers=2)
+        altir.check()
+        os.kill(altir._procs[0].pid, signal.SIGKILL)
+        altir._procs[0].wait()
+        self.assertLevels(altir.getGroundLevelsAt(self.lons, self.lats))
+        self.assertEqual(altir.restarted, 1)
+        self.assertEqual(altir.started, 3)
+
+    def test_crashing_worker(self):
+        # the worker exits on the last batch, which is sent again to
+        # the restarted one
+        altir = self.resolver(crash=5)
+        self.assertLevels(altir.getGroundLevelsAt(self.lons, self.lats))
+        self.assertEqual(altir.restarted, 1)
+
+    def test_timeout(self):
+        hang = os.path.join(self.directory, "hung")
+        altir = self.resolver(timeout=0.5, hang=hang)
+        start = time.time()
+        self.assertLevels(altir.getGroundLevelsAt(self.lons, self.lats))
+        self.assertTrue(os.path.exists(hang))
+        self.assertTrue(time.time() - start >= 0.5)
+        # the hung worker was killed, then restarted
+        self.assertEqual(altir.restarted, 1)
+        self.assertEqual(altir.started, 2)
+
+    def test_retries_used_up(self):
+        altir = self.resolver(crash=1, retries=2)
+        try:
+            altir.getGroundLevelsAt(self.lons[:5], self.lats[:5])
+        except airspace.error.ASCException, e:
+            self.assertTrue("3 time(s)" in str(e), str(e))
+        else:
+            self.fail("no error raised")
+        # the first worker, then one per retry
+        self.assertEqual(altir.started, 3)
+
+    def test_no_worker(self):
+        altir = OssimWorkerResolver("fake.conf",
+                                    command=[os.path.join(self.directory, "missing")])
+        self.assertRaises(airspace.error.ASCException,
+                          altir.getGroundLevelsAt, self.lons, self.lats)
+
+    def test_close(self):
+        altir = self.resolver(workers=2)
+        altir.check()
+        procs = list(altir._procs)
+        altir.close()
+        self.assertEqual(altir._procs, [None, None])
+        self.assertEqual([p.returncode for p in procs], [0, 0])
+
+if __name__ == "__main__":
+    unittest.main()
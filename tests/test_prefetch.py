@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import threading
+import unittest
+
+import numpy
+
+from airspace.altiresolver import AltiResolver, PrefetchingResolver
+
+from standins import hills
+
+class SlowResolver(AltiResolver):
+    """
+    Levels of standins.hills() after 'latency' seconds, recording
+    the calls and checking that they are not concurrent.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = []
+        self.busy = threading.Lock()
+
+    def getGroundLevelsAt(self, lons, lats):
+        if not self.busy.acquire(False):
+            raise AssertionError("concurrent calls")
+        try:
+            time.sleep(self.latency)
+            self.calls.append(len(lons))
+            return hills(lons, lats)
+        finally:
+            self.busy.release()
+
+class FailingResolver(SlowResolver):
+    """
+    SlowResolver failing on its first 'failures' calls.
+    """
+    def __init__(self, latency, failures):
+        SlowResolver.__init__(self, latency)
+        self.failures = failures
+
+    def getGroundLevelsAt(self, lons, lats):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("no answer")
+        return SlowResolver.getGroundLevelsAt(self, lons, lats)
+
+class PrefetchTest(unittest.TestCase):
+    def setUp(self):
+        rand = numpy.random.RandomState(0)
+        self.lons = rand.uniform(5, 7, 30)
+        self.lats = rand.uniform(44, 46, 30)
+        self.backend = SlowResolver(0.2)
+        self.altir = PrefetchingResolver(self.backend)
+
+    def test_waits_for_its_prefetch_only(self):
+        self.altir.prefetch(self.lons[:10], self.lats[:10])
+        self.altir.prefetch(self.lons[10:20], self.lats[10:20])
+        start = time.time()
+        levels = self.altir.getGroundLevelsAt(self.lons[:10], self.lats[:10])
+        # the second prefetch is still in progress
+        self.assertTrue(time.time() - start < 0.35)
+        numpy.testing.assert_allclose(levels, hills(self.lons[:10], self.lats[:10]))
+        levels = self.altir.getGroundLevelsAt(self.lons[5:20], self.lats[5:20])
+        numpy.testing.assert_allclose(levels, hills(self.lons[5:20], self.lats[5:20]))
+        self.assertEqual(self.backend.calls, [10, 10])
+        self.assertEqual((self.altir.hits, self.altir.misses), (25, 0))
+
+    def test_misses(self):
+        self.altir.prefetch(self.lons[:10], self.lats[:10])
+        self.altir.prefetch(self.lons[10:20], self.lats[10:20])
+        # asked once the prefetches are over
+        levels = self.altir.getGroundLevelsAt(self.lons[15:30], self.lats[15:30])
+        numpy.testing.assert_allclose(levels, hills(self.lons[15:30], self.lats[15:30]))
+        self.assertEqual(self.backend.calls, [10, 10, 10])
+        self.assertEqual((self.altir.hits, self.altir.misses), (5, 10))
+
+    def test_depth(self):
+        self.altir.prefetch(self.lons[:10], self.lats[:10])
+        self.altir.prefetch(self.lons[10:20], self.lats[10:20])
+        self.altir.prefetch(self.lons[20:30], self.lats[20:30])
+        self.assertEqual(len(self.altir.jobs), 2)
+        self.altir.getGroundLevelsAt(self.lons, self.lats)
+        # the first prefetch was forgotten
+        self.assertEqual(self.backend.calls, [10, 10, 10, 10])
+        self.assertEqual((self.altir.hits, self.altir.misses), (20, 10))
+
+    def test_duplicates(self):
+        lons = numpy.tile(self.lons[:10], 3)
+        lats = numpy.tile(self.lats[:10], 3)
+        self.altir.prefetch(lons, lats)
+        self.altir.flush()
+        self.assertEqual(self.backend.calls, [10])
+        self.assertEqual(self.altir.prefetched, 10)
+
+    def test_failed_prefetch(self):
+        self.altir = PrefetchingResolver(FailingResolver(0.2, 1))
+        self.altir.prefetch(self.lons[:10], self.lats[:10])
+        self.altir.prefetch(self.lons[10:20], self.lats[10:20])
+        # the points of the failed prefetch are asked again
+        levels = self.altir.getGroundLevelsAt(self.lons[:20], self.lats[:20])
+        numpy.testing.assert_allclose(levels, hills(self.lons[:20], self.lats[:20]))
+        self.assertEqual(self.altir.resolver.calls, [10, 10])
+        self.assertEqual((self.altir.failed, self.altir.hits, self.altir.misses),
+                         (1, 10, 10))
+
+    def test_failing_resolver(self):
+        self.altir = PrefetchingResolver(FailingResolver(0, 2))
+        self.altir.prefetch(self.lons[:10], self.lats[:10])
+        self.assertRaises(IOError, self.altir.getGroundLevelsAt,
+                          self.lons[:10], self.lats[:10])
+        # and it is usable again for the next tracks
+        self.altir.prefetch(self.lons[10:20], self.lats[10:20])
+        levels = self.altir.getGroundLevelsAt(self.lons[10:20], self.lats[10:20])
+        numpy.testing.assert_allclose(levels, hills(self.lons[10:20], self.lats[10:20]))
+        self.assertEqual(self.altir.hits, 10)
+
+if __name__ == "__main__":
+    unittest.main()
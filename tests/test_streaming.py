@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import rtree
+import shapely.geometry
+
+import airspace
+from airspace.streaming import StreamingChecker
+
+def squareZone(name, x, y, floor=0, ceiling=1000):
+    meta = {'name': name,
+            'floor': {'basealti': (floor, 'M'), 'ref': 'AMSL'},
+            'ceiling': {'basealti': (ceiling, 'M'), 'ref': 'AMSL'}}
+    return airspace.Zone(meta, shapely.geometry.box(x, y, x + 1, y + 1))
+
+class StreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.zones = {0: squareZone("A", 0, 0), 1: squareZone("B", 0, 1.5)}
+        index = rtree.index.Index()
+        for fid, zone in self.zones.items():
+            index.add(fid, zone.geometry.bounds)
+        self.checker = StreamingChecker(self.zones, index, None, neighbourhood=1)
+
+    def feed(self, *fix):
+        events = [(e.kind, e.zone.meta['name'], e.index, round(e.time, 6))
+                  for e in self.checker.feed(*fix)]
+        return sorted(events, key=lambda e: e[3])
+
+    def test_between_fixes(self):
+        # both zones are entered and left between the fixes
+        self.assertEqual(self.feed(-1, 0.5, 100, 0), [])
+        self.assertEqual(self.feed(2, 0.5, 100, 30),
+                         [('entry', 'A', 0, 10), ('exit', 'A', 0, 20)])
+        self.assertEqual(self.feed(2, 3, 100, 60), [])
+        self.assertEqual(self.feed(0.5, 3, 100, 75), [])
+        self.assertEqual(self.feed(0.5, -1, 100, 115),
+                         [('entry', 'B', 3, 80), ('exit', 'B', 3, 90),
+                          ('entry', 'A', 3, 95), ('exit', 'A', 3, 105)])
+        self.assertEqual(self.checker.insideZones(), [])
+
+    def test_inside(self):
+        self.assertEqual(self.feed(0.5, 0.5, 100, 0), [('entry', 'A', 0, 0)])
+        self.assertEqual(self.feed(0.6, 0.5, 100, 1), [])
+        self.assertEqual(self.checker.insideZones(), [self.zones[0]])
+        self.assertEqual(self.feed(1.5, 0.5, 100, 10), [('exit', 'A', 1, 5)])
+        self.assertEqual(self.checker.insideZones(), [])
+
+    def test_vertical(self):
+        self.assertEqual(self.feed(0.5, 0.5, 2000, 0), [])
+        # through the ceiling between both fixes
+        self.assertEqual(self.feed(0.6, 0.5, 800, 10), [('entry', 'A', 0, 8.333333)])
+        # climbing, then descending without moving
+        self.assertEqual(self.feed(0.6, 0.5, 2000, 20), [('exit', 'A', 1, 11.666667)])
+        self.assertEqual(self.feed(0.6, 0.5, 500, 30), [('entry', 'A', 2, 26.666667)])
+
+if __name__ == "__main__":
+    unittest.main()
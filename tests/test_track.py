@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from airspace.track import loadFromGpxToShapely, loadGpxSegments, parseGpxTime, \
+    parseGpxTimes
+
+# 2011-04-07T10:42:03Z
+STAMP = 1302172923
+
+class GpxTimeTest(unittest.TestCase):
+    def test_offsets(self):
+        self.assertEqual(parseGpxTime("2011-04-07T10:42:03Z"), STAMP)
+        self.assertEqual(parseGpxTime("2011-04-07T10:42:03"), STAMP)
+        self.assertEqual(parseGpxTime(" 2011-04-07T12:42:03+02:00\n"), STAMP)
+        self.assertEqual(parseGpxTime("2011-04-07T12:42:03+0200"), STAMP)
+        self.assertEqual(parseGpxTime("2011-04-07T08:12:03-02:30"), STAMP)
+        self.assertEqual(parseGpxTime("2011-04-07T12:42:03.25+02:00"), STAMP + .25)
+
+    def test_array(self):
+        utc = parseGpxTimes(["2011-04-07T10:42:03.5Z", None, "2011-04-07T10:42:04Z"])
+        numpy.testing.assert_array_equal(utc, [STAMP + .5, numpy.nan, STAMP + 1])
+        mixed = parseGpxTimes(["2011-04-07T12:42:03+02:00", "2011-04-07T10:42:04Z"])
+        numpy.testing.assert_array_equal(mixed, [STAMP, STAMP + 1])
+
+class SegmentsTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".gpx")
+        fout = os.fdopen(fd, "w")
+        fout.write('<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk>')
+        for count in (1, 2, 3):
+            fout.write('<trkseg>')
+            for i in range(count):
+                fout.write('<trkpt lon="6.%d" lat="45"><ele>1000</ele></trkpt>' % i)
+            fout.write('</trkseg>')
+        fout.write('</trk></gpx>')
+        fout.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_lines(self):
+        self.assertEqual([len(s) for s in loadGpxSegments(self.path)], [1, 2, 3])
+        # a segment of 2 points is a line
+        self.assertEqual([len(l.coords) for l in loadFromGpxToShapely(self.path)], [2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   airspace checker
+#   Copyright (C) 2011  Marc Poulhiès
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest
+
+import shapely.geometry
+
+from airspace.util import vertexCount
+
+class VertexCountTest(unittest.TestCase):
+    def test_polygons(self):
+        square = shapely.geometry.box(0, 0, 1, 1)
+        self.assertEqual(vertexCount(square), 5)
+        holed = shapely.geometry.Polygon(square.buffer(1, join_style=2).exterior,
+                                         [square.exterior])
+        self.assertEqual(vertexCount(holed), 10)
+        multi = shapely.geometry.MultiPolygon([holed, shapely.geometry.box(5, 5, 6, 6)])
+        self.assertEqual(vertexCount(multi), 15)
+
+if __name__ == "__main__":
+    unittest.main()